@@ -5,6 +5,8 @@ from datetime import datetime, timedelta, timezone
 import requests
 
 from config import get_db_client
+from services.subscription_docs import find_subscription_sync, subscription_ref
+from services.user_aliases import resolve_user_ref_sync
 from services.services.deleted.user_service import create_initial_user_record
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
@@ -42,51 +44,28 @@ def call_bssbin_new_subscription(telegram_id: str, end_date_utc: datetime) -> No
         logging.exception(f"❌ Ошибка вызова bssbin /new-subscription: {e}")
 
 
-def resolve_user_ref(users_ref, telegram_id: str):
+def resolve_user_ref(db, telegram_id: str):
     """
     Возвращает (user_ref, user_snap, resolved_doc_id) или (None, None, None)
-    1) Пытаемся найти документ по doc-id == telegram_id
-    2) Если не нашли — ищем по полям id == telegram_id или telegram_id == telegram_id
+    1) Документ по doc-id == telegram_id
+    2) Документ из индекса алиасов telegram_user_aliases (см. normalize_user_ids.py)
+    3) Пока миграция не прогнана — поиск по полям id / telegram_id
     """
-    # 1) doc-id == telegram_id
-    user_ref = users_ref.document(str(telegram_id))
-    user_snap = user_ref.get()
-    if user_snap.exists:
-        logging.info(f"✅ Пользователь найден по doc-id: {user_ref.id}")
-        return user_ref, user_snap, user_ref.id
-
-    logging.warning(f"⚠️ Не найден по doc-id: {telegram_id}. Пробую поиск по полям id/telegram_id...")
-
-    # 2) поиск по полю id
-    try:
-        q1 = list(users_ref.where("id", "==", str(telegram_id)).limit(1).stream())
-        if q1:
-            doc = q1[0]
-            logging.info(f"✅ Пользователь найден по полю id: doc-id={doc.id}")
-            return doc.reference, doc, doc.id
-    except Exception:
-        logging.exception("❌ Ошибка при поиске по полю id")
-
-    # 3) поиск по полю telegram_id
-    try:
-        q2 = list(users_ref.where("telegram_id", "==", str(telegram_id)).limit(1).stream())
-        if q2:
-            doc = q2[0]
-            logging.info(f"✅ Пользователь найден по полю telegram_id: doc-id={doc.id}")
-            return doc.reference, doc, doc.id
-    except Exception:
-        logging.exception("❌ Ошибка при поиске по полю telegram_id")
-
-    return None, None, None
+    user_ref, user_snap = resolve_user_ref_sync(db, telegram_id)
+    if not user_ref:
+        logging.warning(f"⚠️ Пользователь {telegram_id} не найден ни по doc-id, ни по алиасу")
+        return None, None, None
+    logging.info(f"✅ Пользователь найден: doc-id={user_ref.id}")
+    return user_ref, user_snap, user_ref.id
 
 
-def ensure_user_exists(users_ref, telegram_id: str):
+def ensure_user_exists(db, telegram_id: str):
     """
     Гарантирует существование пользователя.
     Если пользователя нет — создает через существующую процедуру.
     Возвращает (user_ref, user_snap, resolved_doc_id) или (None, None, None) при ошибке.
     """
-    user_ref, user_snap, resolved_doc_id = resolve_user_ref(users_ref, telegram_id)
+    user_ref, user_snap, resolved_doc_id = resolve_user_ref(db, telegram_id)
     if user_ref:
         return user_ref, user_snap, resolved_doc_id
 
@@ -99,7 +78,7 @@ def ensure_user_exists(users_ref, telegram_id: str):
 
     # После создания повторно разрешаем ссылку,
     # чтобы поддержать единый формат поиска (doc-id / поля).
-    user_ref, user_snap, resolved_doc_id = resolve_user_ref(users_ref, telegram_id)
+    user_ref, user_snap, resolved_doc_id = resolve_user_ref(db, telegram_id)
     if not user_ref:
         logging.error(f"❌ Пользователь {telegram_id} был создан, но не найден при повторной проверке.")
         return None, None, None
@@ -114,9 +93,7 @@ def main():
         logging.error("❌ Не удалось подключиться к Firestore (проверь GOOGLE_APPLICATION_CREDENTIALS).")
         return
 
-    users_ref = db.collection("telegram_users")
-
-    user_ref, user_snap, resolved_doc_id = ensure_user_exists(users_ref, TELEGRAM_ID)
+    user_ref, user_snap, resolved_doc_id = ensure_user_exists(db, TELEGRAM_ID)
     if not user_ref:
         logging.error(f"❌ Не удалось подготовить пользователя {TELEGRAM_ID} в telegram_users.")
         return
@@ -127,21 +104,8 @@ def main():
     logging.info(f"🕒 Текущее время (UTC+2): {now_plus2}")
     logging.info(f"🕒 Текущее время (UTC):   {now_utc}")
 
-    subs_col = user_ref.collection("subscriptions")
-
-    # Ищем подписку AIHermesPRO в подколлекции subscriptions
-    target_ref = None
-    target_data = None
-
-    subs_docs = list(subs_col.stream())
-    logging.info(f"📂 Найдено документов в subscriptions: {len(subs_docs)}")
-
-    for snap in subs_docs:
-        data = snap.to_dict() or {}
-        if data.get("subscription_type") == SUBSCRIPTION_TYPE:
-            target_ref = snap.reference
-            target_data = data
-            break
+    # Ищем подписку AIHermesPRO — point get по детерминированному id
+    target_ref, target_data = find_subscription_sync(user_ref, SUBSCRIPTION_TYPE)
 
     # База для продления:
     # - если end_date > now => от end_date
@@ -178,7 +142,7 @@ def main():
         target_ref.update({"end_date": new_end_utc})
     else:
         logging.info(f"🆕 Создаю подписку AIHermesPRO с end_date -> {new_end_utc} (UTC)  (+{ADD_DAYS} дней)")
-        subs_col.document().set({
+        subscription_ref(user_ref, SUBSCRIPTION_TYPE).set({
             "subscription_type": SUBSCRIPTION_TYPE,
             "end_date": new_end_utc,
             "tvEndData": False
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 import requests
 
 from config import get_db_client
+from services.subscription_docs import find_subscription_sync, subscription_ref
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
@@ -58,18 +59,8 @@ def main():
     logging.info(f"🕒 Текущее время (UTC+2): {now_plus2}")
     logging.info(f"🕒 Текущее время (UTC):   {now_utc}")
 
-    subs_col = user_ref.collection("subscriptions")
-
-    # Ищем подписку AIHermesPRO в подколлекции subscriptions
-    target_ref = None
-    target_data = None
-
-    for snap in subs_col.stream():
-        data = snap.to_dict() or {}
-        if data.get("subscription_type") == SUBSCRIPTION_TYPE:
-            target_ref = snap.reference
-            target_data = data
-            break
+    # Ищем подписку AIHermesPRO — point get по детерминированному id
+    target_ref, target_data = find_subscription_sync(user_ref, SUBSCRIPTION_TYPE)
 
     if target_ref:
         current_end = target_data.get("end_date")
@@ -98,7 +89,7 @@ def main():
     else:
         logging.info(f"🆕 Создаю подписку AIHermesPRO с end_date -> {new_end_utc} (UTC)")
         # При создании делаем формат как в системе (tvEndData задаём явно)
-        subs_col.document().set({
+        subscription_ref(user_ref, SUBSCRIPTION_TYPE).set({
             "subscription_type": SUBSCRIPTION_TYPE,
             "end_date": new_end_utc,
             "tvEndData": False
@@ -0,0 +1,27 @@
+# filename: backfill_bonus_claims.py
+# Одноразовое заполнение bonus_claims/{exchange}:{uid} по существующей subscriptionHistory.
+# Запускать до (или сразу после) деплоя, в котором link-флоу перешли на bonus_claims.
+#   python backfill_bonus_claims.py --dry-run
+#   python backfill_bonus_claims.py
+import argparse
+import logging
+
+from config import get_db_client
+from services.bonus_claims import backfill_bonus_claims
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def main(dry_run: bool) -> None:
+    db = get_db_client()
+    if not db:
+        logging.error("❌ Не удалось подключиться к Firestore (проверь GOOGLE_APPLICATION_CREDENTIALS).")
+        return
+    result = backfill_bonus_claims(db, dry_run=dry_run)
+    logging.info(f"📋 Итог: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заполнение bonus_claims по subscriptionHistory")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, без записи")
+    main(parser.parse_args().dry_run)
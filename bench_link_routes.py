@@ -0,0 +1,114 @@
+# filename: bench_link_routes.py
+# Нагрузочный бенчмарк роутов привязки UID против exchange_simulator.py.
+#   python exchange_simulator.py --referrals 20000
+#   (API запущен с *_BASE_URL=http://127.0.0.1:9000, см. exchange_simulator.py)
+#   python bench_link_routes.py --requests 500 --concurrency 50 --hit-ratio 0.8
+# Отчёт: p50/p95/p99 латентности, распределение ответов и число исходящих запросов к бирже.
+import time
+import random
+import asyncio
+import argparse
+import logging
+from collections import Counter
+
+import httpx
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+UID_BASE = {"bybit": 100_000_000, "blofin": 200_000_000, "bingx": 300_000_000}
+
+# exchange -> (роут, тело запроса)
+ROUTES = {
+    "bybit": ("/api/bybit/link-uid", lambda tg, uid: {"telegram_id": tg, "bybit_uid": uid}),
+    "blofin": ("/api/blofin/link-uid", lambda tg, uid: {"telegram_id": tg, "blofin_uid": uid}),
+    "bingx": ("/api/bingx/link-uid", lambda tg, uid: {"telegram_id": tg, "uid": uid}),
+}
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _pick_uid(exchange: str, list_size: int, hit_ratio: float) -> str:
+    if random.random() < hit_ratio:
+        return str(UID_BASE[exchange] + random.randrange(list_size))
+    # Заведомо отсутствующий в списке uid
+    return str(UID_BASE[exchange] + list_size + random.randrange(1, 10**6))
+
+
+async def bench_exchange(api: httpx.AsyncClient, sim: httpx.AsyncClient, exchange: str, args) -> dict:
+    stats = (await sim.get("/_sim/stats")).json()
+    calls_before = stats["calls"].get(exchange, 0)
+    list_size = stats["sizes"][exchange]
+    path, make_body = ROUTES[exchange]
+
+    latencies: list[float] = []
+    outcomes: Counter = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> None:
+        body = make_body(f"{args.telegram_id_prefix}{i % args.users}", _pick_uid(exchange, list_size, args.hit_ratio))
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await api.post(path, json=body)
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = {}
+                message = payload.get("message") or payload.get("detail") or payload.get("status")
+                outcomes[f"{response.status_code} {message}"] += 1
+            except httpx.HTTPError as e:
+                outcomes[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    stats = (await sim.get("/_sim/stats")).json()
+    return {
+        "exchange": exchange,
+        "requests": args.requests,
+        "rps": round(args.requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies, default=0.0), 1),
+        "outbound_calls": stats["calls"].get(exchange, 0) - calls_before,
+        "outcomes": dict(outcomes),
+    }
+
+
+async def main(args) -> None:
+    async with httpx.AsyncClient(base_url=args.api, timeout=args.timeout) as api, \
+            httpx.AsyncClient(base_url=args.sim, timeout=10) as sim:
+        if args.reset:
+            await sim.post("/_sim/reset")
+        for exchange in args.exchange or list(ROUTES):
+            report = await bench_exchange(api, sim, exchange, args)
+            logging.info(
+                f"📊 {exchange:6} | {report['requests']} запросов, {report['rps']} rps | "
+                f"p50 {report['p50_ms']} мс, p95 {report['p95_ms']} мс, p99 {report['p99_ms']} мс, "
+                f"max {report['max_ms']} мс | запросов к бирже: {report['outbound_calls']}"
+            )
+            logging.info(f"         ответы: {report['outcomes']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк /link-uid против симулятора бирж")
+    parser.add_argument("--api", default="http://127.0.0.1:8000", help="адрес BssMiniApp API")
+    parser.add_argument("--sim", default="http://127.0.0.1:9000", help="адрес exchange_simulator.py")
+    parser.add_argument("--exchange", action="append", choices=list(ROUTES), help="по умолчанию все биржи")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="доля uid, которые есть в списке биржи")
+    parser.add_argument("--users", type=int, default=50, help="сколько разных telegram_id использовать")
+    parser.add_argument("--telegram-id-prefix", default="bench_")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--reset", action="store_true", help="сбросить счётчики и списки симулятора перед прогоном")
+    asyncio.run(main(parser.parse_args()))
@@ -1,9 +1,6 @@
 # config.py
-import os
 import logging
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
 
 # Загружаем .env
 load_dotenv()
@@ -16,31 +13,15 @@ def setup_logger():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
 
-# 🔁 Глобальный клиент Firestore
-_db_client = None
-
 def get_db_client():
     """
-    Возвращает клиент Firestore. 
-    Инициализирует Firebase при первом вызове.
+    Синхронный клиент Firestore для скриптов.
+    Тот же клиент, что и в services/firebase_service.py (единая фабрика с настроенными каналами);
+    в отличие от него при ошибке не бросает исключение, а возвращает None.
     """
-    global _db_client
-    if _db_client is None:
-        logging.info("[CONFIG] Создаю или обновляю подключение к Firebase...")
-        try:
-            if not firebase_admin._apps:
-                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-                if not creds_path:
-                    logging.error("Переменная GOOGLE_APPLICATION_CREDENTIALS не установлена!")
-                    return None
-                
-                cred = credentials.Certificate(creds_path)
-                firebase_admin.initialize_app(cred)
-                logging.info("✅ [CONFIG] Приложение Firebase успешно инициализировано.")
-
-            _db_client = firestore.client()
-        except Exception as e:
-            logging.exception(f"❌ [CONFIG] Ошибка при инициализации Firebase: {e}")
-            return None
-            
-    return _db_client
+    from services.firebase_service import get_db_client as _factory_db_client
+    try:
+        return _factory_db_client()
+    except Exception as e:
+        logging.exception(f"❌ [CONFIG] Ошибка при инициализации Firebase: {e}")
+        return None
@@ -0,0 +1,181 @@
+# filename: exchange_simulator.py
+# Локальный симулятор партнёрских API Bybit, BloFin и BingX — для бенчмарков без реальных ключей.
+# Подписи не проверяются; API запускается с любыми непустыми ключами и адресами симулятора:
+#   python exchange_simulator.py --referrals 20000 --latency-ms 80 --error-rate 0.01 --rate-limit 10
+#   BYBIT_BASE_URL=http://127.0.0.1:9000 BLOFIN_BASE_URL=http://127.0.0.1:9000 \
+#   BINGX_BASE_URL=http://127.0.0.1:9000 uvicorn main:app --port 8000
+import os
+import time
+import random
+import asyncio
+import argparse
+import logging
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s - %(message)s")
+logger = logging.getLogger("ExchangeSimulator")
+
+# Диапазоны uid: по ним бенчмарк понимает, какие uid есть в списке биржи
+UID_BASE = {"bybit": 100_000_000, "blofin": 200_000_000, "bingx": 300_000_000}
+
+
+class SimConfig:
+    referrals = int(os.getenv("SIM_REFERRALS", "5000"))
+    latency_ms = float(os.getenv("SIM_LATENCY_MS", "50"))
+    jitter_ms = float(os.getenv("SIM_JITTER_MS", "20"))
+    error_rate = float(os.getenv("SIM_ERROR_RATE", "0"))
+    rate_limit = int(os.getenv("SIM_RATE_LIMIT", "0"))  # запросов в секунду на биржу, 0 — без лимита
+
+
+config = SimConfig()
+sizes: dict[str, int] = {}
+calls: Counter = Counter()
+throttled: Counter = Counter()
+errors: Counter = Counter()
+_windows: dict[str, tuple[int, int]] = {}  # exchange -> (секунда, запросов в ней)
+
+app = FastAPI(title="Exchange API simulator")
+
+
+def _reset_lists() -> None:
+    for exchange in UID_BASE:
+        sizes[exchange] = config.referrals
+
+
+def _referral(exchange: str, i: int) -> tuple[str, bool, int]:
+    """i-й реферал в порядке регистрации: (uid, kyc, registerTime в мс)."""
+    return str(UID_BASE[exchange] + i), i % 3 != 0, 1_700_000_000_000 + i * 60_000
+
+
+async def _simulate(exchange: str) -> str | None:
+    """Задержка, лимит и случайная ошибка. Возвращает 'throttled' / 'error' / None."""
+    calls[exchange] += 1
+    await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-1, 1) * config.jitter_ms) / 1000)
+    if config.rate_limit:
+        second = int(time.time())
+        window_second, count = _windows.get(exchange, (second, 0))
+        count = count + 1 if window_second == second else 1
+        _windows[exchange] = (second, count)
+        if count > config.rate_limit:
+            throttled[exchange] += 1
+            return "throttled"
+    if config.error_rate and random.random() < config.error_rate:
+        errors[exchange] += 1
+        return "error"
+    return None
+
+
+def _remaining(exchange: str) -> str:
+    _, count = _windows.get(exchange, (0, 0))
+    return str(max(0, config.rate_limit - count)) if config.rate_limit else "1000"
+
+
+@app.get("/v5/affiliate/aff-user-list")
+async def bybit_aff_user_list(size: int = Query(50), cursor: str = Query("")):
+    outcome = await _simulate("bybit")
+    headers = {"X-Bapi-Limit-Status": _remaining("bybit"), "X-Bapi-Limit": str(config.rate_limit or 1000),
+               "X-Bapi-Limit-Reset-Timestamp": str(int(time.time() + 1) * 1000)}
+    if outcome == "throttled":
+        return JSONResponse({"retCode": 10006, "retMsg": "Too many visits!"}, headers=headers)
+    if outcome == "error":
+        return JSONResponse({"retCode": 10016, "retMsg": "Internal system error."}, headers=headers)
+
+    # От новых к старым, курсор — смещение
+    total = sizes["bybit"]
+    offset = int(cursor or 0)
+    items = []
+    for position in range(offset, min(offset + min(size, 1000), total)):
+        uid, kyc, registered_ms = _referral("bybit", total - 1 - position)
+        items.append({"userId": uid, "registerTime": time.strftime("%Y-%m-%d", time.gmtime(registered_ms / 1000)),
+                      "isKyc": kyc})
+    next_cursor = str(offset + len(items)) if offset + len(items) < total else ""
+    return JSONResponse({"retCode": 0, "retMsg": "OK", "result": {"list": items, "nextPageCursor": next_cursor}},
+                        headers=headers)
+
+
+@app.get("/api/v1/affiliate/invitees")
+async def blofin_invitees(limit: int = Query(100), page: int = Query(1)):
+    outcome = await _simulate("blofin")
+    if outcome == "throttled":
+        return JSONResponse({"code": "429", "msg": "Too Many Requests"}, status_code=429, headers={"Retry-After": "1"})
+    if outcome == "error":
+        return JSONResponse({"code": "500", "msg": "Internal Server Error"}, status_code=500)
+
+    # От новых к старым, total не отдаётся
+    total = sizes["blofin"]
+    limit = min(limit, 100)
+    items = []
+    for position in range((page - 1) * limit, min(page * limit, total)):
+        uid, kyc, registered_ms = _referral("blofin", total - 1 - position)
+        items.append({"uid": uid, "kycLevel": 1 if kyc else 0, "registerTime": str(registered_ms)})
+    return {"code": "0", "msg": "success", "data": items}
+
+
+@app.get("/openApi/agent/v1/account/inviteAccountList")
+async def bingx_invite_account_list(pageIndex: int = Query(1), pageSize: int = Query(50)):
+    outcome = await _simulate("bingx")
+    headers = {"X-RateLimit-Requests-Remain": _remaining("bingx"), "X-RateLimit-Requests-Expire": "1"}
+    if outcome == "throttled":
+        return JSONResponse({"code": 100410, "msg": "rate limited"}, headers=headers)
+    if outcome == "error":
+        return JSONResponse({"code": 100500, "msg": "internal error"}, headers=headers)
+
+    # По возрастанию времени регистрации, с total
+    total = sizes["bingx"]
+    page_size = min(pageSize, 200)
+    items = []
+    for i in range((pageIndex - 1) * page_size, min(pageIndex * page_size, total)):
+        uid, kyc, registered_ms = _referral("bingx", i)
+        items.append({"uid": int(uid), "kycResult": kyc, "registerTime": registered_ms})
+    return JSONResponse({"code": 0, "msg": "", "data": {"list": items, "total": total}}, headers=headers)
+
+
+# 🔹 Служебные эндпоинты для бенчмарка
+@app.get("/_sim/stats")
+async def sim_stats():
+    return {"calls": dict(calls), "throttled": dict(throttled), "errors": dict(errors), "sizes": sizes}
+
+
+@app.post("/_sim/reset")
+async def sim_reset():
+    calls.clear()
+    throttled.clear()
+    errors.clear()
+    _windows.clear()
+    _reset_lists()
+    return {"status": "ok"}
+
+
+@app.post("/_sim/add-referrals")
+async def sim_add_referrals(exchange: str = Query(...), count: int = Query(1)):
+    """Новые рефералы появляются в списке — как после регистрации по ссылке."""
+    sizes[exchange] += count
+    return {"status": "ok", "size": sizes[exchange]}
+
+
+_reset_lists()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симулятор партнёрских API бирж")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--referrals", type=int, default=config.referrals, help="размер списка на каждой бирже")
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="доля ответов с ошибкой, 0..1")
+    parser.add_argument("--rate-limit", type=int, default=config.rate_limit, help="запросов/с на биржу, 0 — без лимита")
+    args = parser.parse_args()
+
+    config.referrals = args.referrals
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.rate_limit = args.rate_limit
+    _reset_lists()
+
+    logger.info(f"🚀 Симулятор бирж на http://127.0.0.1:{args.port} | рефералов на биржу: {config.referrals}")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
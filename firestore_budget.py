@@ -0,0 +1,125 @@
+# filename: firestore_budget.py
+# Бюджет обращений к Firestore по эндпоинтам — на in-memory Firestore, без кредов и сети.
+#   python firestore_budget.py                      # таблица RPC/чтений/записей на каждый сценарий
+#   python firestore_budget.py --latency-ms 20      # плюс время ответа при 20 мс на RPC
+#   python firestore_budget.py --strict             # код выхода 1, если сценарий вышел за бюджет
+# Приложение стартует штатными startup-хуками (каталог shop на listener, алиасы) с настройками
+# по умолчанию; каждый сценарий идёт от своего пользователя с холодным user_cache.
+# Реплика работает как reader: UID ищутся в общем сторе, к биржам и снимку на диске не ходим.
+# Бюджеты — для режима после миграций (migrate_subscriptions.py, normalize_user_ids.py).
+import os
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+os.environ["FIRESTORE_FAKE"] = "1"
+os.environ.setdefault("SUBSCRIPTION_LEGACY_LOOKUP", "0")
+os.environ.setdefault("USER_ALIAS_FALLBACK", "0")
+# local/writer на startup запустили бы синхронизацию с биржами и перезаписали снимок индексов
+os.environ["REFERRAL_STORE_MODE"] = "reader"
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services.firebase_service import fake_store
+from services.shared_referral_store import COLLECTION
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+BUDGET_LOG = logging.getLogger("firestore_budget")
+logging.getLogger().setLevel(logging.WARNING)
+BUDGET_LOG.setLevel(logging.INFO)
+
+SHOP_ID = "AIHermesPRO_30"
+LINKED_UID = {"bingx": "300000001", "blofin": "200000001", "bybit": "100000001"}
+
+# (название, метод, путь, тело, подготовка пользователя, бюджет {счётчик: максимум})
+SCENARIOS = [
+    ("shop listing", "GET", "/api/shop", None, None,
+     {"round_trips": 0, "reads": 0, "writes": 0, "listener_reads": 0}),
+    ("check-in", "POST", "/api/check-in", {"telegram_id": "u_checkin"}, {"balance_usdt": 1.0},
+     {"round_trips": 3, "reads": 1, "writes": 1, "listener_reads": 0}),
+    ("buy: new subscription", "POST", "/api/buy_subscription", {"telegram_id": "u_buy_new", "shop_id": SHOP_ID},
+     {"balance_usdt": 100.0},
+     {"round_trips": 5, "reads": 3, "writes": 3, "listener_reads": 0}),
+    ("buy: renewal", "POST", "/api/buy_subscription", {"telegram_id": "u_buy_renew", "shop_id": SHOP_ID},
+     {"balance_usdt": 100.0, "_subscription": "AIHermesPRO"},
+     {"round_trips": 5, "reads": 3, "writes": 3, "listener_reads": 0}),
+    ("buy: not enough funds", "POST", "/api/buy_subscription", {"telegram_id": "u_buy_poor", "shop_id": SHOP_ID},
+     {"balance_usdt": 1.0},
+     {"round_trips": 2, "reads": 2, "writes": 0, "listener_reads": 0}),
+    ("bingx link-uid + bonus", "POST", "/api/bingx/link-uid", {"telegram_id": "u_bingx", "uid": LINKED_UID["bingx"]},
+     {"balance_usdt": 0.0},
+     {"round_trips": 6, "reads": 5, "writes": 7, "listener_reads": 0}),
+    ("blofin link-uid + bonus", "POST", "/api/blofin/link-uid",
+     {"telegram_id": "u_blofin", "blofin_uid": LINKED_UID["blofin"]}, {"balance_usdt": 0.0},
+     {"round_trips": 6, "reads": 5, "writes": 7, "listener_reads": 0}),
+    ("bybit link-uid", "POST", "/api/bybit/link-uid",
+     {"telegram_id": "u_bybit", "bybit_uid": LINKED_UID["bybit"]}, {"balance_usdt": 0.0},
+     {"round_trips": 4, "reads": 3, "writes": 1, "listener_reads": 0}),
+]
+
+
+def seed(store) -> None:
+    now = datetime.now(timezone.utc)
+    documents = {
+        f"shop/{SHOP_ID}": {"name": "AIHermesPRO 30 дней", "price": 10.0, "duration": 30, "stock": "AIHermesPRO"},
+    }
+    for _, _, _, body, user, _ in SCENARIOS:
+        if not user:
+            continue
+        user = dict(user)
+        subscription = user.pop("_subscription", None)
+        documents[f"telegram_users/{body['telegram_id']}"] = user
+        if subscription:
+            documents[f"telegram_users/{body['telegram_id']}/subscriptions/{subscription}"] = {
+                "subscription_type": subscription,
+                "end_date": now + timedelta(days=3),
+            }
+    # Привязываемые UID уже опубликованы writer-ом в общий стор рефералов
+    for exchange, uid in LINKED_UID.items():
+        documents[f"{COLLECTION}/{exchange}:{uid}"] = {
+            "exchange": exchange, "uid": uid, "kyc": True, "registered_at": None,
+        }
+    store.seed(documents)
+
+
+def run(args) -> int:
+    store = fake_store()
+    store.latency_ms = args.latency_ms
+    # Данные — до старта: первый снимок listener каталога должен уже видеть товар
+    seed(store)
+
+    over_budget = 0
+    with TestClient(app) as client:
+        for name, method, path, body, _, budget in SCENARIOS:
+            started = time.perf_counter()
+            with store.measure() as ops:
+                response = client.request(method, path, json=body)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            exceeded = {key: ops[key] for key, limit in budget.items() if ops[key] > limit}
+            over_budget += bool(exceeded)
+            BUDGET_LOG.info(
+                f"{'❌' if exceeded else '✅'} {name:26} | HTTP {response.status_code} | "
+                f"RPC {ops['round_trips']:2} (get {ops['get']}, batch_get {ops['batch_get']}, "
+                f"query {ops['run_query']}, commit {ops['commit']}, tx {ops['begin_transaction']}) | "
+                f"чтений {ops['reads']:2}, записей {ops['writes']:2}, listener {ops['listener_reads']}"
+                + (f" | {elapsed_ms:.1f} мс" if args.latency_ms else "")
+            )
+            if exceeded:
+                BUDGET_LOG.info(f"   превышен бюджет: {exceeded} при лимите {budget}")
+            if args.verbose and response.status_code >= 400:
+                BUDGET_LOG.info(f"   ответ: {response.text[:300]}")
+
+    BUDGET_LOG.info(f"Сценариев: {len(SCENARIOS)}, за бюджетом: {over_budget}")
+    return 1 if args.strict and over_budget else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бюджет RPC/чтений/записей Firestore по эндпоинтам (in-memory Firestore)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка каждого RPC")
+    parser.add_argument("--strict", action="store_true", help="код выхода 1 при превышении бюджета")
+    parser.add_argument("--verbose", action="store_true", help="показывать тела ответов с ошибкой")
+    sys.exit(run(parser.parse_args()))
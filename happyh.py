@@ -6,6 +6,7 @@ import requests
 from dotenv import load_dotenv
 
 from config import get_db_client  # используем ваш отлаженный клиент
+from services.subscription_docs import find_subscription_sync, subscription_ref
 
 load_dotenv()
 
@@ -62,17 +63,6 @@ def _call_bssbin_new_subscription(telegram_id: str, end_date_utc: datetime) -> t
         logging.exception(f"❌ [BSSBIN] Ошибка вызова {url}: {e}")
         return False, str(e)
 
-def _find_aihermespro_subscription_doc(subs_collection) -> tuple[str | None, dict | None]:
-    """
-    Ищем документ в подколлекции subscriptions, где subscription_type == 'AIHermesPRO'
-    Возвращаем (doc_id, doc_dict) или (None, None).
-    """
-    for doc in subs_collection.stream():
-        data = doc.to_dict() or {}
-        if data.get("subscription_type") == "AIHermesPRO":
-            return doc.id, data
-    return None, None
-
 def process_user(user_ref, telegram_id: str) -> None:
     """
     Для active пользователя:
@@ -83,8 +73,9 @@ def process_user(user_ref, telegram_id: str) -> None:
     now_utc = _utc_now()
     now_plus2 = _utc_plus2_now()
 
-    subs_collection = user_ref.collection("subscriptions")
-    sub_doc_id, sub_data = _find_aihermespro_subscription_doc(subs_collection)
+    # Подписка AIHermesPRO — point get по детерминированному id (см. services/subscription_docs.py)
+    sub_ref, sub_data = find_subscription_sync(user_ref, "AIHermesPRO")
+    sub_doc_id = sub_ref.id if sub_ref else None
 
     old_end = None
     if sub_data:
@@ -118,12 +109,12 @@ def process_user(user_ref, telegram_id: str) -> None:
     try:
         if sub_doc_id:
             # Меняем ТОЛЬКО end_date, остальные поля (например tvEndData) не трогаем
-            subs_collection.document(sub_doc_id).update({"end_date": new_end_utc})
+            sub_ref.update({"end_date": new_end_utc})
             logging.info("   ✅ Firestore: end_date обновлён (update)")
         else:
             # Создаём новую подписку (минимальный корректный формат)
             # tvEndData можно ставить False как дефолт, чтобы формат был как у вас в примерах
-            subs_collection.document().set({
+            subscription_ref(user_ref, "AIHermesPRO").set({
                 "subscription_type": "AIHermesPRO",
                 "end_date": new_end_utc,
                 "tvEndData": False
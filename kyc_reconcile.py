@@ -0,0 +1,32 @@
+# filename: kyc_reconcile.py
+# Сверка bybit_kyc / blofin_kyc / bingx_kyc у всех пользователей с привязанным UID.
+#   python kyc_reconcile.py --dry-run
+#   python kyc_reconcile.py --exchange bybit --exchange bingx
+import asyncio
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.kyc_reconcile import EXCHANGES, reconcile_kyc
+from services.exchange_client import close_exchange_clients
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+async def main(exchanges: list[str] | None, dry_run: bool) -> None:
+    try:
+        result = await reconcile_kyc(exchanges, dry_run=dry_run)
+        logging.info(f"📋 Итог: {result}")
+    finally:
+        await close_exchange_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка KYC пользователей со списками рефералов бирж")
+    parser.add_argument("--exchange", action="append", choices=list(EXCHANGES), help="по умолчанию все биржи")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать изменения, без записи")
+    args = parser.parse_args()
+    asyncio.run(main(args.exchange, args.dry_run))
@@ -5,7 +5,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from services.firebase_service import get_db_client  # унифицированный доступ к Firestore
+from services.firebase_service import init_firestore  # единая фабрика клиентов Firestore
 
 # 🟢 Логи в STDOUT (чтобы Railway не красил их в error)
 logging.basicConfig(
@@ -25,9 +25,17 @@ from routers import (
     user_router,
     bingx_router,
     auth_router,
+    metrics_router,
+    referrals_router,
 )
 # 🔹 SD-роутер подключаем напрямую (не зависит от __all__ в routers/__init__.py)
 from routers.sd_router import router as sd_router
+from services.referral_sync import restore_referral_indexes, start_referral_sync, stop_referral_sync
+from services.exchange_client import close_exchange_clients
+from services import loop_monitor
+from services.user_cache import user_cache
+from services.shop_catalog import start_shop_catalog, stop_shop_catalog
+from services.user_aliases import load_user_aliases
 
 app = FastAPI(
     title="BssMiniApp API",
@@ -54,11 +62,35 @@ app.include_router(bybit_router.router, prefix="/api/bybit", tags=["Bybit"])
 app.include_router(user_router.router, prefix="/api", tags=["Users"])
 app.include_router(bingx_router.router, prefix="/api/bingx", tags=["BingX"])
 app.include_router(auth_router.router, prefix="/api", tags=["Auth"])
+app.include_router(metrics_router.router, prefix="/api", tags=["Metrics"])
+app.include_router(referrals_router.router, prefix="/api", tags=["Referrals"])
 # 🔹 Новый сервис-деск роутер — /api/sd/notify
 app.include_router(sd_router, prefix="/api", tags=["ServiceDesk"])
 logger.info("✅ Все роутеры подключены")
 
 
+@app.on_event("startup")
+async def on_startup():
+    """Прогрев Firestore, индексы рефералов из снимка на диске, фоновая синхронизация с биржами, каталог shop, алиасы Telegram ID."""
+    if loop_monitor.ENABLED:
+        loop_monitor.loop_monitor.register_routes(app)
+        loop_monitor.loop_monitor.start()
+    await init_firestore()
+    await restore_referral_indexes()
+    start_referral_sync()
+    await start_shop_catalog()
+    await load_user_aliases()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_referral_sync()
+    await close_exchange_clients()
+    user_cache.close()
+    await stop_shop_catalog()
+    await loop_monitor.loop_monitor.stop()
+
+
 @app.get("/", tags=["Root"])
 def read_root():
     """Корневой эндпоинт."""
@@ -0,0 +1,30 @@
+# filename: migrate_subscriptions.py
+# Перенос подписок на детерминированные id: telegram_users/{id}/subscriptions/{subscription_type}.
+# Дубли одного типа сливаются (побеждает самая поздняя end_date), auto-id документы удаляются.
+# Можно гонять при работающем приложении: записи идут с условием на update_time прочитанных
+# документов, подписка, продлённая во время переноса, перечитывается и переносится заново.
+# После прогона выставить SUBSCRIPTION_LEGACY_LOOKUP=0 — поиск подписки станет одним point get.
+#   python migrate_subscriptions.py --dry-run
+#   python migrate_subscriptions.py
+import argparse
+import logging
+
+from config import get_db_client
+from services.subscription_docs import migrate_subscriptions
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def main(dry_run: bool) -> None:
+    db = get_db_client()
+    if not db:
+        logging.error("❌ Не удалось подключиться к Firestore (проверь GOOGLE_APPLICATION_CREDENTIALS).")
+        return
+    result = migrate_subscriptions(db, dry_run=dry_run)
+    logging.info(f"📋 Итог: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос подписок на детерминированные id документов")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, без записи")
+    main(parser.parse_args().dry_run)
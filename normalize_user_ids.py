@@ -0,0 +1,28 @@
+# filename: normalize_user_ids.py
+# Индекс алиасов telegram_user_aliases/{telegram_id} для пользователей, чей документ лежит не под Telegram ID.
+# Документы пользователей не меняются. После прогона выставить USER_ALIAS_FALLBACK=0 —
+# поиск пользователя больше не делает запросов по полям.
+#   python normalize_user_ids.py --dry-run
+#   python normalize_user_ids.py
+import argparse
+import logging
+
+from config import get_db_client
+from services.user_aliases import normalize_user_ids
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def main(dry_run: bool) -> None:
+    db = get_db_client()
+    if not db:
+        logging.error("❌ Не удалось подключиться к Firestore (проверь GOOGLE_APPLICATION_CREDENTIALS).")
+        return
+    result = normalize_user_ids(db, dry_run=dry_run)
+    logging.info(f"📋 Итог: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Индекс алиасов Telegram ID по полям id/telegram_id")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, без записи")
+    main(parser.parse_args().dry_run)
@@ -0,0 +1,40 @@
+# filename: referral_store_worker.py
+# Единственный writer общего стора рефералов: синхронизирует индексы бирж
+# и публикует их в Firestore (exchange_referrals). Реплики API запускаются
+# с REFERRAL_STORE_MODE=reader и к биржам не ходят.
+#   python referral_store_worker.py
+import os
+import sys
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["REFERRAL_STORE_MODE"] = "writer"
+
+from services.referral_sync import restore_referral_indexes, start_referral_sync, stop_referral_sync
+from services.exchange_client import close_exchange_clients
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(asctime)s] %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+
+async def main() -> None:
+    await restore_referral_indexes()
+    start_referral_sync()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_referral_sync()
+        await close_exchange_clients()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("⏹ Воркер общего стора рефералов остановлен")
@@ -60,7 +60,7 @@ async def telegram_auth(data: InitDataRequest):
     telegram_id = user_info.get("id")
     print(f"🆔 Telegram ID: {telegram_id}")
 
-    exists, status_tgbss, user_path, _ = find_user_and_status(int(telegram_id))
+    exists, status_tgbss, user_path, _ = await find_user_and_status(int(telegram_id))
 
     if not exists:
         return {
@@ -2,7 +2,7 @@
 import logging
 from fastapi import APIRouter, Request
 from pydantic import BaseModel
-from services.bingx_service import link_bingx_uid  # ✅ только нужная функция
+from services.bingx_service import link_bingx_uid, find_uid_info, invite_mirror
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -19,18 +19,18 @@ class LinkUIDRequest(BaseModel):
     uid: str
 
 
-# 🔹 Проверка UID — является ли рефералом (заглушка, если нужно — добавим логику)
+# 🔹 Проверка UID — является ли рефералом (ответ из локального зеркала, synced_at — его свежесть)
 @router.post("/check-referral")
 async def check_referral_uid(request: Request, body: ReferralCheckRequest):
     uid = body.uid
     logger.info(f"[BINGX] ▶️ Запрос /check-referral | UID: {uid}")
     try:
-        from services.bingx_service import find_uid_info  # локальный импорт (если понадобится)
-        result = find_uid_info(uid)
+        result = await find_uid_info(uid)
         logger.info(f"[BINGX] ✅ Результат: {result}")
         return {
             "status": "success" if result.get("found") else "error",
-            "message": "FOUND" if result.get("found") else "NOT_FOUND"
+            "message": "FOUND" if result.get("found") else "NOT_FOUND",
+            "synced_at": result.get("synced_at"),
         }
     except Exception as e:
         logger.exception(f"[BINGX] ❌ Ошибка при проверке UID {uid}: {str(e)}")
@@ -45,7 +45,8 @@ async def link_uid_to_user(request: Request, body: LinkUIDRequest):
     logger.info(f"[BINGX] ▶️ Запрос /link-uid | Telegram ID: {telegram_id} | UID: {uid}")
 
     try:
-        result = link_bingx_uid(telegram_id, uid)
+        result = await link_bingx_uid(telegram_id, uid)
+        result.setdefault("synced_at", invite_mirror.synced_at_iso)
         logger.info(f"[BINGX] ✅ Результат привязки: {result}")
         return result
     except Exception as e:
@@ -19,7 +19,7 @@ async def link_blofin_uid_endpoint(payload: BlofinLinkRequest, request: Request)
     logging.info(f"[API][BLOFIN] ▶️ Запрос: POST /link-uid | telegram_id: {telegram_id}, blofin_uid: {blofin_uid}")
 
     try:
-        result = link_blofin_uid(telegram_id, blofin_uid)
+        result = await link_blofin_uid(telegram_id, blofin_uid)
 
         if result.get("status") == "success":
             logging.info(f"[API][BLOFIN] ✅ Привязка успешна: {result}")
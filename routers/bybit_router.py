@@ -15,7 +15,7 @@ class BybitLinkRequest(BaseModel):
 async def link_bybit_uid_endpoint(request: BybitLinkRequest):
     logging.info(f"[API] POST /link-uid | Body: {request.dict()}")
 
-    result = link_bybit_uid(telegram_id=request.telegram_id, bybit_uid=request.bybit_uid)
+    result = await link_bybit_uid(telegram_id=request.telegram_id, bybit_uid=request.bybit_uid)
 
     if result["status"] == "error":
         logging.warning(f"[API] Ошибка привязки: {result['message']}")
@@ -28,7 +28,7 @@ async def link_bybit_uid_endpoint(request: BybitLinkRequest):
 async def get_kyc_status_endpoint(user_uid: str):
     logging.info(f"[API] GET /kyc-status/{user_uid}")
     
-    result = get_referral_kyc_status(user_uid)
+    result = await get_referral_kyc_status(user_uid)
 
     if result.get("status") == "error":
         logging.warning(f"[API] Ошибка получения KYC: {result.get('message')}")
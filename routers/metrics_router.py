@@ -0,0 +1,68 @@
+# routers/metrics_router.py
+import os
+import hmac
+from dataclasses import asdict
+from fastapi import APIRouter, Header, HTTPException
+
+from services.rate_limiter import rate_limit_metrics
+from services.exchange_pager import last_scan_stats
+from services.negative_cache import negative_cache
+from services.loop_monitor import loop_monitor
+from services.user_cache import user_cache
+from services.shop_catalog import shop_catalog
+from services.firebase_service import init_stats as firestore_init_stats, fake_store
+
+router = APIRouter()
+
+# Стеки и пути к коду отдаются только с этим токеном в X-Admin-Token; без токена роута как бы нет
+DEBUG_ADMIN_TOKEN = os.getenv("DEBUG_ADMIN_TOKEN")
+
+
+@router.get("/metrics/exchanges")
+async def exchange_metrics():
+    """
+    Метрики исходящих запросов к биржам:
+    остаток квоты и очередь каждого rate limiter, последние обходы страниц,
+    отрицательный кэш поиска рефералов.
+    """
+    return {
+        "rate_limits": rate_limit_metrics(),
+        "page_scans": {name: asdict(stats) for name, stats in last_scan_stats.items()},
+        "negative_cache": {
+            "size": len(negative_cache),
+            "hits": negative_cache.hits,
+            "misses": negative_cache.misses,
+        },
+    }
+
+
+@router.get("/metrics/firestore")
+async def firestore_metrics():
+    """
+    Инициализация клиентов (время кредов, создания и прогрева каналов),
+    кэш документов telegram_users и каталога shop.
+    С FIRESTORE_FAKE=1 — ещё счётчики RPC и документов in-memory хранилища.
+    """
+    metrics = {
+        "client": firestore_init_stats,
+        "user_cache": user_cache.stats(),
+        "shop_catalog": shop_catalog.stats(),
+    }
+    store = fake_store()
+    if store is not None:
+        metrics["fake_ops"] = store.snapshot()
+    return metrics
+
+
+@router.get("/metrics/event-loop")
+async def event_loop_metrics():
+    """Лаг event loop и сколько раз каждый роут/сервис блокировал loop дольше порога."""
+    return loop_monitor.metrics()
+
+
+@router.get("/debug/event-loop/blocks")
+async def event_loop_blocks(x_admin_token: str | None = Header(None)):
+    """Последние зафиксированные блокировки loop со стеком — где именно держали loop. Требует X-Admin-Token."""
+    if not DEBUG_ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", DEBUG_ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {"blocks": loop_monitor.recent_blocks()}
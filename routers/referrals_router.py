@@ -0,0 +1,30 @@
+# routers/referrals_router.py
+import logging
+from typing import Literal
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from services.referral_batch import BATCH_MAX_ITEMS, check_referrals_batch
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class ReferralPair(BaseModel):
+    exchange: Literal["bybit", "blofin", "bingx"]
+    uid: str
+
+
+class BatchCheckRequest(BaseModel):
+    items: list[ReferralPair]
+
+
+# 🔹 Пакетная проверка UID на нескольких биржах — один проход по спискам на биржу
+@router.post("/referrals/batch-check")
+async def batch_check_referrals(body: BatchCheckRequest):
+    logger.info(f"[REFERRALS] ▶️ Запрос /referrals/batch-check | пар: {len(body.items)}")
+    if len(body.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"TOO_MANY_ITEMS (max {BATCH_MAX_ITEMS})")
+
+    results = await check_referrals_batch([(item.exchange, item.uid) for item in body.items])
+    return {"status": "success", "results": results}
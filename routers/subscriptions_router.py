@@ -1,9 +1,23 @@
 # Файл: routers/subscriptions_router.py
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Request, Response
 from services.subscription_service import purchase_subscription
+from services.shop_catalog import shop_catalog
 
 router = APIRouter()
 
+@router.get("/shop")
+async def list_shop(request: Request, response: Response):
+    """
+    Каталог товаров из памяти (коллекция shop).
+    Отдаёт ETag; при совпадении If-None-Match — 304 без тела.
+    """
+    etag, items = await shop_catalog.listing()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=30"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return {"items": items}
+
 @router.post("/buy_subscription")
 async def buy_subscription_endpoint(payload: dict = Body(...)):
     """
@@ -16,7 +30,7 @@ async def buy_subscription_endpoint(payload: dict = Body(...)):
     if not telegram_id or not shop_id:
         raise HTTPException(status_code=400, detail="Необходимо указать telegram_id и shop_id.")
 
-    result = purchase_subscription(telegram_id, shop_id)
+    result = await purchase_subscription(telegram_id, shop_id)
 
     if result.get("status") == "success":
         return result
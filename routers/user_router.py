@@ -1,7 +1,7 @@
 # routers/user_router.py
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from services.services.deleted.user_service import create_initial_user_record
+from services.services.deleted.user_service import create_initial_user_record_async
 
 router = APIRouter()
 
@@ -18,7 +18,7 @@ async def create_user_endpoint(request: UserCreateRequest):
     if not request.telegram_id:
         raise HTTPException(status_code=400, detail="Необходимо указать telegram_id.")
     
-    result = create_initial_user_record(telegram_id=request.telegram_id)
+    result = await create_initial_user_record_async(telegram_id=request.telegram_id)
     
     # Если сервис вернул ошибку, передаем ее клиенту
     if result["status"] == "error":
@@ -16,7 +16,7 @@ async def create_wallet_endpoint(payload: dict = Body(...)):
     
     logging.info(f"[ROUTER] Получен запрос на создание кошелька для user_id: {user_id}")
     
-    result = create_new_wallet_for_user(user_id)
+    result = await create_new_wallet_for_user(user_id)
     
     # --- ОБНОВЛЕННЫЙ БЛОК ОБРАБОТКИ ОТВЕТА ---
     if result:
@@ -2,18 +2,33 @@
 import os
 import time
 import hmac
+import asyncio
 import logging
-import requests
 from hashlib import sha256
+from typing import Optional
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from config import get_db_client
+from google.api_core.exceptions import AlreadyExists
+from services import firestore_dal
+from services.exchange_client import ExchangeClient
+from services.rate_limiter import rate_limiter_from_env
+from services.exchange_pager import PageScanStats, scan_pages
+from services.shared_referral_store import referral_lookup
+from services.bonus_claims import bonus_claim_owner, stage_bonus_claim
+from services.referral_index import ReferralIndex, parse_register_time
 
 load_dotenv()
 
 API_KEY = os.getenv("BINGX_API_KEY")
 SECRET_KEY = os.getenv("BINGX_SECRET_KEY")
-BASE_URL = "https://open-api.bingx.com"
+BASE_URL = os.getenv("BINGX_BASE_URL", "https://open-api.bingx.com")
+INVITE_LIST_PATH = "/openApi/agent/v1/account/inviteAccountList"
+INVITE_LIST_PAGE_SIZE = 50
+PAGER_CONCURRENCY = int(os.getenv("BINGX_PAGER_CONCURRENCY", "4"))
+
+# Локальное зеркало inviteAccountList: uid -> (kycResult, registerTime)
+invite_mirror = ReferralIndex("bingx")
+_sync_lock = asyncio.Lock()
 
 BONUS_IMAGE_URL = "https://firebasestorage.googleapis.com/v0/b/bss2025-b1285.firebasestorage.app/o/pictures%2Fallert%2FBingXAiHermesPro.png?alt=media&token=1b0fbd89-fc48-4c53-9303-2859d12d35d2"
 
@@ -23,168 +38,270 @@ def generate_signature(params_map: dict) -> tuple[str, str]:
     signature = hmac.new(SECRET_KEY.encode(), params_str.encode(), digestmod=sha256).hexdigest()
     return signature, params_str
 
-def get_referrals_page(page_index: int = 1, page_size: int = 50):
-    timestamp = str(int(time.time() * 1000))
-    params_map = {
-        "pageIndex": str(page_index),
-        "pageSize": str(page_size),
-        "timestamp": timestamp
-    }
+class BingxApiError(RuntimeError):
+    """BingX ответил code != 0 или невалидными данными."""
+
+
+def _sign_request(path: str, params: dict) -> tuple[str, dict]:
+    """Подпись BingX для ExchangeClient: timestamp + signature в query-строке."""
+    params_map = {**params, "timestamp": str(int(time.time() * 1000))}
     signature, params_str = generate_signature(params_map)
-    url = f"{BASE_URL}/openApi/agent/v1/account/inviteAccountList?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": API_KEY}
-    logging.info(f"[BINGX] 🔄 Отправка запроса на BingX API: {url}")
-    response = requests.get(url, headers=headers)
+    return f"{path}?{params_str}&signature={signature}", {"X-BX-APIKEY": API_KEY}
+
+
+http_client = ExchangeClient(
+    "bingx",
+    BASE_URL,
+    _sign_request,
+    timeout=float(os.getenv("BINGX_HTTP_TIMEOUT_SEC", "10")),
+    max_connections=int(os.getenv("BINGX_HTTP_MAX_CONNECTIONS", "10")),
+    rate_limiter=rate_limiter_from_env(
+        "bingx",
+        rate_per_sec=5,
+        burst=10,
+        weights={INVITE_LIST_PATH: 1},
+        rate_limit_codes=(100410,),  # 100410 — превышена частота запросов
+    ),
+)
+
+
+async def get_referrals_page(page_index: int = 1, page_size: int = INVITE_LIST_PAGE_SIZE):
+    logging.info(f"[BINGX] 🔄 Запрос страницы {page_index} inviteAccountList")
     try:
-        data = response.json()
-        logging.info(f"[BINGX] 📥 Ответ от BingX: {data}")
+        data = await http_client.get_json(
+            INVITE_LIST_PATH, {"pageIndex": str(page_index), "pageSize": str(page_size)}
+        )
+        logging.info(f"[BINGX] 📥 Ответ от BingX: code={data.get('code')}")
         return data
-    except Exception:
+    except ValueError:
         logging.exception("[BINGX] ❌ Ошибка при обработке JSON")
         return {"code": -1, "msg": "INVALID_JSON", "data": {}}
 
-def find_uid_info(uid: str) -> dict:
-    logging.info(f"[BINGX] 🔍 Поиск UID {uid} в списке рефералов")
-    page = 1
-    while True:
-        result = get_referrals_page(page_index=page)
-        if result.get("code") != 0:
-            logging.warning("[BINGX] ⚠️ Ошибка или пустой ответ от BingX API")
-            return {"found": False}
-        data = result.get("data", {})
-        referrals = data.get("list", [])
-        if not isinstance(referrals, list):
-            logging.warning("[BINGX] ❌ Неверный формат данных BingX")
-            return {"found": False}
-        for ref in referrals:
-            if isinstance(ref, dict) and str(ref.get("uid")) == str(uid):
-                logging.info(f"[BINGX] ✅ UID найден среди рефералов")
-                return {
-                    "found": True,
-                    "kyc": ref.get("kycResult", False)
-                }
-        if len(referrals) < 50:
-            break
-        page += 1
-    logging.info("[BINGX] ❌ UID не найден среди рефералов")
-    return {"found": False}
-
-def link_bingx_uid(telegram_id: str, uid: str) -> dict:
+
+def _to_index_row(ref: dict) -> tuple:
+    return (
+        str(ref.get("uid")),
+        bool(ref.get("kycResult", False)),
+        parse_register_time(ref.get("registerTime")),
+    )
+
+
+async def _fetch_page_for_pager(page: int) -> tuple[list, Optional[int]]:
+    result = await get_referrals_page(page_index=page)
+    if result.get("code") != 0:
+        raise BingxApiError(f"BingX API вернул ошибку: {result.get('code')} {result.get('msg')}")
+    data = result.get("data") or {}
+    referrals = data.get("list") or []
+    if not isinstance(referrals, list):
+        raise BingxApiError("Неверный формат данных BingX")
+    # Без total пейджер ищет конец списка по короткой странице; 0 вместо None оборвал бы обход на первой
+    total = data.get("total")
+    return [ref for ref in referrals if isinstance(ref, dict)], int(total) if total is not None else None
+
+
+async def sync_invite_mirror(full: bool = False, targets=None) -> int:
+    """
+    Обновляет локальное зеркало inviteAccountList. Возвращает количество новых uid.
+
+    Новые приглашённые появляются в конце списка, поэтому инкрементальный проход
+    читает только хвост: последнюю известную страницу (из неё же берём свежий total)
+    и страницы после неё. Если total не изменился — это ровно один запрос.
+    Страницы после первой запрашиваются параллельно; с targets обход
+    останавливается, как только все искомые uid появились в зеркале.
+    """
+    if not all([API_KEY, SECRET_KEY]):
+        logging.error("[BINGX] ❌ API ключи не настроены в .env")
+        return 0
+
+    added = 0
+
+    def on_page(page: int, referrals: list) -> None:
+        nonlocal added
+        added += invite_mirror.upsert_many(_to_index_row(ref) for ref in referrals)
+
+    async def scan(start_page: int) -> PageScanStats:
+        return await scan_pages(
+            "bingx",
+            _fetch_page_for_pager,
+            on_page=on_page,
+            concurrency=PAGER_CONCURRENCY,
+            start_page=start_page,
+            page_size=INVITE_LIST_PAGE_SIZE,
+            stop_when=(lambda: all(t in invite_mirror for t in targets)) if targets else None,
+        )
+
+    async with _sync_lock:
+        full = full or not invite_mirror.is_warm
+        state = invite_mirror.sync_state
+        known_total = state.get("known_total", 0)
+
+        # Прерванный досрочно холодный обход продолжаем с места остановки
+        stats = await scan(state.pop("resume_page", 0) + 1 if full else state.get("last_page", 1))
+        if not full and stats.total is not None and stats.total < known_total:
+            # Список сократился — позиции сдвинулись, хвосту больше нельзя доверять
+            logging.warning(f"[BINGX] ⚠️ total уменьшился ({known_total} -> {stats.total}), делаю полный проход")
+            full = True
+            stats = await scan(1)
+
+        if stats.stopped_early and full:
+            state["resume_page"] = stats.last_contiguous_page
+        elif not stats.stopped_early:
+            state["known_total"] = stats.total or len(invite_mirror)
+            state["last_page"] = max(1, stats.last_contiguous_page)
+            invite_mirror.mark_synced(full)
+        logging.info(
+            f"[BINGX] Зеркало приглашённых обновлено ({'полный' if full else 'хвост'}): "
+            f"страниц {stats.pages_fetched}, новых {added}, total {state.get('known_total')}"
+        )
+        return added
+
+
+_lookup_flight = referral_lookup("bingx", invite_mirror, sync_invite_mirror)
+
+
+async def lookup_referrals_many(uids) -> dict:
+    """Пакетная проверка: uid -> ReferralRecord | None, один общий проход по списку на все промахи."""
+    return await _lookup_flight.lookup_many(uids)
+
+
+async def find_uid_info(uid: str) -> dict:
+    """
+    Ответ из зеркала: {"found", "kyc", "synced_at"}.
+    При промахе дочитываем только хвост списка; полный проход — пока зеркало холодное.
+    Одновременные промахи разделяют один проход (single-flight).
+    """
+    logging.info(f"[BINGX] 🔍 Поиск UID {uid} в зеркале рефералов")
+    try:
+        record = await _lookup_flight.lookup(uid)
+    except Exception:
+        logging.exception("[BINGX] ❌ Ошибка обновления зеркала рефералов")
+        record = invite_mirror.get(uid)
+
+    if record is None:
+        logging.info("[BINGX] ❌ UID не найден среди рефералов")
+        return {"found": False, "synced_at": invite_mirror.synced_at_iso}
+
+    logging.info(f"[BINGX] ✅ UID найден среди рефералов")
+    return {"found": True, "kyc": record.kyc, "synced_at": invite_mirror.synced_at_iso}
+
+async def link_bingx_uid(telegram_id: str, uid: str) -> dict:
     logging.info(f"[BINGX] ▶️ Запрос /link-uid | Telegram ID: {telegram_id} | UID: {uid}")
-    db = get_db_client()
-    if not db:
-        logging.error("[BINGX] ❌ Ошибка подключения к Firebase")
-        return {"status": "error", "message": "DATABASE_ERROR"}
-    
-    ref_info = find_uid_info(uid)
+
+    ref_info = await find_uid_info(uid)
     if not ref_info["found"]:
         logging.warning("[BINGX] ❌ UID не найден в списке рефералов")
         return {"status": "error", "message": "ERROR_NOT_FOUND"}
-    
-    users_ref = db.collection("telegram_users")
-    user_ref = users_ref.document(telegram_id)
-    user_doc = user_ref.get()
-    
-    if not user_doc.exists:
+
+    # Флаг bingx4days решает, начислять ли бонус, — читаем мимо кэша
+    user_data = await firestore_dal.get_user(telegram_id, fields=("bingx4days",), cached=False)
+    if user_data is None:
         logging.error("[BINGX] ❌ Пользователь не найден в Firestore")
         return {"status": "error", "message": "USER_NOT_FOUND"}
 
     logging.info(f"[BINGX] 🔄 Проверка использования UID другими пользователями")
-    conflicting = users_ref.where("bingx_uid", "==", uid).stream()
-    for doc in conflicting:
-        if doc.id != telegram_id:
-            logging.warning(f"[BINGX] ⚠️ UID {uid} уже привязан к другому пользователю: {doc.id}")
+    # limit=2: если первым вернётся свой же документ, второй владелец UID всё равно будет виден
+    for other_id, _ in await firestore_dal.find_users_by_field("bingx_uid", uid, limit=2, fields=()):
+        if other_id != telegram_id:
+            logging.warning(f"[BINGX] ⚠️ UID {uid} уже привязан к другому пользователю: {other_id}")
             return {"status": "error", "message": "ERROR_TAKEN"}
 
+    # Все записи ниже копятся в одном batch и уходят одним commit
+    client = firestore_dal.db()
+    batch = firestore_dal.batch(client)
+
     # Привязка UID
     update_data = {"bingx_uid": uid}
     if ref_info.get("kyc", False):
         update_data["bingx_kyc"] = "KYC"
-    user_ref.set(update_data, merge=True)
-    logging.info(f"[BINGX] ✅ UID {uid} привязан к пользователю {telegram_id}, KYC: {update_data.get('bingx_kyc')}")
+    batch.set(firestore_dal.user_ref(telegram_id, client), update_data, merge=True)
 
     now = datetime.now(timezone.utc)
 
     # Проверка флага bingx4days
-    user_data = user_doc.to_dict()
     if user_data.get("bingx4days", False):
         logging.info("[BINGX] ⚠️ Бонус уже начислен ранее")
-        _write_alerts_and_messages(user_ref, telegram_id,
+        _write_alerts_and_messages(batch, client, telegram_id,
+            "🎉 UID BingX успешно привязан. 🎁 Бонус 4 дня уже был начислен ранее.")
+        await firestore_dal.commit_user_batch(batch, telegram_id)
+        logging.info(f"[BINGX] ✅ UID {uid} привязан к пользователю {telegram_id}, KYC: {update_data.get('bingx_kyc')}")
+        return {"status": "success", "telegram_id": telegram_id, "uid": uid}
+
+    # Проверка истории использования UID (одно чтение bonus_claims) и поиск подписки — параллельно
+    claim_owner, target_sub = await asyncio.gather(
+        bonus_claim_owner("bingx", uid),
+        firestore_dal.find_subscription(telegram_id, "AIHermesPRO"),
+    )
+    if claim_owner == str(telegram_id):
+        # Бонус за этот UID уже получал сам пользователь (флаг bingx4days потерян) — повторно не начисляем
+        logging.info("[BINGX] ⚠️ Бонус за UID уже был начислен этому пользователю")
+        batch.update(firestore_dal.user_ref(telegram_id, client), {"bingx4days": True})
+        _write_alerts_and_messages(batch, client, telegram_id,
             "🎉 UID BingX успешно привязан. 🎁 Бонус 4 дня уже был начислен ранее.")
+        await firestore_dal.commit_user_batch(batch, telegram_id)
         return {"status": "success", "telegram_id": telegram_id, "uid": uid}
+    if claim_owner is not None:
+        return await _reject_used_uid(batch, client, telegram_id, uid)
 
-    # Проверка истории использования UID
-    logging.info("[BINGX] 🔍 Проверка истории использования UID в subscriptionHistory")
-    for other_user in users_ref.stream():
-        if other_user.id == telegram_id:
-            continue
-        history_ref = other_user.reference.collection("subscriptionHistory")
-        used = list(history_ref
-            .where("shopID", "==", "4bingxAihermesPro")
-            .where("bingxuid", "==", uid)
-            .limit(1).stream())
-        if used:
-            logging.warning(f"[BINGX] UID {uid} уже использовался ранее")
-            _write_alerts_and_messages(user_ref, telegram_id,
-                "⚠️ UID BingX использован ранее. 🎁 Бонус в 4 дня не предоставляется.")
-            return {"status": "success", "telegram_id": telegram_id, "uid": uid}
+    # История + claim: create() провалит весь batch, если UID параллельно занял другой запрос
+    logging.info("[BINGX] 🧾 Добавление записи в subscriptionHistory")
+    stage_bonus_claim(batch, client, "bingx", uid, telegram_id, {
+        "name": "4 дня BingX AIHermesPro",
+        "price": 0,
+        "purchaseDate": now,
+        "shopID": "4bingxAihermesPro",
+        "bingxuid": uid
+    })
 
     # Начисление бонуса
     logging.info("[BINGX] 🎁 Начисление бонуса в 4 дня подписки")
-    subs_ref = user_ref.collection("subscriptions")
-    target_sub = None
-    for sub in subs_ref.stream():
-        if sub.to_dict().get("subscription_type") == "AIHermesPRO":
-            target_sub = sub
-            break
-
     end_date = now + timedelta(days=4)
     if target_sub:
-        old_end = target_sub.to_dict().get("end_date")
+        sub_ref, sub_data = target_sub
+        old_end = sub_data.get("end_date")
         logging.info(f"[BINGX] 📅 Текущая дата окончания: {old_end}")
         if isinstance(old_end, datetime) and old_end > now:
             end_date = old_end + timedelta(days=4)
-        subs_ref.document(target_sub.id).update({"end_date": end_date})
-        logging.info(f"[BINGX] 🔄 Подписка продлена до {end_date}")
+        batch.update(sub_ref, {"end_date": end_date})
     else:
-        subs_ref.document().set({
+        batch.set(firestore_dal.subscription_ref(telegram_id, "AIHermesPRO", client), {
             "subscription_type": "AIHermesPRO",
             "end_date": end_date,
             "tvEndData": False
         })
-        logging.info(f"[BINGX] 🆕 Создана новая подписка до {end_date}")
-
-    # История
-    logging.info("[BINGX] 🧾 Добавление записи в subscriptionHistory")
-    user_ref.collection("subscriptionHistory").add({
-        "name": "4 дня BingX AIHermesPro",
-        "price": 0,
-        "purchaseDate": now,
-        "shopID": "4bingxAihermesPro",
-        "bingxuid": uid
-    })
 
     # Уведомления
-    _write_alerts_and_messages(user_ref, telegram_id,
+    _write_alerts_and_messages(batch, client, telegram_id,
         "🎉 Спасибо за регистрацию на бирже BingX! 🎁 Вам начислены 4 дня подписки на AIHermesPro!")
 
     # Флаг бонуса
-    user_ref.update({"bingx4days": True})
-    logging.info(f"[BINGX] ✅ Установлен флаг bingx4days=true для {telegram_id}")
+    batch.update(firestore_dal.user_ref(telegram_id, client), {"bingx4days": True})
+
+    try:
+        await firestore_dal.commit_user_batch(batch, telegram_id)
+    except AlreadyExists:
+        logging.warning(f"[BONUS_CLAIMS] ⚠️ bingx:{uid} уже получил бонус (параллельная привязка)")
+        return await _reject_used_uid(firestore_dal.batch(client), client, telegram_id, uid, update_data)
 
+    logging.info(f"[BINGX] ✅ UID {uid} привязан к пользователю {telegram_id}, KYC: {update_data.get('bingx_kyc')}")
+    logging.info(f"[BINGX] 🔄 Подписка {'продлена' if target_sub else 'создана'} до {end_date}, bingx4days=true")
     return {"status": "success", "telegram_id": telegram_id, "uid": uid}
 
-def _write_alerts_and_messages(user_ref, telegram_id, message_text: str):
+async def _reject_used_uid(batch, client, telegram_id: str, uid: str, update_data: dict | None = None) -> dict:
+    """Привязка без бонуса. update_data — заново положить UID, если прежний batch не прошёл."""
+    logging.warning(f"[BINGX] UID {uid} уже использовался ранее")
+    if update_data:
+        batch.set(firestore_dal.user_ref(telegram_id, client), update_data, merge=True)
+    _write_alerts_and_messages(batch, client, telegram_id,
+        "⚠️ UID BingX использован ранее. 🎁 Бонус в 4 дня не предоставляется.")
+    await firestore_dal.commit_user_batch(batch, telegram_id)
+    return {"status": "success", "telegram_id": telegram_id, "uid": uid}
+
+def _write_alerts_and_messages(batch, client, telegram_id, message_text: str):
+    """Кладёт alert и задание для сендера в batch — они уйдут вместе с остальными записями."""
     now = datetime.now(timezone.utc)
     logging.info(f"[BINGX] 🔔 Отправка уведомления: {message_text}")
-    user_ref.collection("alerts").add({
-        "message": message_text,
-        "read": False,
-        "timestamp": now,
-        "type": 1
-    })
-    db = get_db_client()
-    db.collection("messages").add({
+    firestore_dal.stage_alert(batch, client, telegram_id, message_text)
+    firestore_dal.stage_message(batch, client, {
         "bot_name": "bssbot",
         "created_at": now,
         "memo": {"text": message_text},
@@ -192,4 +309,3 @@ def _write_alerts_and_messages(user_ref, telegram_id, message_text: str):
         "status": "pending",
         "telegram_id": telegram_id
     })
-    logging.info(f"[BINGX] 💬 Сообщение создано в messages")
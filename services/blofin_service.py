@@ -7,17 +7,21 @@ import base64
 import json
 import time
 import uuid
-import requests
+import asyncio
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from services.firebase_service import get_db_client
+from google.api_core.exceptions import AlreadyExists
+from services import firestore_dal
+from services.exchange_client import ExchangeClient
+from services.rate_limiter import rate_limiter_from_env
+from services.exchange_pager import PageScanStats, scan_pages
+from services.shared_referral_store import referral_lookup
+from services.bonus_claims import bonus_claim_owner, stage_bonus_claim
+from services.referral_index import ReferralIndex, ReferralRecord, parse_register_time
 
 # Загрузка .env переменных
 load_dotenv()
 
-# Инициализация Firestore через единый сервис
-db = get_db_client()
-
 # Ключи из .env
 API_KEY = os.getenv("BLOFIN_API_KEY")
 API_SECRET = os.getenv("BLOFIN_API_SECRET")
@@ -28,6 +32,17 @@ BONUS_IMAGE_URL = "https://firebasestorage.googleapis.com/v0/b/bss2025-b1285.fir
 if not all([API_KEY, API_SECRET, API_PASSPHRASE]):
     logging.error("❌ Не заданы переменные окружения для BloFin API")
 
+INVITEES_PATH = "/api/v1/affiliate/invitees"
+# Запрашиваем максимальный размер страницы; если API урежет limit,
+# фактический размер определится по первой полной странице
+INVITEES_PAGE_LIMIT = int(os.getenv("BLOFIN_INVITEES_LIMIT", "100"))
+
+PAGER_CONCURRENCY = int(os.getenv("BLOFIN_PAGER_CONCURRENCY", "4"))
+
+# Хранилище приглашённых: uid -> (kycLevel > 0, registerTime)
+invitee_index = ReferralIndex("blofin")
+_sync_lock = asyncio.Lock()
+
 
 def create_signature(path: str, method: str, timestamp: str, nonce: str, body: dict | None = None) -> str:
     body_str = json.dumps(body, separators=(',', ':')) if body else ''
@@ -36,153 +51,279 @@ def create_signature(path: str, method: str, timestamp: str, nonce: str, body: d
     return base64.b64encode(hex_digest.encode()).decode()
 
 
-def find_uid_info(target_uid: str, limit: int = 30, max_pages: int = 50) -> dict | None:
-    base_path = "/api/v1/affiliate/invitees"
+class BlofinApiError(RuntimeError):
+    """BloFin ответил кодом, отличным от 0/200."""
+
+
+def _sign_request(path: str, params: dict) -> tuple[str, dict]:
+    """Подпись BloFin для ExchangeClient: подписывается путь вместе с query-строкой."""
     method = "GET"
-    for page in range(1, max_pages + 1):
-        timestamp = str(int(time.time() * 1000))
-        nonce = str(uuid.uuid4())
-        query = f"?limit={limit}&page={page}"
-        full_path = f"{base_path}{query}"
-        signature = create_signature(full_path, method, timestamp, nonce)
-        headers = {
-            "ACCESS-KEY": API_KEY,
-            "ACCESS-SIGN": signature,
-            "ACCESS-TIMESTAMP": timestamp,
-            "ACCESS-NONCE": nonce,
-            "ACCESS-PASSPHRASE": API_PASSPHRASE,
-            "Content-Type": "application/json"
-        }
-        url = f"https://openapi.blofin.com{full_path}"
-        try:
-            response = requests.get(url, headers=headers, timeout=5)
-            data = response.json()
-        except Exception:
-            logging.exception("[BLOFIN] ❌ Ошибка запроса")
-            break
-        if data.get("code") not in ("0", "200"):
-            break
-        for invitee in data.get("data", []):
-            if str(invitee.get("uid")) == str(target_uid):
-                return invitee
-        if len(data.get("data", [])) < limit:
+    timestamp = str(int(time.time() * 1000))
+    nonce = str(uuid.uuid4())
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    full_path = f"{path}?{query}" if query else path
+    signature = create_signature(full_path, method, timestamp, nonce)
+    headers = {
+        "ACCESS-KEY": API_KEY,
+        "ACCESS-SIGN": signature,
+        "ACCESS-TIMESTAMP": timestamp,
+        "ACCESS-NONCE": nonce,
+        "ACCESS-PASSPHRASE": API_PASSPHRASE,
+        "Content-Type": "application/json"
+    }
+    return full_path, headers
+
+
+http_client = ExchangeClient(
+    "blofin",
+    os.getenv("BLOFIN_BASE_URL", "https://openapi.blofin.com"),
+    _sign_request,
+    timeout=float(os.getenv("BLOFIN_HTTP_TIMEOUT_SEC", "5")),
+    max_connections=int(os.getenv("BLOFIN_HTTP_MAX_CONNECTIONS", "10")),
+    rate_limiter=rate_limiter_from_env(
+        "blofin",
+        rate_per_sec=5,
+        burst=10,
+        weights={INVITEES_PATH: 1},
+    ),
+)
+
+
+async def _fetch_invitees_page(page: int, limit: int = INVITEES_PAGE_LIMIT) -> list[dict]:
+    """Одна подписанная страница /api/v1/affiliate/invitees."""
+    data = await http_client.get_json(INVITEES_PATH, {"limit": limit, "page": page})
+    if str(data.get("code")) not in ("0", "200"):
+        raise BlofinApiError(f"BloFin API вернул ошибку: {data.get('code')} {data.get('msg')}")
+    return data.get("data") or []
+
+
+def _to_index_row(invitee: dict) -> tuple:
+    return (
+        str(invitee.get("uid")),
+        int(invitee.get("kycLevel", 0) or 0) > 0,
+        parse_register_time(invitee.get("registerTime")),
+    )
+
+
+async def _fetch_page_for_pager(page: int) -> tuple[list, None]:
+    # /affiliate/invitees не отдаёт total — пейджер определит конец по короткой странице
+    return await _fetch_invitees_page(page), None
+
+
+async def _crawl_invitees(targets=None) -> int:
+    """
+    Полный параллельный обход списка. Номер последней полностью обработанной
+    страницы хранится в invitee_index.sync_state, поэтому прерванный обход
+    (ошибка, лимиты, досрочная остановка) продолжается с неё, а не с начала.
+    """
+    state = invitee_index.sync_state
+    stats = PageScanStats()
+    added = 0
+    first_uids: set[str] = set()
+
+    def on_page(page: int, invitees: list) -> None:
+        nonlocal added
+        if invitees:
+            first_uid = str(invitees[0].get("uid"))
+            if first_uid in first_uids:
+                raise BlofinApiError(f"Страница {page} повторяет уже полученную — API игнорирует page")
+            first_uids.add(first_uid)
+        added += invitee_index.upsert_many(_to_index_row(i) for i in invitees)
+
+    try:
+        await scan_pages(
+            "blofin",
+            _fetch_page_for_pager,
+            on_page=on_page,
+            concurrency=PAGER_CONCURRENCY,
+            start_page=state.get("last_full_page", 0) + 1,
+            page_size=state.get("page_size"),
+            stop_when=(lambda: all(t in invitee_index for t in targets)) if targets else None,
+            stats=stats,
+        )
+    finally:
+        # Фактический размер страницы: API может урезать limit до своего максимума
+        if stats.page_size:
+            state["page_size"] = max(state.get("page_size", 0), stats.page_size)
+        state["last_full_page"] = stats.last_contiguous_page
+
+    if not stats.stopped_early:
+        state["last_full_page"] = 0  # обход завершён, следующий начнём с первой страницы
+        invitee_index.mark_synced(full=True)
+    return added
+
+
+async def _refresh_newest_pages() -> int:
+    """Дочитывает самые новые страницы, пока не встретим уже известных приглашённых."""
+    page_size = invitee_index.sync_state.get("page_size", INVITEES_PAGE_LIMIT)
+    page = 1
+    added = 0
+    while True:
+        invitees = await _fetch_invitees_page(page)
+        reached_known = any(str(i.get("uid")) in invitee_index for i in invitees)
+        added += invitee_index.upsert_many(_to_index_row(i) for i in invitees)
+        if not invitees or len(invitees) < page_size or reached_known:
             break
-    return None
+        page += 1
+    invitee_index.mark_synced(full=False)
+    return added
+
+
+async def sync_invitees(full: bool = False, targets=None) -> int:
+    """
+    Обновляет хранилище приглашённых. Возвращает количество новых uid.
+
+    full=True (или холодное хранилище) — полный параллельный обход;
+    с targets обход останавливается, как только все искомые uid найдены.
+    full=False — только самые новые страницы.
+    """
+    if not all([API_KEY, API_SECRET, API_PASSPHRASE]):
+        logging.error("❌ Не заданы переменные окружения для BloFin API")
+        return 0
+
+    async with _sync_lock:
+        full = full or not invitee_index.is_warm
+        added = await (_crawl_invitees(targets) if full else _refresh_newest_pages())
+        logging.info(
+            f"[BLOFIN] Хранилище приглашённых обновлено ({'полный' if full else 'свежие страницы'}): "
+            f"новых {added}, всего {len(invitee_index)}"
+        )
+        return added
+
+
+async def find_uid_info(target_uid: str) -> ReferralRecord | None:
+    """
+    O(1) поиск приглашённого. При промахе дочитываем только новые страницы;
+    пока хранилище холодное — параллельный обход до появления uid.
+    Одновременные промахи разделяют один проход (single-flight).
+    """
+    try:
+        return await _lookup_flight.lookup(target_uid)
+    except Exception:
+        logging.exception("[BLOFIN] ❌ Ошибка запроса")
+        return None
+
+
+_lookup_flight = referral_lookup("blofin", invitee_index, sync_invitees)
+
+
+async def lookup_referrals_many(uids) -> dict:
+    """Пакетная проверка: uid -> ReferralRecord | None, один общий проход по списку на все промахи."""
+    return await _lookup_flight.lookup_many(uids)
 
 
-def link_blofin_uid(telegram_id: str, blofin_uid: str) -> dict:
+async def link_blofin_uid(telegram_id: str, blofin_uid: str) -> dict:
     logging.info(f"[BLOFIN] Привязка UID {blofin_uid} к Telegram ID {telegram_id}")
-    uid_info = find_uid_info(blofin_uid)
+    uid_info = await find_uid_info(blofin_uid)
     if not uid_info:
         return {"status": "error", "message": "ERROR_NOT_FOUND"}
 
     try:
         now = datetime.now(timezone.utc)
-        users_ref = db.collection("telegram_users")
-        user_ref = users_ref.document(telegram_id)
-        user_doc = user_ref.get()
+        # Флаг blofin4days решает, начислять ли бонус, — читаем мимо кэша
+        user_data = await firestore_dal.get_user(telegram_id, fields=("blofin4days",), cached=False)
 
-        if not user_doc.exists:
+        if user_data is None:
             logging.error("[BLOFIN] ❌ Пользователь не найден")
             return {"status": "error", "message": "ERROR_UNKNOWN"}
 
+        # Все записи ниже копятся в одном batch и уходят одним commit
+        client = firestore_dal.db()
+        batch = firestore_dal.batch(client)
+
         # Проверка, не занят ли UID другим пользователем
-        query = users_ref.where("blofin_uid", "==", str(blofin_uid)).limit(1).stream()
-        for doc in query:
-            if doc.id != telegram_id:
-                logging.warning(f"[BLOFIN] UID {blofin_uid} уже использован другим пользователем: {doc.id}")
-                user_ref.update({"blofin_uid": str(blofin_uid)})
+        # limit=2: если первым вернётся свой же документ, второй владелец UID всё равно будет виден
+        for other_id, _ in await firestore_dal.find_users_by_field("blofin_uid", str(blofin_uid), limit=2, fields=()):
+            if other_id != telegram_id:
+                logging.warning(f"[BLOFIN] UID {blofin_uid} уже использован другим пользователем: {other_id}")
+                batch.update(firestore_dal.user_ref(telegram_id, client), {"blofin_uid": str(blofin_uid)})
                 _write_alerts_and_messages(
-                    user_ref,
+                    batch,
+                    client,
                     telegram_id,
                     "⚠️ UID BloFin использован ранее. 🎁 Бонус в 4 дня не предоставляется."
                 )
+                await firestore_dal.commit_user_batch(batch, telegram_id)
                 return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
 
         # Обновляем UID и KYC
         update_data = {"blofin_uid": str(blofin_uid)}
-        if int(uid_info.get("kycLevel", 0)) > 0:
+        if uid_info.kyc:
             update_data["blofin_kyc"] = "KYC"
-        user_ref.update(update_data)
+        batch.update(firestore_dal.user_ref(telegram_id, client), update_data)
 
         # Проверка blofin4days
-        if user_doc.to_dict().get("blofin4days", False):
+        if user_data.get("blofin4days", False):
             logging.info("[BLOFIN] ⚠️ Бонус уже был начислен ранее")
             _write_alerts_and_messages(
-                user_ref,
+                batch,
+                client,
                 telegram_id,
                 "🎉 Новый UID BloFin успешно привязан. 🎁 Бонус в 4 дня уже был начислен ранее — повторное начисление не предусмотрено"
             )
+            await firestore_dal.commit_user_batch(batch, telegram_id)
             return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
 
-        # Проверка, был ли UID использован ранее
-        users_all = users_ref.stream()
-        for other_user in users_all:
-            if other_user.id == telegram_id:
-                continue
-            history_ref = other_user.reference.collection("subscriptionHistory")
-            bonus_found = list(
-                history_ref
-                .where("shopID", "==", "4blofinAihermesPro")
-                .where("blofinuid", "==", str(blofin_uid)).limit(1).stream()
-            )
-            if bonus_found:
-                logging.warning(f"[BLOFIN] UID {blofin_uid} использован ранее другим")
-                user_ref.update({"blofin_uid": str(blofin_uid)})
-                _write_alerts_and_messages(
-                    user_ref,
-                    telegram_id,
-                    "⚠️ UID BloFin использован ранее. 🎁 Бонус в 4 дня не предоставляется."
-                )
-                return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
+        # Был ли UID использован ранее (одно чтение bonus_claims) и поиск подписки — параллельно
+        claim_owner, target_sub = await asyncio.gather(
+            bonus_claim_owner("blofin", blofin_uid),
+            firestore_dal.find_subscription(telegram_id, "AIHermesPRO"),
+        )
+        if claim_owner == str(telegram_id):
+            # Бонус за этот UID уже получал сам пользователь (флаг blofin4days потерян) — повторно не начисляем
+            logging.info("[BLOFIN] ⚠️ Бонус за UID уже был начислен этому пользователю")
+            batch.update(firestore_dal.user_ref(telegram_id, client), {"blofin4days": True})
+            _write_alerts_and_messages(batch, client, telegram_id,
+                "🎉 Новый UID BloFin успешно привязан. 🎁 Бонус в 4 дня уже был начислен ранее — повторное начисление не предусмотрено")
+            await firestore_dal.commit_user_batch(batch, telegram_id)
+            return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
+        if claim_owner is not None:
+            return await _reject_used_uid(batch, client, telegram_id, blofin_uid)
 
-        # Продление подписки
-        subs_ref = user_ref.collection("subscriptions")
-        target_sub = None
-        for doc in subs_ref.stream():
-            data = doc.to_dict()
-            if data.get("subscription_type") == "AIHermesPRO":
-                target_sub = doc
-                break
+        # История + claim: create() провалит весь batch, если UID параллельно занял другой запрос
+        stage_bonus_claim(batch, client, "blofin", str(blofin_uid), telegram_id, {
+            "name": "4 дня Blofin AIHermesPro",
+            "price": 0,
+            "purchaseDate": now,
+            "shopID": "4blofinAihermesPro",
+            "blofinuid": str(blofin_uid)
+        })
 
+        # Продление подписки
         end_date = now + timedelta(days=4)
         if target_sub:
-            sub_data = target_sub.to_dict()
+            sub_ref, sub_data = target_sub
             old_end = sub_data.get("end_date")
             if isinstance(old_end, datetime) and old_end > now:
                 end_date = old_end + timedelta(days=4)
-            subs_ref.document(target_sub.id).update({
+            batch.update(sub_ref, {
                 "end_date": end_date
             })
-            logging.info(f"[BLOFIN] 🕒 Подписка продлена до {end_date}")
         else:
-            subs_ref.document().set({
+            batch.set(firestore_dal.subscription_ref(telegram_id, "AIHermesPRO", client), {
                 "subscription_type": "AIHermesPRO",
                 "end_date": end_date,
                 "tvEndData": False
             })
-            logging.info(f"[BLOFIN] 🆕 Создана новая подписка до {end_date}")
-
-        # История
-        user_ref.collection("subscriptionHistory").add({
-            "name": "4 дня Blofin AIHermesPro",
-            "price": 0,
-            "purchaseDate": now,
-            "shopID": "4blofinAihermesPro",
-            "blofinuid": str(blofin_uid)
-        })
-        logging.info("[BLOFIN] 🧾 Запись в subscriptionHistory")
 
         # Alerts + Messages
         _write_alerts_and_messages(
-            user_ref,
+            batch,
+            client,
             telegram_id,
             "🎉 Спасибо за регистрацию на бирже BloFin! 🎁 Вам начислены 4 дня подписки на AIHermesPro!"
         )
 
         # Обновление флага
-        user_ref.update({"blofin4days": True})
+        batch.update(firestore_dal.user_ref(telegram_id, client), {"blofin4days": True})
+
+        try:
+            await firestore_dal.commit_user_batch(batch, telegram_id)
+        except AlreadyExists:
+            logging.warning(f"[BONUS_CLAIMS] ⚠️ blofin:{blofin_uid} уже получил бонус (параллельная привязка)")
+            return await _reject_used_uid(firestore_dal.batch(client), client, telegram_id, blofin_uid, update_data)
 
+        logging.info(f"[BLOFIN] 🧾 Запись в subscriptionHistory, подписка {'продлена' if target_sub else 'создана'} до {end_date}")
         return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
 
     except Exception:
@@ -190,17 +331,28 @@ def link_blofin_uid(telegram_id: str, blofin_uid: str) -> dict:
         return {"status": "error", "message": "Firestore error"}
 
 
-def _write_alerts_and_messages(user_ref, telegram_id: str, message_text: str):
+async def _reject_used_uid(batch, client, telegram_id: str, blofin_uid: str, update_data: dict | None = None) -> dict:
+    """Привязка без бонуса. update_data — заново положить UID, если прежний batch не прошёл."""
+    logging.warning(f"[BLOFIN] UID {blofin_uid} использован ранее другим")
+    if update_data:
+        batch.update(firestore_dal.user_ref(telegram_id, client), update_data)
+    _write_alerts_and_messages(
+        batch,
+        client,
+        telegram_id,
+        "⚠️ UID BloFin использован ранее. 🎁 Бонус в 4 дня не предоставляется."
+    )
+    await firestore_dal.commit_user_batch(batch, telegram_id)
+    return {"status": "success", "telegram_id": telegram_id, "uid": blofin_uid}
+
+
+def _write_alerts_and_messages(batch, client, telegram_id: str, message_text: str):
+    """Кладёт alert и задание для сендера в batch — они уйдут вместе с остальными записями."""
     now = datetime.now(timezone.utc)
-    user_ref.collection("alerts").add({
-        "message": message_text,
-        "read": False,
-        "timestamp": now,
-        "type": 1
-    })
+    firestore_dal.stage_alert(batch, client, telegram_id, message_text)
     logging.info(f"[BLOFIN] 🔔 Добавлено уведомление: {message_text}")
 
-    db.collection("messages").add({
+    firestore_dal.stage_message(batch, client, {
         "bot_name": "bssbot",
         "created_at": now,
         "memo": {"text": message_text},
@@ -208,4 +360,3 @@ def _write_alerts_and_messages(user_ref, telegram_id: str, message_text: str):
         "status": "pending",
         "telegram_id": telegram_id
     })
-    logging.info("[BLOFIN] 💬 Создано сообщение для Telegram")
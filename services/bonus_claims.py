@@ -0,0 +1,102 @@
+# filename: services/bonus_claims.py
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from services import firestore_dal
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "bonus_claims"
+
+# exchange -> (shopID записи в subscriptionHistory, поле с UID биржи)
+BONUS_HISTORY = {
+    "blofin": ("4blofinAihermesPro", "blofinuid"),
+    "bingx": ("4bingxAihermesPro", "bingxuid"),
+}
+
+# Лимит Firestore на количество операций в одном batch
+BATCH_SIZE = 500
+
+
+def claim_ref(db, exchange: str, uid: str):
+    return db.collection(COLLECTION).document(f"{exchange}:{uid}")
+
+
+async def bonus_claim_owner(exchange: str, uid: str) -> Optional[str]:
+    """
+    Telegram ID пользователя, получившего бонус за этот UID, или None — одно чтение
+    документа вместо обхода всех пользователей. Сервис сам отличает собственный
+    прежний claim пользователя от чужого.
+    """
+    snap = await claim_ref(firestore_dal.db(), exchange, uid).get(field_paths=["telegram_id"])
+    if not snap.exists:
+        return None
+    return str((snap.to_dict() or {}).get("telegram_id") or "")
+
+
+def stage_bonus_claim(batch, client, exchange: str, uid: str, telegram_id: str, history_entry: dict) -> None:
+    """
+    Кладёт в batch запись subscriptionHistory и bonus_claims/{exchange}:{uid}.
+    create() не перезаписывает существующий claim, поэтому из двух одновременных
+    привязок одного UID commit пройдёт только у одной — вторая получит AlreadyExists.
+    client — клиент, от которого создан batch.
+    """
+    batch.create(claim_ref(client, exchange, uid), {
+        "exchange": exchange,
+        "uid": str(uid),
+        "telegram_id": str(telegram_id),
+        "claimed_at": history_entry.get("purchaseDate") or datetime.now(timezone.utc),
+    })
+    batch.set(firestore_dal.new_history_ref(telegram_id, client), history_entry)
+
+
+def backfill_bonus_claims(db, dry_run: bool = False) -> dict:
+    """
+    Заполняет bonus_claims по уже существующей subscriptionHistory всех пользователей.
+    Один проход collection group; при нескольких записях на один UID
+    владельцем считается самая ранняя. Существующие claim-ы не перезаписываются.
+    """
+    shop_ids = {shop_id: (exchange, uid_field) for exchange, (shop_id, uid_field) in BONUS_HISTORY.items()}
+    uid_fields = [uid_field for _, uid_field in BONUS_HISTORY.values()]
+    claims: dict[tuple[str, str], tuple] = {}
+    scanned = 0
+
+    query = db.collection_group("subscriptionHistory").select(["shopID", "purchaseDate", *uid_fields])
+    for snap in query.stream():
+        scanned += 1
+        data = snap.to_dict() or {}
+        if data.get("shopID") not in shop_ids:
+            continue
+        exchange, uid_field = shop_ids[data["shopID"]]
+        uid = data.get(uid_field)
+        if not uid:
+            continue
+        telegram_id = snap.reference.parent.parent.id
+        claimed_at = data.get("purchaseDate")
+        key = (exchange, str(uid))
+        current = claims.get(key)
+        if current is None or (claimed_at and current[1] and claimed_at < current[1]):
+            claims[key] = (telegram_id, claimed_at)
+
+    existing = {snap.id for snap in db.collection(COLLECTION).select([]).stream()}
+    missing = [(key, value) for key, value in claims.items() if f"{key[0]}:{key[1]}" not in existing]
+
+    if not dry_run:
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = db.batch()
+            for (exchange, uid), (telegram_id, claimed_at) in missing[start:start + BATCH_SIZE]:
+                batch.set(claim_ref(db, exchange, uid), {
+                    "exchange": exchange,
+                    "uid": uid,
+                    "telegram_id": telegram_id,
+                    "claimed_at": claimed_at,
+                    "backfilled": True,
+                })
+            batch.commit()
+
+    logger.info(
+        f"[BONUS_CLAIMS] {'(dry-run) ' if dry_run else ''}Просмотрено записей истории: {scanned}, "
+        f"бонусных UID: {len(claims)}, создано claim-ов: {len(missing)}"
+    )
+    return {"history_scanned": scanned, "claimed_uids": len(claims), "created": len(missing), "dry_run": dry_run}
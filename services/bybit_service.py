@@ -3,18 +3,26 @@ import os
 import time
 import hmac
 import hashlib
+import asyncio
 import logging
-import requests
-import json
 from dotenv import load_dotenv
-from config import get_db_client
+from services import firestore_dal
+from services.exchange_client import ExchangeClient
+from services.rate_limiter import rate_limiter_from_env
+from services.shared_referral_store import is_reader, referral_lookup
+from services.referral_index import ReferralIndex, parse_register_time
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
 API_KEY = os.getenv("BYBIT_API_KEY")
 SECRET_KEY = os.getenv("BYBIT_SECRET_KEY")
-BASE_URL = "https://api.bybit.com"
+# BYBIT_BASE_URL — например, локальный exchange_simulator.py для бенчмарков
+BASE_URL = os.getenv("BYBIT_BASE_URL", "https://api.bybit.com")
+
+
+class BybitApiError(RuntimeError):
+    """Bybit ответил retCode != 0."""
 
 
 def _get_bybit_signature(timestamp: str, api_key: str, recv_window: str, secret_key: str, params: str = "") -> str:
@@ -22,84 +30,172 @@ def _get_bybit_signature(timestamp: str, api_key: str, recv_window: str, secret_
     return hmac.new(bytes(secret_key, "utf-8"), bytes(message, "utf-8"), hashlib.sha256).hexdigest()
 
 
-def _is_user_direct_referral(uid: str) -> bool:
+AFF_LIST_PATH = "/v5/affiliate/aff-user-list"
+AFF_LIST_PAGE_SIZE = 50         # инкрементальный sync: новые рефералы обычно на первой странице
+AFF_LIST_FULL_PAGE_SIZE = 1000  # полный проход: максимум size по документации Bybit v5
+
+# Индекс прямых рефералов: userId -> (isKyc, registerTime)
+referral_index = ReferralIndex("bybit")
+_sync_lock = asyncio.Lock()
+
+
+def _sign_request(path: str, params: dict) -> tuple[str, dict]:
+    """Подпись Bybit v5 для ExchangeClient: query-строка + заголовки X-BAPI-*."""
+    timestamp = str(int(time.time() * 1000))
+    recv_window = "10000"
+
+    params_str = "&".join([f"{k}={v}" for k, v in sorted(params.items())])
+    signature = _get_bybit_signature(timestamp, API_KEY, recv_window, SECRET_KEY, params_str)
+
+    headers = {
+        'X-BAPI-API-KEY': API_KEY,
+        'X-BAPI-SIGN': signature,
+        'X-BAPI-TIMESTAMP': timestamp,
+        'X-BAPI-RECV-WINDOW': recv_window,
+        'Content-Type': 'application/json'
+    }
+    return f"{path}?{params_str}", headers
+
+
+http_client = ExchangeClient(
+    "bybit",
+    BASE_URL,
+    _sign_request,
+    timeout=float(os.getenv("BYBIT_HTTP_TIMEOUT_SEC", "10")),
+    max_connections=int(os.getenv("BYBIT_HTTP_MAX_CONNECTIONS", "10")),
+    rate_limiter=rate_limiter_from_env(
+        "bybit",
+        rate_per_sec=5,
+        burst=10,
+        weights={AFF_LIST_PATH: 1},
+        rate_limit_codes=(10006, 10018),  # 10006 — лимит по ключу, 10018 — лимит по IP
+    ),
+)
+
+
+async def _fetch_aff_user_page(cursor: str, size: int) -> dict:
+    """Одна подписанная страница /v5/affiliate/aff-user-list. Возвращает result."""
+    logging.info(f"[BYBIT] Запрос страницы с курсором: '{cursor}'")
+    data = await http_client.get_json(AFF_LIST_PATH, {"size": size, "cursor": cursor})
+
+    if data.get("retCode") != 0:
+        raise BybitApiError(f"Bybit API вернул ошибку: {data.get('retMsg')}")
+    return data.get("result", {})
+
+
+def _to_index_row(referral: dict) -> tuple:
+    return (
+        str(referral.get("userId")),
+        bool(referral.get("isKyc", False)),
+        parse_register_time(referral.get("registerTime")),
+    )
+
+
+async def sync_referral_index(full: bool = False) -> int:
+    """
+    Обновляет индекс рефералов. Возвращает количество новых uid.
+
+    Bybit отдаёт список от новых к старым, поэтому инкрементальный проход
+    идёт по курсору только до первой страницы с уже известными userId.
+    Полный проход (холодный индекс или периодическая пересверка KYC) читает весь список.
+    """
     if not all([API_KEY, SECRET_KEY]):
         logging.error("[BYBIT] API ключи не настроены в .env")
-        return False
+        return 0
 
-    try:
-        request_path = "/v5/affiliate/aff-user-list"
+    async with _sync_lock:
+        full = full or not referral_index.is_warm
+        size = AFF_LIST_FULL_PAGE_SIZE if full else AFF_LIST_PAGE_SIZE
         cursor = ""
+        added = 0
+        pages = 0
 
         while True:
-            timestamp = str(int(time.time() * 1000))
-            recv_window = "10000"
-
-            params_dict = {
-                "size": 50,
-                "cursor": cursor
-            }
-            params_str = "&".join([f"{k}={v}" for k, v in sorted(params_dict.items())])
-            signature = _get_bybit_signature(timestamp, API_KEY, recv_window, SECRET_KEY, params_str)
-
-            headers = {
-                'X-BAPI-API-KEY': API_KEY,
-                'X-BAPI-SIGN': signature,
-                'X-BAPI-TIMESTAMP': timestamp,
-                'X-BAPI-RECV-WINDOW': recv_window,
-                'Content-Type': 'application/json'
-            }
-
-            full_url = BASE_URL + request_path + "?" + params_str
-            logging.info(f"[BYBIT] Запрос страницы с курсором: '{cursor}'")
-
-            response = requests.get(full_url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("retCode") == 0:
-                result = data.get("result", {})
-                referral_list = result.get("list", [])
-
-                for referral in referral_list:
-                    if referral.get("userId") == uid:
-                        logging.info(f"[BYBIT] ✅ Пользователь {uid} НАЙДЕН.")
-                        return True
-
-                cursor = result.get("nextPageCursor", "")
-                if not cursor:
-                    logging.info(f"[BYBIT] Все страницы проверены. Пользователь {uid} не найден.")
-                    return False
-            else:
-                logging.error(f"[BYBIT] API вернул ошибку: {data.get('retMsg')}")
-                return False
+            result = await _fetch_aff_user_page(cursor, size)
+            referral_list = result.get("list", [])
+            pages += 1
+
+            reached_known = not full and any(
+                str(referral.get("userId")) in referral_index for referral in referral_list
+            )
+            added += referral_index.upsert_many(_to_index_row(r) for r in referral_list)
+
+            cursor = result.get("nextPageCursor", "")
+            if not cursor or reached_known:
+                break
+
+        referral_index.mark_synced(full)
+        logging.info(
+            f"[BYBIT] Индекс рефералов обновлён ({'полный' if full else 'инкрементальный'}): "
+            f"страниц {pages}, новых {added}, всего {len(referral_index)}"
+        )
+        return added
 
+
+_lookup_flight = referral_lookup(
+    "bybit",
+    referral_index,
+    # Курсорный список читается страницами по 1000 — досрочная остановка по targets не нужна
+    lambda full, targets: sync_referral_index(full=full),
+)
+
+
+async def lookup_referrals_many(uids) -> dict:
+    """Пакетная проверка: uid -> ReferralRecord | None, один общий проход по списку на все промахи."""
+    return await _lookup_flight.lookup_many(uids)
+
+
+async def lookup_referral(uid: str) -> dict:
+    """
+    Единый примитив проверки реферала: членство и KYC за одно обращение.
+
+    Тёплый индекс — ответ без запросов к бирже. При промахе или холодном индексе
+    делается один проход по списку (полный или инкрементальный), общий для всех
+    одновременных промахов (single-flight).
+    Возвращает {"status": "success", "found": bool, "kyc_status": "KYC" | "No KYC" | None}
+    или {"status": "error", "message": ...}.
+    """
+    # Реплика-читатель общего стора к Bybit не ходит — ключи ей не нужны
+    if not is_reader() and not all([API_KEY, SECRET_KEY]):
+        logging.error("[BYBIT] API ключи не настроены в .env")
+        return {"status": "error", "message": "API_KEYS_NOT_SET"}
+
+    try:
+        record = await _lookup_flight.lookup(uid)
+    except BybitApiError as e:
+        logging.warning(f"[BYBIT] Ошибка в ответе API: {e}")
+        return {"status": "error", "message": "BYBIT_API_ERROR"}
     except Exception as e:
         logging.exception(f"❌ [BYBIT] Критическая ошибка при проверке реферала: {e}")
-        return False
+        return {"status": "error", "message": "INTERNAL_ERROR"}
 
+    if record is None:
+        logging.info(f"[BYBIT] Пользователь {uid} не найден среди рефералов.")
+        return {"status": "success", "found": False, "kyc_status": None}
 
-def link_bybit_uid(telegram_id: str, bybit_uid: str) -> dict:
+    kyc_status = "KYC" if record.kyc else "No KYC"
+    logging.info(f"[BYBIT] ✅ Пользователь {uid} НАЙДЕН, статус KYC: {kyc_status}")
+    return {"status": "success", "found": True, "kyc_status": kyc_status}
+
+
+async def link_bybit_uid(telegram_id: str, bybit_uid: str) -> dict:
     """
     Основная функция: проверяет UID и привязывает его к пользователю Telegram.
     """
     logging.info(f"[BYBIT_LINK] Начинаю проверку UID: {bybit_uid}")
-    if not _is_user_direct_referral(bybit_uid):
+    ref_info = await lookup_referral(bybit_uid)
+    if not ref_info.get("found"):
         logging.warning(f"[BYBIT_LINK] Отказ: UID {bybit_uid} не является прямым рефералом.")
         return {"status": "error", "message": "ERROR_NOT_FOUND"}
 
     logging.info(f"[BYBIT_LINK] Успех: UID {bybit_uid} является рефералом.")
 
     try:
-        db = get_db_client()
-        users_ref = db.collection('telegram_users')
-
         logging.info(f"[BYBIT_LINK] Проверяю, не занят ли UID {bybit_uid} в базе данных...")
-        query = users_ref.where('bybit_uid', '==', bybit_uid).limit(1).stream()
-        existing_users = list(query)
+        existing_users = await firestore_dal.find_users_by_field('bybit_uid', bybit_uid, fields=())
 
         if existing_users:
-            if existing_users[0].id == telegram_id:
+            if existing_users[0][0] == telegram_id:
                 logging.info(f"[BYBIT_LINK] UID {bybit_uid} уже привязан к этому пользователю {telegram_id}.")
                 return {"status": "success", "message": "SUCCESS"}
 
@@ -108,20 +204,15 @@ def link_bybit_uid(telegram_id: str, bybit_uid: str) -> dict:
 
         logging.info(f"[BYBIT_LINK] Успех: UID {bybit_uid} свободен.")
 
-        user_doc_ref = users_ref.document(telegram_id)
-        if not user_doc_ref.get().exists:
+        if await firestore_dal.get_user(telegram_id, fields=()) is None:
             logging.error(f"[BYBIT_LINK] Ошибка: Пользователь с telegram_id {telegram_id} не найден в базе.")
             return {"status": "error", "message": "ERROR_UNKNOWN"}
 
-        # Получаем KYC-статус
-        kyc_result = get_referral_kyc_status(bybit_uid)
-        if kyc_result.get("status") == "success":
-            bybit_kyc_status = kyc_result.get("kyc_status", "UNKNOWN")
-        else:
-            bybit_kyc_status = "UNKNOWN"
+        # KYC-статус уже получен тем же lookup, что и членство
+        bybit_kyc_status = ref_info.get("kyc_status") or "UNKNOWN"
 
         # Обновляем Firestore
-        user_doc_ref.update({
+        await firestore_dal.update_user(telegram_id, {
             'bybit_uid': bybit_uid,
             'bybit_kyc': bybit_kyc_status
         })
@@ -135,62 +226,16 @@ def link_bybit_uid(telegram_id: str, bybit_uid: str) -> dict:
 
 
 
-def get_referral_kyc_status(uid: str) -> dict:
+async def get_referral_kyc_status(uid: str) -> dict:
     """
     Проверяет, прошёл ли пользователь KYC. Возвращает 'KYC' или 'No KYC'.
     """
-    if not all([API_KEY, SECRET_KEY]):
-        logging.error("[BYBIT] API ключи не настроены.")
-        return {"status": "error", "message": "API_KEYS_NOT_SET"}
-
-    try:
-        request_path = "/v5/affiliate/aff-user-list"
-        cursor = ""
-
-        while True:
-            timestamp = str(int(time.time() * 1000))
-            recv_window = "10000"
-
-            params_dict = {
-                "size": 50,
-                "cursor": cursor
-            }
-            params_str = "&".join([f"{k}={v}" for k, v in sorted(params_dict.items())])
-            signature = _get_bybit_signature(timestamp, API_KEY, recv_window, SECRET_KEY, params_str)
-
-            headers = {
-                'X-BAPI-API-KEY': API_KEY,
-                'X-BAPI-SIGN': signature,
-                'X-BAPI-TIMESTAMP': timestamp,
-                'X-BAPI-RECV-WINDOW': recv_window,
-                'Content-Type': 'application/json'
-            }
-
-            url = BASE_URL + request_path + "?" + params_str
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            logging.info(f"[BYBIT][KYC] Ответ от Bybit: {json.dumps(data, indent=2)}")
-
-            if data.get("retCode") != 0:
-                logging.warning(f"[BYBIT][KYC] Ошибка в ответе API: {data.get('retMsg')}")
-                return {"status": "error", "message": "BYBIT_API_ERROR"}
-
-            for ref in data.get("result", {}).get("list", []):
-                if ref.get("userId") == uid:
-                    is_kyc = ref.get("isKyc", False)
-                    kyc_status = "KYC" if is_kyc else "No KYC"
-                    logging.info(f"[BYBIT][KYC] Найден {uid}, статус KYC: {kyc_status}")
-                    return {"status": "success", "kyc_status": kyc_status}
-
-            cursor = data.get("result", {}).get("nextPageCursor", "")
-            if not cursor:
-                break
+    result = await lookup_referral(uid)
+    if result.get("status") == "error":
+        return result
 
+    if not result.get("found"):
         logging.info(f"[BYBIT][KYC] UID {uid} не найден среди твоих рефералов.")
         return {"status": "error", "message": "USER_NOT_FOUND"}
 
-    except Exception as e:
-        logging.exception(f"[BYBIT][KYC] Ошибка при проверке KYC: {e}")
-        return {"status": "error", "message": "INTERNAL_ERROR"}
\ No newline at end of file
+    return {"status": "success", "kyc_status": result["kyc_status"]}
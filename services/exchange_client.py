@@ -0,0 +1,114 @@
+# filename: services/exchange_client.py
+import asyncio
+import logging
+from typing import Callable
+
+import httpx
+
+from services.rate_limiter import RateLimiter
+
+try:
+    import h2  # noqa: F401 — httpx включает HTTP/2 только при наличии h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# sign(path, params) -> (путь с query-строкой, заголовки)
+SignFn = Callable[[str, dict], tuple[str, dict]]
+
+_clients: dict[str, "ExchangeClient"] = {}
+
+
+class ExchangeClient:
+    """
+    Общий асинхронный HTTP-клиент одной биржи.
+
+    Пул keep-alive соединений (HTTP/2, если установлен h2), ограничение
+    соединений на хост и таймаут биржи. Сервис передаёт только функцию
+    подписи — она вызывается непосредственно перед отправкой запроса,
+    чтобы timestamp в подписи был свежим.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        sign: SignFn,
+        *,
+        timeout: float,
+        max_connections: int = 10,
+        rate_limiter: RateLimiter | None = None,
+        max_throttle_retries: int = 5,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self._sign = sign
+        self._rate_limiter = rate_limiter
+        self._max_throttle_retries = max_throttle_retries
+        self._timeout = timeout
+        self._max_connections = max_connections
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        _clients[name] = self
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Пул привязан к event loop: скрипты с asyncio.run() получают новый клиент
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self._timeout),
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                    keepalive_expiry=30,
+                ),
+            )
+            self._loop = loop
+            logger.info(f"[EXCHANGE_CLIENT] 🔌 Пул соединений {self.name} создан (http2={HTTP2_AVAILABLE})")
+        return self._client
+
+    async def get_json(self, path: str, params: dict | None = None) -> dict:
+        """
+        Подписанный GET. Возвращает тело ответа как JSON;
+        коды ошибок биржи (retCode/code) проверяет сервис, ответ не 2xx — httpx.HTTPStatusError.
+
+        С rate_limiter запрос сначала ждёт токены, а ответ «лимит превышен»
+        не отдаётся сервису: запрос снова встаёт в очередь (до max_throttle_retries раз).
+        """
+        limiter = self._rate_limiter
+        data = None
+        for attempt in range(self._max_throttle_retries + 1):
+            if limiter:
+                await limiter.acquire(path)
+            # Подписываем после ожидания в очереди, чтобы timestamp был свежим
+            target, headers = self._sign(path, params or {})
+            response = await self._get_client().get(target, headers=headers)
+            if not limiter:
+                break
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            body_code = data.get("retCode", data.get("code")) if isinstance(data, dict) else None
+            if not limiter.observe(response.status_code, response.headers, body_code):
+                break
+        # Тело ответа 4xx/5xx — не данные: после ретраев по лимиту ошибка HTTP уходит сервису
+        response.raise_for_status()
+        if data is None:
+            return response.json()
+        return data
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+async def close_exchange_clients() -> None:
+    """Закрывает пулы всех бирж. Вызывается на shutdown приложения."""
+    for client in _clients.values():
+        await client.aclose()
@@ -0,0 +1,115 @@
+# filename: services/exchange_pager.py
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# fetch_page(page) -> (строки страницы, total или None, если биржа его не отдаёт)
+FetchPageFn = Callable[[int], Awaitable[tuple[list, Optional[int]]]]
+
+
+@dataclass
+class PageScanStats:
+    pages_fetched: int = 0
+    elapsed_sec: float = 0.0
+    stopped_early: bool = False
+    page_size: Optional[int] = None
+    last_contiguous_page: int = 0  # все страницы до неё включительно обработаны
+    total: Optional[int] = None
+
+
+# Последний проход по каждой бирже — для подбора concurrency
+last_scan_stats: dict[str, PageScanStats] = {}
+
+
+async def scan_pages(
+    name: str,
+    fetch_page: FetchPageFn,
+    *,
+    on_page: Callable[[int, list], None],
+    concurrency: int,
+    start_page: int = 1,
+    page_size: Optional[int] = None,
+    stop_when: Optional[Callable[[], bool]] = None,
+    stats: Optional[PageScanStats] = None,
+) -> PageScanStats:
+    """
+    Параллельный обход API с пагинацией по номеру страницы.
+
+    Сначала читается start_page: из неё берём total (BingX) или, если total нет,
+    фактический размер страницы (BloFin). Остальные страницы запрашиваются окнами
+    по `concurrency` штук; без total окна идут, пока не встретится короткая страница.
+    stop_when() проверяется после каждой готовой страницы — как только он вернул
+    True, незавершённые запросы окна отменяются.
+
+    stats можно передать снаружи: при исключении в нём останется
+    last_contiguous_page, с которой можно продолжить обход.
+    """
+    stats = stats or PageScanStats()
+    stats.last_contiguous_page = start_page - 1
+    started = time.monotonic()
+    done_pages: set[int] = set()
+
+    def _complete(page: int, rows: list) -> None:
+        on_page(page, rows)
+        stats.pages_fetched += 1
+        done_pages.add(page)
+        while stats.last_contiguous_page + 1 in done_pages:
+            stats.last_contiguous_page += 1
+
+    try:
+        rows, total = await fetch_page(start_page)
+        stats.total = total
+        stats.page_size = page_size or len(rows)
+        _complete(start_page, rows)
+        last_page = -(-total // stats.page_size) if total is not None and stats.page_size else None
+        is_last = not rows or len(rows) < stats.page_size or (last_page is not None and start_page >= last_page)
+        if stop_when and stop_when():
+            stats.stopped_early = not is_last
+            return stats
+        if is_last:
+            return stats
+
+        next_page = start_page + 1
+        while last_page is None or next_page <= last_page:
+            window_end = next_page + max(1, concurrency)
+            if last_page is not None:
+                window_end = min(window_end, last_page + 1)
+            tasks = {asyncio.create_task(fetch_page(p)): p for p in range(next_page, window_end)}
+            pending = set(tasks)
+            end_page = None  # первая короткая страница в окне
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        rows, _ = task.result()
+                        page = tasks[task]
+                        _complete(page, rows)
+                        if len(rows) < stats.page_size:
+                            end_page = page if end_page is None else min(end_page, page)
+                    if stop_when and stop_when():
+                        # Если список при этом уже дочитан до конца — обход полный, а не досрочный
+                        last = end_page if end_page is not None else last_page
+                        stats.stopped_early = last is None or stats.last_contiguous_page < last
+                        return stats
+            finally:
+                for task in pending:
+                    task.cancel()
+            if end_page is not None:
+                # Пустые страницы окна за концом списка — не позиция для следующего прохода по хвосту
+                stats.last_contiguous_page = min(stats.last_contiguous_page, end_page)
+                break
+            next_page = window_end
+        return stats
+
+    finally:
+        stats.elapsed_sec = time.monotonic() - started
+        last_scan_stats[name] = stats
+        logger.info(
+            f"[PAGER] {name}: страниц {stats.pages_fetched} за {stats.elapsed_sec:.2f} c "
+            f"(concurrency={concurrency}, с {start_page} по {stats.last_contiguous_page}"
+            f"{', остановлен досрочно' if stats.stopped_early else ''})"
+        )
@@ -1,9 +1,13 @@
 # filename: services/firebase_service.py
 import os
+import time
+import asyncio
 import hashlib
+import itertools
 import logging
 import firebase_admin
-from firebase_admin import auth, credentials, firestore
+import google.cloud.firestore
+from firebase_admin import auth, credentials, firestore, firestore_async
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +29,113 @@ def _ensure_firebase_app():
         raise
 
 
+# Настройки gRPC-каналов Firestore
+CHANNEL_POOL_SIZE = max(1, int(os.getenv("FIRESTORE_CHANNEL_POOL", "2")))
+KEEPALIVE_MS = int(os.getenv("FIRESTORE_KEEPALIVE_MS", "30000"))
+KEEPALIVE_TIMEOUT_MS = int(os.getenv("FIRESTORE_KEEPALIVE_TIMEOUT_MS", "10000"))
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", KEEPALIVE_MS),
+    ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS),
+    # Простаивающий канал не закрывается между редкими запросами
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+# Документ, чтение которого на startup открывает канал и получает OAuth-токен
+WARMUP_DOCUMENT = ("telegram_users", "warmup-probe")
+WARMUP_TIMEOUT_SEC = float(os.getenv("FIRESTORE_WARMUP_TIMEOUT_SEC", "10"))
+
+
+# _open_api повторяет BaseClient._firestore_api_helper и опирается на его приватные поля.
+# Проверено на этих версиях google-cloud-firestore (зафиксирована в requirements.txt);
+# на любой другой опции не подменяются — клиент работает со стандартным каналом.
+CHANNEL_OPTIONS_VERIFIED = ("2.21.",)
+_CLIENT_FIELDS = ("_firestore_api_internal", "_emulator_host", "_target", "_credentials", "_client_options", "_client_info")
+
+
+def _channel_options_supported(client) -> bool:
+    if not google.cloud.firestore.__version__.startswith(CHANNEL_OPTIONS_VERIFIED):
+        reason = f"версия google-cloud-firestore {google.cloud.firestore.__version__} не проверена"
+    elif not all(hasattr(client, field) for field in _CLIENT_FIELDS):
+        reason = "у клиента нет ожидаемых приватных полей"
+    else:
+        return True
+    if init_stats.get("channel_options") != "default":
+        logger.warning(f"[FIREBASE_SERVICE] ⚠️ Опции gRPC-канала не применены ({reason}) — стандартный канал")
+    init_stats["channel_options"] = "default"
+    return False
+
+
+def _open_api(client, transport, client_class, client_module) -> None:
+    """Создаёт GAPIC-клиент на канале с нашими опциями вместо стандартного (только keepalive 30 с)."""
+    if not _channel_options_supported(client):
+        return
+    if client._firestore_api_internal is not None or client._emulator_host is not None:
+        return
+    channel = transport.create_channel(client._target, credentials=client._credentials, options=CHANNEL_OPTIONS)
+    client._transport = transport(host=client._target, channel=channel)
+    client._firestore_api_internal = client_class(transport=client._transport, client_options=client._client_options)
+    client_module._client_info = client._client_info
+    init_stats["channel_options"] = "custom"
+
+
+class _Client(firestore.Client):
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        _open_api(self, transport, client_class, client_module)
+        return super()._firestore_api_helper(transport, client_class, client_module)
+
+
+class _AsyncClient(firestore_async.AsyncClient):
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        _open_api(self, transport, client_class, client_module)
+        return super()._firestore_api_helper(transport, client_class, client_module)
+
+
 _db = None
+_async_pool: list = []
+_async_cycle = None
+_fake_store = None
+init_stats: dict = {"initialized": False, "channel_pool": CHANNEL_POOL_SIZE, "keepalive_ms": KEEPALIVE_MS}
+
+
+def use_fake_firestore(store=None):
+    """
+    Переключает фабрику на in-memory Firestore (services/firestore_fake.py):
+    get_db_client и get_async_db_client дальше отдают клиентов над одним хранилищем.
+    Возвращает хранилище — через него тест наполняет данные и проверяет счётчики.
+    """
+    # Фейк нужен только тестам и firestore_budget.py — в обычный старт он не импортируется
+    from services.firestore_fake import FakeStore, FakeClient, FakeAsyncClient
+
+    global _db, _async_cycle, _fake_store
+    _fake_store = store if store is not None else FakeStore.from_env()
+    _db = FakeClient(_fake_store)
+    _async_pool[:] = [FakeAsyncClient(_fake_store) for _ in range(CHANNEL_POOL_SIZE)]
+    _async_cycle = itertools.cycle(_async_pool)
+    init_stats.update({"initialized": True, "fake": True})
+    logger.warning(f"[FIREBASE_SERVICE] 🧪 Firestore подменён in-memory хранилищем (задержка {_fake_store.latency_ms} мс)")
+    return _fake_store
+
+
+def fake_store():
+    """Хранилище in-memory Firestore или None, если работаем с настоящим."""
+    return _fake_store
+
+
+def _client_kwargs() -> dict:
+    app = firebase_admin.get_app()
+    if not app.project_id:
+        raise ValueError("Project ID is required to access Firestore (service account или GOOGLE_CLOUD_PROJECT)")
+    return {"credentials": app.credential.get_credential(), "project": app.project_id}
+
+
 def get_db_client():
+    """Синхронный клиент Firestore — для скриптов и фоновых потоков (on_snapshot, to_thread)."""
     global _db
     if _db is not None:
         return _db
     _ensure_firebase_app()
     try:
-        _db = firestore.client()
+        _db = _Client(**_client_kwargs())
         logger.info("[FIREBASE_SERVICE] ✅ Firestore клиент готов")
         return _db
     except Exception as e:
@@ -40,6 +143,84 @@ def get_db_client():
         raise
 
 
+def _build_async_pool() -> None:
+    global _async_cycle
+    _ensure_firebase_app()
+    kwargs = _client_kwargs()
+    _async_pool[:] = [_AsyncClient(**kwargs) for _ in range(CHANNEL_POOL_SIZE)]
+    _async_cycle = itertools.cycle(_async_pool)
+    logger.info(f"[FIREBASE_SERVICE] ✅ Асинхронный Firestore: каналов в пуле {len(_async_pool)}")
+
+
+def get_async_db_client():
+    """
+    Асинхронный клиент Firestore для кода, работающего в event loop FastAPI:
+    ожидание ответа Firestore не блокирует остальные запросы.
+    Клиенты пула чередуются по кругу — у каждого свой HTTP/2-канал, так что
+    параллельные запросы не упираются в лимит потоков одного соединения.
+    """
+    if _async_cycle is None:
+        try:
+            _build_async_pool()
+        except Exception as e:
+            logger.exception(f"[FIREBASE_SERVICE] ❌ Ошибка создания асинхронного Firestore клиента: {e}")
+            raise
+    return next(_async_cycle)
+
+
+async def init_firestore() -> dict:
+    """
+    Явная фаза старта: приложение Firebase, клиенты и прогрев каждого канала пула
+    одним чтением — TLS, HTTP/2 и OAuth-токен оплачивает startup, а не первый запрос.
+    Ошибка не валит приложение: клиенты тогда создаются лениво при первом обращении.
+    """
+    if _fake_store is not None:
+        return init_stats
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(_ensure_firebase_app)
+        credentials_done = time.perf_counter()
+        if _async_cycle is None:
+            _build_async_pool()
+        sync_db = await asyncio.to_thread(get_db_client)
+        clients_done = time.perf_counter()
+
+        collection, document = WARMUP_DOCUMENT
+
+        async def warm(client) -> float:
+            t0 = time.perf_counter()
+            await client.collection(collection).document(document).get(retry=None, timeout=WARMUP_TIMEOUT_SEC)
+            return round((time.perf_counter() - t0) * 1000, 1)
+
+        def warm_sync() -> float:
+            t0 = time.perf_counter()
+            sync_db.collection(collection).document(document).get(retry=None, timeout=WARMUP_TIMEOUT_SEC)
+            return round((time.perf_counter() - t0) * 1000, 1)
+
+        warmups = await asyncio.gather(*(warm(client) for client in _async_pool), asyncio.to_thread(warm_sync))
+        init_stats.update({
+            "initialized": True,
+            "credentials_ms": round((credentials_done - started) * 1000, 1),
+            "clients_ms": round((clients_done - credentials_done) * 1000, 1),
+            "warmup_async_ms": list(warmups[:-1]),
+            "warmup_sync_ms": warmups[-1],
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        logger.info(
+            f"[FIREBASE_SERVICE] 🔥 Firestore прогрет за {init_stats['total_ms']} мс "
+            f"(креды {init_stats['credentials_ms']} мс, каналы {init_stats['warmup_async_ms']} мс)"
+        )
+    except Exception as e:
+        init_stats.update({"initialized": False, "error": str(e)})
+        logger.exception(f"[FIREBASE_SERVICE] ❌ Прогрев Firestore не удался, клиенты будут созданы лениво: {e}")
+    return init_stats
+
+
+# FIRESTORE_FAKE=1 — весь процесс работает с in-memory Firestore, без кредов и сети
+if os.getenv("FIRESTORE_FAKE", "0") == "1":
+    use_fake_firestore()
+
+
 def create_custom_token(telegram_id: int) -> str:
     try:
         _ensure_firebase_app()
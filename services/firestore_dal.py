@@ -0,0 +1,203 @@
+# filename: services/firestore_dal.py
+"""
+Асинхронный слой доступа к Firestore для роутеров и сервисов.
+
+Все функции — корутины поверх AsyncClient: пока один запрос ждёт Firestore,
+event loop обслуживает остальные. Синхронный get_db_client() остаётся
+для скриптов и фоновых задач, которые работают в отдельных потоках.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from services.firebase_service import get_async_db_client
+from services.user_cache import user_cache
+from services import subscription_docs
+
+logger = logging.getLogger(__name__)
+
+USERS = "telegram_users"
+SUBSCRIPTIONS = "subscriptions"
+HISTORY = "subscriptionHistory"
+ALERTS = "alerts"
+MESSAGES = "messages"
+SHOP = "shop"
+SECURE_WALLETS = "secure_wallets"
+
+
+def db():
+    """
+    Следующий клиент пула. Пул чередует клиентов на каждом вызове, поэтому batch/транзакция
+    и ссылки для их записей строятся от одного клиента: client = db(), затем batch(client)
+    и *_ref(..., client) — единица работы целиком идёт через один канал.
+    """
+    return get_async_db_client()
+
+
+# --- telegram_users ---
+
+def user_ref(telegram_id, client=None):
+    return (client or db()).collection(USERS).document(str(telegram_id))
+
+
+async def get_user(telegram_id, fields=None, cached: bool = True) -> Optional[dict]:
+    """
+    Документ пользователя или None, если его нет.
+    fields — маска полей (select): с сервера приходят и разбираются только они.
+    По умолчанию читается через user_cache; cached=False — всегда из Firestore.
+    Кэш годится только для чтения: если от прочитанного зависит запись, нужен cached=False
+    (без on_snapshot запись в кэше может отставать на USER_CACHE_TTL_SEC).
+    """
+    if cached:
+        data = user_cache.get(telegram_id, fields)
+        if data is not None:
+            return data
+    if fields is None:
+        snap = await user_ref(telegram_id).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict() or {}
+        user_cache.put(telegram_id, data)
+        return data
+
+    # Дочитываем и поля, уже лежащие в кэше, — запись остаётся согласованным снимком
+    read_fields = sorted(set(fields) | user_cache.cached_fields(telegram_id))
+    snap = await user_ref(telegram_id).get(field_paths=read_fields)
+    if not snap.exists:
+        return None
+    data = snap.to_dict() or {}
+    user_cache.put(telegram_id, data, read_fields)
+    return {field: data[field] for field in fields if field in data}
+
+
+def forget_user(telegram_id) -> None:
+    """Сбросить кэш пользователя после записи в его документ через batch или транзакцию."""
+    user_cache.invalidate(telegram_id)
+
+
+async def update_user(telegram_id, data: dict) -> None:
+    try:
+        await user_ref(telegram_id).update(data)
+    finally:
+        forget_user(telegram_id)
+
+
+async def set_user(telegram_id, data: dict, merge: bool = False) -> None:
+    try:
+        await user_ref(telegram_id).set(data, merge=merge)
+    finally:
+        forget_user(telegram_id)
+
+
+async def find_users_by_field(field: str, value, limit: int = 1, fields=None) -> list[tuple[str, dict]]:
+    """
+    [(telegram_id, данные)] пользователей, у которых field == value.
+    fields — маска полей; пустая маска () — только id документов, без данных.
+    """
+    return await find_users(FieldFilter(field, "==", value), limit=limit, fields=fields)
+
+
+async def find_users(query_filter, limit: int = 1, fields=None) -> list[tuple[str, dict]]:
+    """Как find_users_by_field, но с произвольным фильтром (FieldFilter, Or, And) — одним запросом."""
+    query = db().collection(USERS).where(filter=query_filter).limit(limit)
+    if fields is not None:
+        query = query.select(list(fields))
+    return [(snap.id, snap.to_dict() or {}) async for snap in query.stream()]
+
+
+# --- subscriptions / subscriptionHistory ---
+
+async def find_subscription(telegram_id, subscription_type: str, transaction=None, client=None):
+    """
+    (ссылка, данные) подписки нужного типа или None.
+    Подписки лежат под детерминированным id — это один point get; документы под auto-id,
+    ещё не перенесённые migrate_subscriptions.py, находятся запасным where-запросом.
+    """
+    ref = subscription_ref(telegram_id, subscription_type, client)
+    snap = await ref.get(transaction=transaction)
+    if snap.exists:
+        return ref, snap.to_dict() or {}
+    if subscription_docs.LEGACY_LOOKUP:
+        query = (
+            user_ref(telegram_id, client).collection(SUBSCRIPTIONS)
+            .where("subscription_type", "==", subscription_type)
+            .limit(1)
+        )
+        async for legacy in query.stream(transaction=transaction):
+            return legacy.reference, legacy.to_dict() or {}
+    return None
+
+
+def subscription_ref(telegram_id, subscription_type: str, client=None):
+    return subscription_docs.subscription_ref(user_ref(telegram_id, client), subscription_type)
+
+
+def new_history_ref(telegram_id, client=None):
+    return user_ref(telegram_id, client).collection(HISTORY).document()
+
+
+# --- alerts / messages ---
+
+def _alert_payload(message_text: str, alert_type: int) -> dict:
+    return {
+        "message": message_text,
+        "read": False,
+        "timestamp": datetime.now(timezone.utc),
+        "type": alert_type,
+    }
+
+
+async def add_alert(telegram_id, message_text: str, alert_type: int = 1) -> None:
+    await user_ref(telegram_id).collection(ALERTS).add(_alert_payload(message_text, alert_type))
+
+
+async def add_message(payload: dict) -> str:
+    """Задание для сендера в коллекции messages. Возвращает id документа."""
+    doc_ref = db().collection(MESSAGES).document()
+    await doc_ref.set(payload)
+    return doc_ref.id
+
+
+def stage_alert(batch, client, telegram_id, message_text: str, alert_type: int = 1) -> None:
+    """Как add_alert, но запись кладётся в batch и уйдёт вместе с его commit. client — клиент batch."""
+    batch.set(user_ref(telegram_id, client).collection(ALERTS).document(), _alert_payload(message_text, alert_type))
+
+
+def stage_message(batch, client, payload: dict) -> str:
+    """Как add_message, но запись кладётся в batch. Возвращает id будущего документа."""
+    doc_ref = client.collection(MESSAGES).document()
+    batch.set(doc_ref, payload)
+    return doc_ref.id
+
+
+# --- shop / secure_wallets ---
+
+def shop_ref(shop_id: str, client=None):
+    return (client or db()).collection(SHOP).document(shop_id)
+
+
+async def get_shop_item(shop_id: str) -> Optional[dict]:
+    snap = await shop_ref(shop_id).get()
+    return (snap.to_dict() or {}) if snap.exists else None
+
+
+def secure_wallet_ref(user_id, client=None):
+    return (client or db()).collection(SECURE_WALLETS).document(str(user_id))
+
+
+def batch(client=None):
+    return (client or db()).batch()
+
+
+async def commit_user_batch(batch, telegram_id) -> None:
+    """Один commit всех записей по пользователю; его документ в кэше после этого сбрасывается."""
+    try:
+        await batch.commit()
+    finally:
+        forget_user(telegram_id)
+
+
+def transaction(client=None):
+    return (client or db()).transaction()
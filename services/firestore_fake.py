@@ -0,0 +1,932 @@
+# filename: services/firestore_fake.py
+"""
+In-memory Firestore для детерминированных прогонов без облака и кредов.
+
+Повторяет то подмножество API google-cloud-firestore, которым пользуется код:
+document/collection/collection_group, get (field_paths, transaction), set (merge),
+update (пути через точку), create, delete, add, where/limit/select/order_by,
+stream/get, batch(), transaction() под настоящими @transactional/@async_transactional,
+get_all, on_snapshot, write_option, DELETE_FIELD и SERVER_TIMESTAMP.
+
+Синхронный и асинхронный клиенты смотрят в одно хранилище FakeStore. Оно считает
+каждый вызов, который в облаке был бы RPC, и прочитанные/записанные документы —
+так тест проверяет бюджет эндпоинта (measure()). Задержка RPC задаётся
+FIRESTORE_FAKE_LATENCY_MS или per-op в конструкторе.
+
+Подключается через фабрику клиентов: FIRESTORE_FAKE=1 или
+firebase_service.use_fake_firestore().
+"""
+import os
+import copy
+import time
+import uuid
+import random
+import string
+import asyncio
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP
+from google.cloud.firestore_v1.base_query import BaseCompositeFilter, FieldFilter, Or
+
+logger = logging.getLogger(__name__)
+
+# Имена RPC — как в API Firestore; по ним считаются round trip-ы
+RPCS = ("get", "batch_get", "run_query", "commit", "begin_transaction", "rollback", "listen")
+# Единицы тарификации: документы прочитанные/записанные/удалённые
+UNITS = ("reads", "writes", "deletes", "listener_reads", "aborted")
+
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _join(*parts) -> str:
+    return "/".join(str(part).strip("/") for part in parts if part)
+
+
+def _parent_path(path: str) -> str:
+    return path.rsplit("/", 1)[0]
+
+
+def _get_field(data: dict, field_path: str):
+    """Значение по пути "a.b.c"; KeyError, если его нет."""
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(field_path)
+        value = value[part]
+    return value
+
+
+def _set_field(data: dict, field_path: str, value) -> None:
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+    if value is DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = value
+
+
+def _resolve(value, now: datetime, allow_delete: bool):
+    """Копия значения для записи: SERVER_TIMESTAMP -> время commit, DELETE_FIELD — только где разрешён."""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if value is DELETE_FIELD:
+        if not allow_delete:
+            raise ValueError("Cannot apply DELETE_FIELD in a set request without specifying 'merge=True'")
+        return value
+    if isinstance(value, dict):
+        return {key: _resolve(item, now, allow_delete) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, now, False) for item in value]
+    return copy.deepcopy(value)
+
+
+def _merge(target: dict, patch: dict) -> None:
+    """set(merge=True): вложенные словари сливаются, DELETE_FIELD удаляет поле."""
+    for key, value in patch.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _project(data: dict, field_paths) -> dict:
+    if field_paths is None:
+        return copy.deepcopy(data)
+    projected: dict = {}
+    for field_path in field_paths:
+        try:
+            _set_field(projected, field_path, copy.deepcopy(_get_field(data, field_path)))
+        except KeyError:
+            continue
+    return projected
+
+
+def _compare(op: str, value, expected) -> bool:
+    try:
+        if op == "==":
+            return value == expected
+        if op == "!=":
+            return value != expected
+        if op == "<":
+            return value < expected
+        if op == "<=":
+            return value <= expected
+        if op == ">":
+            return value > expected
+        if op == ">=":
+            return value >= expected
+        if op == "in":
+            return value in expected
+        if op == "not-in":
+            return value not in expected
+        if op == "array_contains":
+            return isinstance(value, list) and expected in value
+        if op == "array_contains_any":
+            return isinstance(value, list) and any(item in value for item in expected)
+    except TypeError:
+        return False
+    raise ValueError(f"Неподдерживаемый оператор where: {op}")
+
+
+class WriteOption:
+    """Условие записи (precondition) для update/delete."""
+    __slots__ = ("last_update_time", "exists")
+
+    def __init__(self, last_update_time: Optional[datetime] = None, exists: Optional[bool] = None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class WriteResult:
+    __slots__ = ("update_time",)
+
+    def __init__(self, update_time: datetime):
+        self.update_time = update_time
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data: Optional[dict], read_time: datetime, update_time: Optional[datetime] = None):
+        self.reference = reference
+        self._data = data
+        self.read_time = read_time
+        self.update_time = update_time
+        self.create_time = update_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        if self._data is None:
+            return None
+        return copy.deepcopy(_get_field(self._data, field_path))
+
+
+class _Listener:
+    __slots__ = ("client", "path", "is_collection", "callback")
+
+    def __init__(self, client, path: str, is_collection: bool, callback):
+        self.client = client
+        self.path = path
+        self.is_collection = is_collection
+        self.callback = callback
+
+
+class FakeWatch:
+    def __init__(self, store: "FakeStore", listener: _Listener):
+        self._store = store
+        self._listener = listener
+
+    def unsubscribe(self) -> None:
+        self._store._remove_listener(self._listener)
+
+
+class FakeStore:
+    """
+    Общее хранилище документов, счётчики операций и задержка.
+
+    latency_ms — задержка каждого RPC; op_latency_ms — переопределение по имени RPC
+    (например {"commit": 40}). Асинхронный клиент ждёт через asyncio.sleep, синхронный — time.sleep.
+    Транзакции оптимистические: commit отменяется (Aborted), если прочитанный в ней документ
+    успели изменить, и декоратор @transactional повторяет попытку, как с настоящим Firestore.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, op_latency_ms: Optional[dict] = None):
+        self.latency_ms = latency_ms
+        self.op_latency_ms = dict(op_latency_ms or {})
+        self.counters: Counter = Counter()
+        self._docs: dict[str, dict] = {}
+        self._versions: dict[str, int] = {}
+        self._update_times: dict[str, datetime] = {}
+        self._listeners: list[_Listener] = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls) -> "FakeStore":
+        return cls(latency_ms=float(os.getenv("FIRESTORE_FAKE_LATENCY_MS", "0")))
+
+    # --- счётчики и задержка ---
+
+    def _rpc(self, op: str) -> float:
+        """Учитывает RPC и возвращает его задержку в секундах."""
+        with self._lock:
+            self.counters[op] += 1
+        return self.op_latency_ms.get(op, self.latency_ms) / 1000
+
+    def _count(self, unit: str, amount: int = 1) -> None:
+        if amount:
+            with self._lock:
+                self.counters[unit] += amount
+
+    def snapshot(self) -> dict:
+        """Все счётчики, включая нулевые; round_trips — RPC без учёта listen."""
+        with self._lock:
+            counters = {name: self.counters[name] for name in RPCS + UNITS}
+        counters["round_trips"] = sum(counters[name] for name in RPCS if name != "listen")
+        return counters
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.counters.clear()
+
+    @contextmanager
+    def measure(self):
+        """
+        Разница счётчиков за блок:
+            with store.measure() as ops:
+                client.post("/api/check-in", json=...)
+            assert ops["reads"] <= 1 and ops["writes"] == 1
+        Счётчики общие — параллельные запросы внутри блока попадут в одну разницу.
+        """
+        before = self.snapshot()
+        delta: dict = {}
+        try:
+            yield delta
+        finally:
+            after = self.snapshot()
+            delta.update({name: after[name] - before[name] for name in after})
+
+    # --- данные ---
+
+    def clear(self) -> None:
+        """Удаляет все документы; счётчики и подписки остаются."""
+        with self._lock:
+            self._docs.clear()
+            self._versions.clear()
+            self._update_times.clear()
+
+    def seed(self, documents: dict[str, dict]) -> None:
+        """Кладёт документы {"collection/doc": data} в обход счётчиков и listener-ов — для подготовки теста."""
+        now = _now()
+        with self._lock:
+            for path, data in documents.items():
+                path = path.strip("/")
+                self._docs[path] = _resolve(data, now, False)
+                self._versions[path] = self._versions.get(path, 0) + 1
+                self._update_times[path] = now
+
+    def dump(self, prefix: str = "") -> dict[str, dict]:
+        """Копия документов, чей путь начинается с prefix — для проверок после прогона."""
+        with self._lock:
+            return {path: copy.deepcopy(data) for path, data in self._docs.items() if path.startswith(prefix)}
+
+    def _version(self, path: str) -> int:
+        return self._versions.get(path, 0)
+
+    def _read(self, path: str, field_paths=None) -> tuple[Optional[dict], int, Optional[datetime]]:
+        with self._lock:
+            data = self._docs.get(path)
+            return (
+                _project(data, field_paths) if data is not None else None,
+                self._version(path),
+                self._update_times.get(path),
+            )
+
+    def _query(self, query: "_BaseQuery") -> list[tuple[str, dict, int, datetime]]:
+        with self._lock:
+            rows = [
+                (path, data)
+                for path, data in self._docs.items()
+                if query._matches_path(path) and all(query._matches_filter(data, f) for f in query._filters)
+            ]
+            rows.sort(key=lambda row: row[0])
+            for field_path, direction in reversed(query._orders):
+                rows = [row for row in rows if _has_field(row[1], field_path)]
+                rows.sort(key=lambda row: _get_field(row[1], field_path), reverse=direction == "DESCENDING")
+            if query._offset:
+                rows = rows[query._offset:]
+            if query._limit is not None:
+                rows = rows[:query._limit]
+            return [
+                (path, _project(data, query._projection), self._version(path), self._update_times[path])
+                for path, data in rows
+            ]
+
+    def _commit(self, writes: list[tuple], read_versions: Optional[dict[str, int]] = None) -> list[WriteResult]:
+        """
+        Атомарно применяет записи batch/транзакции: сначала проверяет все (create на
+        существующий — AlreadyExists, update отсутствующего — NotFound, невыполненное
+        условие write_option — FailedPrecondition), потом пишет.
+        """
+        now = _now()
+        with self._lock:
+            if read_versions:
+                for path, version in read_versions.items():
+                    if self._version(path) != version:
+                        self.counters["aborted"] += 1
+                        raise Aborted(f"Transaction aborted: {path} was modified concurrently")
+
+            staged: dict[str, Optional[dict]] = {}
+            for op, path, data, merge, option in writes:
+                current = staged[path] if path in staged else self._docs.get(path)
+                if option is not None:
+                    update_time = None if path in staged else self._update_times.get(path)
+                    if option.exists is not None and option.exists != (current is not None):
+                        raise FailedPrecondition(f"Precondition exists={option.exists} failed: {path}")
+                    if option.last_update_time is not None and update_time != option.last_update_time:
+                        raise FailedPrecondition(f"Document was modified since {option.last_update_time}: {path}")
+                if op == "create":
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {path}")
+                    staged[path] = _resolve(data, now, False)
+                elif op == "set":
+                    if merge is True:
+                        merged = copy.deepcopy(current) if current is not None else {}
+                        _merge(merged, _resolve(data, now, True))
+                        staged[path] = merged
+                    elif merge:
+                        merged = copy.deepcopy(current) if current is not None else {}
+                        resolved = _resolve(data, now, True)
+                        for field_path in merge:
+                            try:
+                                _set_field(merged, field_path, _get_field(resolved, field_path))
+                            except KeyError:
+                                _set_field(merged, field_path, DELETE_FIELD)
+                        staged[path] = merged
+                    else:
+                        staged[path] = _resolve(data, now, False)
+                elif op == "update":
+                    if current is None:
+                        raise NotFound(f"No document to update: {path}")
+                    updated = copy.deepcopy(current)
+                    for field_path, value in data.items():
+                        _set_field(updated, field_path, _resolve(value, now, True))
+                    staged[path] = updated
+                elif op == "delete":
+                    staged[path] = None
+
+            for path, data in staged.items():
+                if data is None:
+                    self._docs.pop(path, None)
+                    self._update_times.pop(path, None)
+                else:
+                    self._docs[path] = data
+                    self._update_times[path] = now
+                self._versions[path] = self._version(path) + 1
+            self.counters["writes"] += sum(1 for op, *_ in writes if op != "delete")
+            self.counters["deletes"] += sum(1 for op, *_ in writes if op == "delete")
+            listeners = list(self._listeners)
+
+        self._notify(listeners, set(staged), now)
+        return [WriteResult(now) for _ in writes]
+
+    # --- on_snapshot ---
+
+    def _add_listener(self, listener: _Listener) -> FakeWatch:
+        with self._lock:
+            self._listeners.append(listener)
+        self._deliver(listener, _now())
+        return FakeWatch(self, listener)
+
+    def _remove_listener(self, listener: _Listener) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, listeners: list[_Listener], changed: set[str], now: datetime) -> None:
+        for listener in listeners:
+            if listener.is_collection:
+                hit = any(_parent_path(path) == listener.path for path in changed)
+            else:
+                hit = listener.path in changed
+            if hit:
+                self._deliver(listener, now)
+
+    def _deliver(self, listener: _Listener, now: datetime) -> None:
+        """Вызывает callback в потоке писателя, вне блокировки хранилища, — порядок событий детерминирован."""
+        client = listener.client
+        with self._lock:
+            if listener.is_collection:
+                rows = sorted(
+                    (path, copy.deepcopy(data)) for path, data in self._docs.items()
+                    if _parent_path(path) == listener.path
+                )
+            else:
+                data = self._docs.get(listener.path)
+                rows = [(listener.path, copy.deepcopy(data))] if data is not None else []
+            updated = {path: self._update_times.get(path) for path, _ in rows}
+            self.counters["listener_reads"] += len(rows)
+        snapshots = [
+            FakeDocumentSnapshot(client.document(path), data, now, updated[path]) for path, data in rows
+        ]
+        try:
+            listener.callback(snapshots, [], now)
+        except Exception:
+            logger.exception(f"[FIRESTORE_FAKE] ❌ Ошибка в callback on_snapshot для {listener.path}")
+
+
+def _has_field(data: dict, field_path: str) -> bool:
+    try:
+        _get_field(data, field_path)
+        return True
+    except KeyError:
+        return False
+
+
+# --- ссылки и запросы: общая часть ---
+
+class _BaseDocumentReference:
+    def __init__(self, client, path: str):
+        self._client = client
+        self._path = path.strip("/")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _BaseDocumentReference) and other._client._store is self._client._store \
+            and other._path == self._path
+
+    def __hash__(self) -> int:
+        return hash(self._path)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self._path}>"
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def parent(self):
+        return self._client.collection(_parent_path(self._path))
+
+    def collection(self, collection_id: str):
+        return self._client.collection(_join(self._path, collection_id))
+
+    def _snapshot(self, field_paths=None, transaction=None) -> FakeDocumentSnapshot:
+        if transaction is not None:
+            transaction._check_read(self._client)
+        data, version, update_time = self._client._store._read(self._path, field_paths)
+        if transaction is not None:
+            transaction._read_versions.setdefault(self._path, version)
+        self._client._store._count("reads")
+        return FakeDocumentSnapshot(self, data, _now(), update_time)
+
+    def _write(self, op: str, data: Optional[dict] = None, merge=False, option=None) -> WriteResult:
+        return self._client._store._commit([(op, self._path, data, merge, option)])[0]
+
+
+class _BaseCollectionReference:
+    def __init__(self, client, path: str):
+        self._client = client
+        self._path = path.strip("/")
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self._path}>"
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def parent(self):
+        if "/" not in self._path:
+            return None
+        return self._client.document(_parent_path(self._path))
+
+    def document(self, document_id: Optional[str] = None):
+        if document_id is None:
+            document_id = "".join(random.choices(_AUTO_ID_CHARS, k=20))
+        return self._client.document(_join(self._path, document_id))
+
+    def _query(self):
+        return self._client._query_class(self._client, parent=self._path)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        return self._query().where(field_path, op_string, value, filter=filter)
+
+    def limit(self, count: int):
+        return self._query().limit(count)
+
+    def offset(self, num_to_skip: int):
+        return self._query().offset(num_to_skip)
+
+    def select(self, field_paths):
+        return self._query().select(field_paths)
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return self._query().order_by(field_path, direction)
+
+    def stream(self, transaction=None):
+        return self._query().stream(transaction=transaction)
+
+    def get(self, transaction=None):
+        return self._query().get(transaction=transaction)
+
+
+class _BaseQuery:
+    def __init__(self, client, parent: Optional[str] = None, group_id: Optional[str] = None):
+        self._client = client
+        self._parent = parent
+        self._group_id = group_id
+        self._filters: list = []
+        self._orders: list[tuple[str, str]] = []
+        self._projection: Optional[list[str]] = None
+        self._limit: Optional[int] = None
+        self._offset = 0
+
+    def _copy(self):
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        """where(field, op, value) или where(filter=FieldFilter/Or/And)."""
+        if filter is None:
+            filter = FieldFilter(field_path, op_string, value)
+        query = self._copy()
+        query._filters.append(filter)
+        return query
+
+    def limit(self, count: int):
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def offset(self, num_to_skip: int):
+        query = self._copy()
+        query._offset = num_to_skip
+        return query
+
+    def select(self, field_paths):
+        query = self._copy()
+        query._projection = list(field_paths)
+        return query
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        query = self._copy()
+        query._orders.append((field_path, direction))
+        return query
+
+    def _matches_path(self, path: str) -> bool:
+        if self._group_id is not None:
+            parts = path.split("/")
+            return len(parts) >= 2 and parts[-2] == self._group_id
+        return _parent_path(path) == self._parent
+
+    @classmethod
+    def _matches_filter(cls, data: dict, query_filter) -> bool:
+        if isinstance(query_filter, BaseCompositeFilter):
+            matches = (cls._matches_filter(data, sub_filter) for sub_filter in query_filter.filters)
+            return any(matches) if isinstance(query_filter, Or) else all(matches)
+        try:
+            value = _get_field(data, query_filter.field_path)
+        except KeyError:
+            return False
+        return _compare(query_filter.op_string, value, query_filter.value)
+
+    def _run(self, transaction=None) -> list[FakeDocumentSnapshot]:
+        if transaction is not None:
+            transaction._check_read(self._client)
+        store = self._client._store
+        rows = store._query(self)
+        if transaction is not None:
+            for path, _, version, _ in rows:
+                transaction._read_versions.setdefault(path, version)
+        # Запрос тарифицируется минимум одним чтением, даже если пуст
+        store._count("reads", max(1, len(rows)))
+        now = _now()
+        return [
+            FakeDocumentSnapshot(self._client.document(path), data, now, update_time)
+            for path, data, _, update_time in rows
+        ]
+
+
+class _BaseWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes: list[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def _stage(self, op: str, reference, data, merge, option=None) -> None:
+        # Строже настоящего SDK: ссылка от другого клиента пула — ошибка единицы работы
+        if reference._client is not self._client:
+            raise ValueError(f"{reference.path}: ссылка создана другим клиентом, чем batch/транзакция")
+        self._writes.append((op, reference.path, data, merge, option))
+
+    def create(self, reference, document_data: dict):
+        self._stage("create", reference, document_data, False)
+        return self
+
+    def set(self, reference, document_data: dict, merge=False):
+        self._stage("set", reference, document_data, merge)
+        return self
+
+    def update(self, reference, field_updates: dict, option=None):
+        self._stage("update", reference, field_updates, False, option)
+        return self
+
+    def delete(self, reference, option=None):
+        self._stage("delete", reference, None, False, option)
+        return self
+
+
+class _BaseTransaction(_BaseWriteBatch):
+    """Интерфейс, которого ждут google.cloud.firestore transactional/async_transactional."""
+
+    def __init__(self, client, max_attempts: int = 5, read_only: bool = False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id: Optional[bytes] = None
+        self._read_versions: dict[str, int] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    @property
+    def id(self) -> Optional[bytes]:
+        return self._id
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    def _check_read(self, client) -> None:
+        if client is not self._client:
+            raise ValueError("Чтение в транзакции через другой клиент пула")
+        if self._id is None:
+            raise ValueError("Transaction not in progress, cannot be used in API requests.")
+        if self._writes:
+            raise ValueError("Attempted read after write in a transaction.")
+
+    def _start(self) -> None:
+        if self._id is not None:
+            raise ValueError("Transaction already in progress, cannot be begun again.")
+        self._id = uuid.uuid4().bytes
+
+    def _finish(self) -> list[WriteResult]:
+        if self._id is None:
+            raise ValueError("Transaction not in progress, cannot be committed.")
+        if self._read_only and self._writes:
+            raise ValueError("Cannot perform write operation in read-only transaction.")
+        try:
+            return self._client._store._commit(self._writes, self._read_versions)
+        finally:
+            self._clean_up()
+
+
+class _BaseClient:
+    _document_class = None
+    _collection_class = None
+    _query_class = None
+    _batch_class = None
+    _transaction_class = None
+
+    def __init__(self, store: Optional[FakeStore] = None, project: str = "fake-project"):
+        self._store = store if store is not None else FakeStore()
+        self.project = project
+
+    @property
+    def store(self) -> FakeStore:
+        return self._store
+
+    def collection(self, *collection_path: str):
+        path = _join(*collection_path)
+        if path.count("/") % 2:
+            raise ValueError(f"Путь коллекции должен иметь нечётное число сегментов: {path}")
+        return self._collection_class(self, path)
+
+    def document(self, *document_path: str):
+        path = _join(*document_path)
+        if not path.count("/") % 2:
+            raise ValueError(f"Путь документа должен иметь чётное число сегментов: {path}")
+        return self._document_class(self, path)
+
+    def collection_group(self, collection_id: str):
+        if "/" in collection_id:
+            raise ValueError(f"collection_id не может содержать '/': {collection_id}")
+        return self._query_class(self, group_id=collection_id)
+
+    def batch(self):
+        return self._batch_class(self)
+
+    @staticmethod
+    def write_option(**kwargs) -> "WriteOption":
+        """Условие записи, как у Client.write_option: ровно один из last_update_time / exists."""
+        if len(kwargs) != 1 or not set(kwargs) <= {"last_update_time", "exists"}:
+            raise TypeError(f"write_option принимает ровно один аргумент last_update_time или exists: {kwargs}")
+        return WriteOption(**kwargs)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False):
+        return self._transaction_class(self, max_attempts=max_attempts, read_only=read_only)
+
+    def _get_all(self, references, field_paths=None, transaction=None) -> list[FakeDocumentSnapshot]:
+        return [ref._snapshot(field_paths, transaction) for ref in references]
+
+    def close(self) -> None:
+        pass
+
+
+# --- синхронный клиент ---
+
+def _wait(store: FakeStore, op: str) -> None:
+    delay = store._rpc(op)
+    if delay > 0:
+        time.sleep(delay)
+
+
+class FakeDocumentReference(_BaseDocumentReference):
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None) -> FakeDocumentSnapshot:
+        _wait(self._client._store, "get")
+        return self._snapshot(field_paths, transaction)
+
+    def create(self, document_data: dict, retry=None, timeout=None) -> WriteResult:
+        _wait(self._client._store, "commit")
+        return self._write("create", document_data)
+
+    def set(self, document_data: dict, merge=False, retry=None, timeout=None) -> WriteResult:
+        _wait(self._client._store, "commit")
+        return self._write("set", document_data, merge)
+
+    def update(self, field_updates: dict, option=None, retry=None, timeout=None) -> WriteResult:
+        _wait(self._client._store, "commit")
+        return self._write("update", field_updates, option=option)
+
+    def delete(self, option=None, retry=None, timeout=None) -> WriteResult:
+        _wait(self._client._store, "commit")
+        return self._write("delete", option=option)
+
+    def on_snapshot(self, callback) -> FakeWatch:
+        self._client._store._rpc("listen")
+        return self._client._store._add_listener(_Listener(self._client, self._path, False, callback))
+
+
+class FakeQuery(_BaseQuery):
+    def stream(self, transaction=None, retry=None, timeout=None):
+        _wait(self._client._store, "run_query")
+        yield from self._run(transaction)
+
+    def get(self, transaction=None, retry=None, timeout=None) -> list[FakeDocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+
+class FakeCollectionReference(_BaseCollectionReference):
+    def add(self, document_data: dict, document_id: Optional[str] = None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        return ref.create(document_data), ref
+
+    def on_snapshot(self, callback) -> FakeWatch:
+        self._client._store._rpc("listen")
+        return self._client._store._add_listener(_Listener(self._client, self._path, True, callback))
+
+
+class FakeWriteBatch(_BaseWriteBatch):
+    def commit(self, retry=None, timeout=None) -> list[WriteResult]:
+        _wait(self._client._store, "commit")
+        writes, self._writes = self._writes, []
+        return self._client._store._commit(writes)
+
+
+class FakeTransaction(_BaseTransaction):
+    def _begin(self, retry_id=None) -> None:
+        self._start()
+        _wait(self._client._store, "begin_transaction")
+
+    def _rollback(self) -> None:
+        if self._id is not None:
+            _wait(self._client._store, "rollback")
+        self._clean_up()
+
+    def _commit(self) -> list[WriteResult]:
+        _wait(self._client._store, "commit")
+        return self._finish()
+
+    def get(self, ref_or_query, field_paths=None, retry=None, timeout=None):
+        if isinstance(ref_or_query, _BaseDocumentReference):
+            return ref_or_query.get(field_paths=field_paths, transaction=self)
+        return ref_or_query.stream(transaction=self)
+
+
+class FakeClient(_BaseClient):
+    """Синхронный клиент — замена firestore.Client."""
+    _document_class = FakeDocumentReference
+    _collection_class = FakeCollectionReference
+    _query_class = FakeQuery
+    _batch_class = FakeWriteBatch
+    _transaction_class = FakeTransaction
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        references = list(references)
+        _wait(self._store, "batch_get")
+        yield from self._get_all(references, field_paths, transaction)
+
+
+# --- асинхронный клиент ---
+
+async def _await(store: FakeStore, op: str) -> None:
+    # Даже без задержки отдаём управление loop — как настоящий await сетевого вызова
+    await asyncio.sleep(store._rpc(op))
+
+
+class FakeAsyncDocumentReference(_BaseDocumentReference):
+    async def get(self, field_paths=None, transaction=None, retry=None, timeout=None) -> FakeDocumentSnapshot:
+        await _await(self._client._store, "get")
+        return self._snapshot(field_paths, transaction)
+
+    async def create(self, document_data: dict, retry=None, timeout=None) -> WriteResult:
+        await _await(self._client._store, "commit")
+        return self._write("create", document_data)
+
+    async def set(self, document_data: dict, merge=False, retry=None, timeout=None) -> WriteResult:
+        await _await(self._client._store, "commit")
+        return self._write("set", document_data, merge)
+
+    async def update(self, field_updates: dict, option=None, retry=None, timeout=None) -> WriteResult:
+        await _await(self._client._store, "commit")
+        return self._write("update", field_updates, option=option)
+
+    async def delete(self, option=None, retry=None, timeout=None) -> WriteResult:
+        await _await(self._client._store, "commit")
+        return self._write("delete", option=option)
+
+
+class FakeAsyncQuery(_BaseQuery):
+    async def stream(self, transaction=None, retry=None, timeout=None):
+        await _await(self._client._store, "run_query")
+        for snap in self._run(transaction):
+            yield snap
+
+    async def get(self, transaction=None, retry=None, timeout=None) -> list[FakeDocumentSnapshot]:
+        return [snap async for snap in self.stream(transaction=transaction)]
+
+
+class FakeAsyncCollectionReference(_BaseCollectionReference):
+    async def add(self, document_data: dict, document_id: Optional[str] = None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        return await ref.create(document_data), ref
+
+
+class FakeAsyncWriteBatch(_BaseWriteBatch):
+    async def commit(self, retry=None, timeout=None) -> list[WriteResult]:
+        await _await(self._client._store, "commit")
+        writes, self._writes = self._writes, []
+        return self._client._store._commit(writes)
+
+
+class FakeAsyncTransaction(_BaseTransaction):
+    async def _begin(self, retry_id=None) -> None:
+        self._start()
+        await _await(self._client._store, "begin_transaction")
+
+    async def _rollback(self) -> None:
+        if self._id is not None:
+            await _await(self._client._store, "rollback")
+        self._clean_up()
+
+    async def _commit(self) -> list[WriteResult]:
+        await _await(self._client._store, "commit")
+        return self._finish()
+
+    async def get(self, ref_or_query, field_paths=None, retry=None, timeout=None):
+        if isinstance(ref_or_query, _BaseDocumentReference):
+            return await ref_or_query.get(field_paths=field_paths, transaction=self)
+        return ref_or_query.stream(transaction=self)
+
+
+class FakeAsyncClient(_BaseClient):
+    """Асинхронный клиент — замена firestore_async.AsyncClient."""
+    _document_class = FakeAsyncDocumentReference
+    _collection_class = FakeAsyncCollectionReference
+    _query_class = FakeAsyncQuery
+    _batch_class = FakeAsyncWriteBatch
+    _transaction_class = FakeAsyncTransaction
+
+    async def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        references = list(references)
+        await _await(self._store, "batch_get")
+        for snap in self._get_all(references, field_paths, transaction):
+            yield snap
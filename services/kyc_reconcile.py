@@ -0,0 +1,120 @@
+# filename: services/kyc_reconcile.py
+import time
+import asyncio
+import logging
+
+from firebase_admin import firestore
+
+from services import bybit_service, blofin_service, bingx_service
+from services.firebase_service import get_db_client
+
+logger = logging.getLogger(__name__)
+
+# Лимит Firestore на количество операций в одном batch
+BATCH_SIZE = 500
+
+
+def _bybit_kyc(kyc: bool):
+    return "KYC" if kyc else "No KYC"
+
+
+def _kyc_or_absent(kyc: bool):
+    # BloFin/BingX при привязке пишут поле только для прошедших KYC
+    return "KYC" if kyc else None
+
+
+# exchange -> (полная синхронизация, индекс, поле UID, поле KYC, значение поля KYC)
+EXCHANGES = {
+    "bybit": (bybit_service.sync_referral_index, bybit_service.referral_index, "bybit_uid", "bybit_kyc", _bybit_kyc),
+    "blofin": (blofin_service.sync_invitees, blofin_service.invitee_index, "blofin_uid", "blofin_kyc", _kyc_or_absent),
+    "bingx": (bingx_service.sync_invite_mirror, bingx_service.invite_mirror, "bingx_uid", "bingx_kyc", _kyc_or_absent),
+}
+
+
+def _plan_updates(exchanges: list[str]) -> tuple[list[tuple], dict]:
+    """
+    Один проход по telegram_users (только UID/KYC-поля) и join с индексами в памяти.
+    Возвращает список (ссылка на документ, изменённые поля) и статистику по биржам.
+    """
+    db = get_db_client()
+    fields = [f for name in exchanges for f in EXCHANGES[name][2:4]]
+    stats = {name: {"linked": 0, "not_in_list": 0, "changed": 0} for name in exchanges}
+    updates = []
+
+    for snap in db.collection("telegram_users").select(fields).stream():
+        data = snap.to_dict() or {}
+        changes = {}
+        for name in exchanges:
+            _, index, uid_field, kyc_field, kyc_value = EXCHANGES[name]
+            uid = data.get(uid_field)
+            if not uid:
+                continue
+            stats[name]["linked"] += 1
+            record = index.get(uid)
+            if record is None:
+                # Пропавший из списка UID — не повод трогать KYC
+                stats[name]["not_in_list"] += 1
+                continue
+            new_value = kyc_value(record.kyc)
+            if data.get(kyc_field) != new_value:
+                changes[kyc_field] = firestore.DELETE_FIELD if new_value is None else new_value
+                stats[name]["changed"] += 1
+        if changes:
+            updates.append((snap.reference, changes))
+    return updates, stats
+
+
+def _commit_updates(updates: list[tuple]) -> None:
+    db = get_db_client()
+    for start in range(0, len(updates), BATCH_SIZE):
+        batch = db.batch()
+        for ref, changes in updates[start:start + BATCH_SIZE]:
+            batch.update(ref, changes)
+        batch.commit()
+
+
+async def reconcile_kyc(exchanges: list[str] | None = None, dry_run: bool = False) -> dict:
+    """
+    Сверка KYC-полей telegram_users со списками рефералов бирж.
+
+    Каждый список читается один раз (полная синхронизация индекса), затем
+    все пользователи с привязанным UID сверяются с индексом в памяти, и
+    изменённые поля пишутся пакетами по BATCH_SIZE. Время работы — один проход
+    по списку биржи плюс один проход по пользователям, без запросов на каждого.
+    """
+    started = time.monotonic()
+    exchanges = exchanges or list(EXCHANGES)
+
+    ready = []
+    for name in exchanges:
+        sync_fn, index = EXCHANGES[name][:2]
+        try:
+            await sync_fn(full=True)
+        except Exception as e:
+            logger.exception(f"[KYC_RECONCILE] ❌ Не удалось прочитать список {name}: {e}")
+            continue
+        if not index.is_warm:
+            # Без полного списка нельзя отличить «нет KYC» от «не прочитали»
+            logger.warning(f"[KYC_RECONCILE] ⚠️ {name}: индекс не заполнен, биржа пропущена")
+            continue
+        ready.append(name)
+
+    if not ready:
+        return {"status": "error", "message": "NO_EXCHANGE_DATA"}
+
+    updates, stats = await asyncio.to_thread(_plan_updates, ready)
+    if not dry_run:
+        await asyncio.to_thread(_commit_updates, updates)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"[KYC_RECONCILE] ✅ {'(dry-run) ' if dry_run else ''}Документов к обновлению: {len(updates)} "
+        f"за {elapsed:.1f} c | {stats}"
+    )
+    return {
+        "status": "success",
+        "dry_run": dry_run,
+        "documents_updated": len(updates),
+        "exchanges": stats,
+        "elapsed_sec": round(elapsed, 2),
+    }
@@ -0,0 +1,164 @@
+# filename: services/loop_monitor.py
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Включается явно: watchdog снимает стеки потока loop (пути и строки кода)
+ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "0") == "1"
+INTERVAL_SEC = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+BLOCK_THRESHOLD_SEC = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+MAX_SAMPLES = int(os.getenv("LOOP_MONITOR_MAX_SAMPLES", "50"))
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopMonitor:
+    """
+    Измеряет задержку event loop и ловит блокирующие вызовы.
+
+    Корутина-heartbeat спит INTERVAL_SEC и замеряет, насколько позже срока
+    проснулась — это лаг loop. Отдельный поток-watchdog следит за heartbeat:
+    если он не отмечался дольше BLOCK_THRESHOLD_SEC, loop кем-то занят, и
+    watchdog снимает стек потока loop. По стеку определяется роут (кадр из
+    routers/) и функция сервиса (ближайший к месту блокировки кадр из services/).
+    """
+
+    def __init__(self):
+        self.lags: deque[float] = deque(maxlen=1000)
+        self.max_lag_sec = 0.0
+        self.beats = 0
+        self.blocks: deque[dict] = deque(maxlen=MAX_SAMPLES)
+        self.block_counts: Counter = Counter()  # (route, service) -> сколько раз блокировали loop
+        self.routes: dict[tuple[str, str], str] = {}  # (модуль, функция) -> путь роута
+
+        self._last_beat = time.monotonic()
+        self._beat_id = 0
+        self._sampled_beat_id = -1
+        self._pending: Optional[dict] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def register_routes(self, app) -> None:
+        """Запоминает, какому пути соответствует функция-эндпоинт."""
+        for route in app.routes:
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is not None:
+                self.routes[(endpoint.__module__, endpoint.__name__)] = getattr(route, "path", "")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(INTERVAL_SEC)
+            now = time.monotonic()
+            lag = max(0.0, now - started - INTERVAL_SEC)
+            self.lags.append(lag)
+            self.max_lag_sec = max(self.max_lag_sec, lag)
+            self.beats += 1
+            if self._pending is not None:
+                # Loop освободился — теперь известна полная длительность блокировки
+                self._pending["blocked_ms"] = round(lag * 1000, 1)
+                self._pending = None
+            self._last_beat = now
+            self._beat_id += 1
+
+    def _watch(self) -> None:
+        while not self._stop.wait(BLOCK_THRESHOLD_SEC / 4):
+            stalled = time.monotonic() - self._last_beat - INTERVAL_SEC
+            if stalled < BLOCK_THRESHOLD_SEC or self._sampled_beat_id == self._beat_id:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._sampled_beat_id = self._beat_id
+            self._record_block(traceback.extract_stack(frame), stalled)
+
+    def _record_block(self, stack: traceback.StackSummary, stalled: float) -> None:
+        route = service = None
+        frames = []
+        for entry in stack:
+            path = os.path.relpath(entry.filename, _PROJECT_ROOT)
+            if path.startswith(".."):
+                continue
+            frames.append(f"{path}:{entry.lineno} {entry.name}")
+            module = path[:-3].replace(os.sep, ".")
+            if path.startswith("routers" + os.sep) and route is None:
+                route = self.routes.get((module, entry.name), f"{module}.{entry.name}")
+            elif path.startswith("services" + os.sep):
+                service = f"{module}.{entry.name}"
+        # Самый глубокий кадр — где именно висит loop (в т.ч. внутри библиотек)
+        blocking_at = f"{stack[-1].filename}:{stack[-1].lineno} {stack[-1].name}" if stack else None
+
+        sample = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blocked_ms": round(stalled * 1000, 1),
+            "route": route,
+            "service": service,
+            "blocking_at": blocking_at,
+            "stack": frames[-15:],
+        }
+        self.blocks.append(sample)
+        self._pending = sample
+        self.block_counts[(route, service)] += 1
+        logger.warning(
+            f"[LOOP_MONITOR] 🐢 Event loop заблокирован ≥{sample['blocked_ms']} мс | "
+            f"роут: {route} | сервис: {service} | {blocking_at}"
+        )
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            f"[LOOP_MONITOR] ▶️ Мониторинг event loop: шаг {INTERVAL_SEC * 1000:.0f} мс, "
+            f"порог блокировки {BLOCK_THRESHOLD_SEC * 1000:.0f} мс"
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        lags = sorted(self.lags)
+
+        def pct(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(p / 100 * len(lags)))] * 1000, 2) if lags else 0.0
+
+        return {
+            "enabled": self._task is not None,
+            "interval_ms": INTERVAL_SEC * 1000,
+            "block_threshold_ms": BLOCK_THRESHOLD_SEC * 1000,
+            "beats": self.beats,
+            "lag_p50_ms": pct(50),
+            "lag_p99_ms": pct(99),
+            "lag_max_ms": round(self.max_lag_sec * 1000, 2),
+            "blocks_total": sum(self.block_counts.values()),
+            "blocks_by_code_path": [
+                {"route": route, "service": service, "count": count}
+                for (route, service), count in self.block_counts.most_common()
+            ],
+        }
+
+    def recent_blocks(self) -> list[dict]:
+        return list(reversed(self.blocks))
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,58 @@
+# filename: services/negative_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class NegativeCache:
+    """
+    Ограниченный кэш отрицательных ответов (exchange, uid) с коротким TTL.
+
+    Повторная попытка привязать uid, которого нет среди рефералов, в течение TTL
+    отвечает ERROR_NOT_FOUND без единого запроса к бирже. Запись удаляется,
+    как только синхронизация индекса биржи увидит этот uid.
+    """
+
+    def __init__(self, maxsize: int, ttl_sec: float):
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def contains(self, exchange: str, uid: str) -> bool:
+        key = (exchange, str(uid))
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                self.misses += 1
+                return False
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, exchange: str, uid: str) -> None:
+        key = (exchange, str(uid))
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl_sec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, exchange: str, uid: str) -> None:
+        with self._lock:
+            self._entries.pop((exchange, str(uid)), None)
+
+
+negative_cache = NegativeCache(
+    maxsize=int(os.getenv("REFERRAL_NEGATIVE_CACHE_MAX", "10000")),
+    ttl_sec=float(os.getenv("REFERRAL_NEGATIVE_CACHE_TTL_SEC", "60")),
+)
@@ -0,0 +1,164 @@
+# filename: services/rate_limiter.py
+import os
+import time
+import asyncio
+import logging
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Заголовки, в которых биржи сообщают остаток квоты: (remaining, limit, reset)
+RATE_LIMIT_HEADERS = {
+    "bybit": ("X-Bapi-Limit-Status", "X-Bapi-Limit", "X-Bapi-Limit-Reset-Timestamp"),
+    "bingx": ("X-RateLimit-Requests-Remain", None, "X-RateLimit-Requests-Expire"),
+    "blofin": ("X-RateLimit-Remaining", "X-RateLimit-Limit", "X-RateLimit-Reset"),
+}
+
+_limiters: dict[str, "RateLimiter"] = {}
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket перед запросами одной биржи.
+
+    Каждый эндпоинт расходует свой вес токенов. Запросы, которым не хватило
+    токенов, встают в очередь (FIFO) и ждут пополнения, а не падают.
+    Остаток квоты из заголовков ответа и 429/Retry-After уменьшают бюджет,
+    чтобы общий с другими репликами и скриптами ключ не упирался в лимит биржи.
+    """
+
+    def __init__(
+        self,
+        exchange: str,
+        *,
+        rate_per_sec: float,
+        burst: float,
+        weights: Mapping[str, float] | None = None,
+        rate_limit_codes: tuple = (),
+    ):
+        self.exchange = exchange
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.weights = dict(weights or {})
+        self.rate_limit_codes = {str(code) for code in rate_limit_codes}
+        self._header_names = RATE_LIMIT_HEADERS.get(exchange, (None, None, None))
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._queue_lock = asyncio.Lock()
+
+        # Метрики
+        self.queued = 0
+        self.requests = 0
+        self.throttled = 0
+        self.wait_total_sec = 0.0
+        self.wait_max_sec = 0.0
+        self.reported_remaining: Optional[float] = None
+        self.reported_limit: Optional[float] = None
+        _limiters[exchange] = self
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    async def acquire(self, path: str) -> None:
+        """Ждёт, пока в ведре хватит токенов на вес эндпоинта."""
+        weight = self.weights.get(path, 1.0)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            async with self._queue_lock:
+                while True:
+                    self._refill()
+                    delay = self._blocked_until - time.monotonic()
+                    if delay <= 0 and self._tokens >= weight:
+                        self._tokens -= weight
+                        break
+                    if delay <= 0:
+                        delay = (weight - self._tokens) / self.rate_per_sec
+                    await asyncio.sleep(delay)
+        finally:
+            self.queued -= 1
+            waited = time.monotonic() - started
+            self.requests += 1
+            self.wait_total_sec += waited
+            self.wait_max_sec = max(self.wait_max_sec, waited)
+
+    def observe(self, status_code: int, headers: Mapping[str, str], body_code=None) -> bool:
+        """
+        Учитывает ответ биржи. Возвращает True, если запрос упёрся в лимит
+        и его нужно повторить после ожидания.
+        """
+        remaining_name, limit_name, reset_name = self._header_names
+        remaining = _to_float(headers.get(remaining_name)) if remaining_name else None
+        if limit_name:
+            self.reported_limit = _to_float(headers.get(limit_name)) or self.reported_limit
+        if remaining is not None:
+            self.reported_remaining = remaining
+            # Биржа видит и чужие запросы по тому же ключу — доверяем её остатку
+            self._refill()
+            self._tokens = min(self._tokens, remaining)
+
+        throttled = status_code == 429 or (body_code is not None and str(body_code) in self.rate_limit_codes)
+        if throttled or remaining == 0:
+            self._block(headers, reset_name)
+        if throttled:
+            self.throttled += 1
+            logger.warning(f"[RATE_LIMIT] ⏳ {self.exchange}: лимит биржи, запрос поставлен в очередь повторно")
+        return throttled
+
+    def _block(self, headers: Mapping[str, str], reset_name: Optional[str]) -> None:
+        retry_after = _to_float(headers.get("Retry-After"))
+        if retry_after is None and reset_name:
+            reset = _to_float(headers.get(reset_name))
+            if reset is not None:
+                # Абсолютное время (мс/с epoch) или относительное в секундах
+                if reset > 10**11:
+                    retry_after = reset / 1000 - time.time()
+                elif reset > 10**9:
+                    retry_after = reset - time.time()
+                else:
+                    retry_after = reset
+        if retry_after is None:
+            retry_after = 1 / self.rate_per_sec
+        self._blocked_until = max(self._blocked_until, time.monotonic() + max(0.0, retry_after))
+
+    def snapshot(self) -> dict:
+        self._refill()
+        return {
+            "tokens_available": round(self._tokens, 2),
+            "rate_per_sec": self.rate_per_sec,
+            "burst": self.burst,
+            "reported_remaining": self.reported_remaining,
+            "reported_limit": self.reported_limit,
+            "blocked_for_sec": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+            "queued": self.queued,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "wait_avg_sec": round(self.wait_total_sec / self.requests, 4) if self.requests else 0.0,
+            "wait_max_sec": round(self.wait_max_sec, 4),
+        }
+
+
+def rate_limiter_from_env(exchange: str, *, rate_per_sec: float, burst: float, **kwargs) -> RateLimiter:
+    """Лимитер с параметрами из env: {EXCHANGE}_RATE_PER_SEC, {EXCHANGE}_RATE_BURST."""
+    prefix = exchange.upper()
+    return RateLimiter(
+        exchange,
+        rate_per_sec=float(os.getenv(f"{prefix}_RATE_PER_SEC", rate_per_sec)),
+        burst=float(os.getenv(f"{prefix}_RATE_BURST", burst)),
+        **kwargs,
+    )
+
+
+def rate_limit_metrics() -> dict:
+    return {name: limiter.snapshot() for name, limiter in _limiters.items()}
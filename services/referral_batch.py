@@ -0,0 +1,63 @@
+# filename: services/referral_batch.py
+import os
+import asyncio
+import logging
+from collections import defaultdict
+
+from services import bybit_service, blofin_service, bingx_service
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv("REFERRAL_BATCH_MAX_ITEMS", "1000"))
+
+# exchange -> (пакетный поиск, индекс биржи)
+EXCHANGES = {
+    "bybit": (bybit_service.lookup_referrals_many, bybit_service.referral_index),
+    "blofin": (blofin_service.lookup_referrals_many, blofin_service.invitee_index),
+    "bingx": (bingx_service.lookup_referrals_many, bingx_service.invite_mirror),
+}
+
+
+async def _check_exchange(exchange: str, uids: list[str]) -> dict[str, dict]:
+    lookup_many, index = EXCHANGES[exchange]
+    try:
+        records = await lookup_many(uids)
+        error = None
+    except Exception as e:
+        # Биржа недоступна — отвечаем тем, что уже есть в индексе, остальным ошибка
+        logger.exception(f"[REFERRAL_BATCH] ❌ Ошибка поиска на {exchange}: {e}")
+        records = {uid: index.get(uid) for uid in uids}
+        error = "EXCHANGE_ERROR"
+
+    results = {}
+    for uid in uids:
+        record = records.get(uid)
+        if record is not None:
+            results[uid] = {"found": True, "kyc": record.kyc, "synced_at": index.synced_at_iso}
+        elif error:
+            results[uid] = {"found": None, "error": error, "synced_at": index.synced_at_iso}
+        else:
+            results[uid] = {"found": False, "kyc": None, "synced_at": index.synced_at_iso}
+    return results
+
+
+async def check_referrals_batch(items: list[tuple[str, str]]) -> list[dict]:
+    """
+    Проверяет пары (exchange, uid) пакетом.
+
+    Uid группируются по бирже, и на каждую биржу делается один общий поиск:
+    попадания отвечаются из индекса, все промахи разом проверяются одним проходом
+    по страницам. 500 uid стоят столько же запросов к бирже, сколько один.
+    Результаты возвращаются в порядке входных пар.
+    """
+    by_exchange: dict[str, list[str]] = defaultdict(list)
+    for exchange, uid in items:
+        by_exchange[exchange].append(str(uid))
+
+    exchanges = list(by_exchange)
+    per_exchange = await asyncio.gather(*(_check_exchange(ex, by_exchange[ex]) for ex in exchanges))
+    resolved = dict(zip(exchanges, per_exchange))
+
+    found = sum(1 for ex in resolved.values() for r in ex.values() if r.get("found"))
+    logger.info(f"[REFERRAL_BATCH] Проверено пар: {len(items)}, найдено: {found}")
+    return [{"exchange": exchange, "uid": str(uid), **resolved[exchange][str(uid)]} for exchange, uid in items]
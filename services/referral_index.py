@@ -0,0 +1,116 @@
+# filename: services/referral_index.py
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional
+
+from services.negative_cache import negative_cache
+
+
+class ReferralRecord(NamedTuple):
+    uid: str
+    kyc: bool
+    registered_at: Optional[int]  # unix-время регистрации (сек), None — биржа не отдала
+
+
+def parse_register_time(value) -> Optional[int]:
+    """
+    Приводит время регистрации из ответа биржи к unix-секундам.
+    Понимает миллисекунды (число или строка), 'YYYY-MM-DD' и 'YYYY-MM-DD HH:MM:SS'.
+    """
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        ts = int(value)
+        return ts // 1000 if ts > 10**11 else ts
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            dt = datetime.strptime(str(value)[:19], fmt).replace(tzinfo=timezone.utc)
+            return int(dt.timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def _pack(kyc: bool, registered_at: Optional[int]) -> int:
+    return ((registered_at or 0) << 1) | (1 if kyc else 0)
+
+
+class ReferralIndex:
+    """
+    Компактный in-memory индекс рефералов одной биржи.
+
+    Вместо dict на каждого реферала храним одно целое число:
+    (время регистрации в секундах << 1) | флаг KYC.
+    Поиск по uid — одно обращение к словарю.
+    """
+
+    def __init__(self, exchange: str):
+        self.exchange = exchange
+        self._rows: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.synced_at: Optional[float] = None       # последний успешный sync (любой)
+        self.full_synced_at: Optional[float] = None  # последний полный проход по списку
+        # Курсор синхронизации конкретной биржи (страница, total и т.п.)
+        self.sync_state: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, uid) -> bool:
+        return str(uid) in self._rows
+
+    @property
+    def is_warm(self) -> bool:
+        """Индекс хотя бы раз заполнен полным проходом."""
+        return self.full_synced_at is not None
+
+    @property
+    def synced_at_iso(self) -> Optional[str]:
+        """Время последней синхронизации в ISO 8601 (UTC) — для ответов API."""
+        if self.synced_at is None:
+            return None
+        return datetime.fromtimestamp(self.synced_at, tz=timezone.utc).isoformat()
+
+    def get(self, uid) -> Optional[ReferralRecord]:
+        uid = str(uid)
+        packed = self._rows.get(uid)
+        if packed is None:
+            return None
+        registered_at = packed >> 1
+        return ReferralRecord(uid, bool(packed & 1), registered_at or None)
+
+    def upsert_many(self, rows: Iterable[tuple]) -> int:
+        """
+        Добавляет/обновляет записи (uid, kyc, registered_at).
+        Возвращает количество новых uid.
+        """
+        added = 0
+        with self._lock:
+            for uid, kyc, registered_at in rows:
+                uid = str(uid)
+                if uid not in self._rows:
+                    added += 1
+                    # uid появился в списке — отрицательный ответ по нему больше не актуален
+                    negative_cache.discard(self.exchange, uid)
+                self._rows[uid] = _pack(kyc, registered_at)
+        return added
+
+    def export_rows(self) -> list[tuple[str, int]]:
+        """Копия упакованных строк (uid, packed) — для снимка на диск."""
+        with self._lock:
+            return list(self._rows.items())
+
+    def restore(self, rows: Iterable[tuple[str, int]], synced_at, full_synced_at, sync_state: dict) -> None:
+        """Заполняет пустой индекс из снимка; свежие данные биржи потом доливаются sync-ом."""
+        with self._lock:
+            self._rows.update((str(uid), int(packed)) for uid, packed in rows)
+        self.synced_at = synced_at
+        self.full_synced_at = full_synced_at
+        self.sync_state.update(sync_state)
+
+    def mark_synced(self, full: bool) -> None:
+        now = time.time()
+        self.synced_at = now
+        if full:
+            self.full_synced_at = now
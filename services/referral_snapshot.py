@@ -0,0 +1,137 @@
+# filename: services/referral_snapshot.py
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+
+from services.referral_index import ReferralIndex
+
+logger = logging.getLogger(__name__)
+
+# На Railway файл стоит держать на volume — иначе деплой начнёт с пустого снимка
+SNAPSHOT_PATH = os.getenv(
+    "REFERRAL_SNAPSHOT_PATH",
+    os.path.join(os.getenv("RAILWAY_VOLUME_MOUNT_PATH", "/tmp"), "referral_snapshot.sqlite3"),
+)
+# Без явного пути и volume снимок лежит в /tmp и не переживает редеплой
+SNAPSHOT_EPHEMERAL = not (os.getenv("REFERRAL_SNAPSHOT_PATH") or os.getenv("RAILWAY_VOLUME_MOUNT_PATH"))
+SNAPSHOT_INTERVAL_SEC = int(os.getenv("REFERRAL_SNAPSHOT_SEC", "300"))
+# Формат упаковки строк в ReferralIndex; при его смене старые снимки игнорируются
+SNAPSHOT_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    exchange TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    synced_at REAL,
+    full_synced_at REAL,
+    sync_state TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS referrals (
+    exchange TEXT NOT NULL,
+    uid TEXT NOT NULL,
+    packed INTEGER NOT NULL,
+    PRIMARY KEY (exchange, uid)
+) WITHOUT ROWID;
+"""
+
+
+def _write_snapshot(indexes: list[ReferralIndex], path: str) -> int:
+    """
+    Пишет снимок во временный файл и атомарно подменяет им старый:
+    упавший на середине процесс не оставит битый снимок.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    rows_total = 0
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + _SCHEMA)
+        now = time.time()
+        for index in indexes:
+            rows = index.export_rows()
+            conn.execute(
+                "INSERT INTO meta VALUES (?, ?, ?, ?, ?, ?)",
+                (index.exchange, SNAPSHOT_VERSION, index.synced_at, index.full_synced_at,
+                 json.dumps(index.sync_state, default=str), now),
+            )
+            conn.executemany(
+                "INSERT INTO referrals VALUES (?, ?, ?)",
+                ((index.exchange, uid, packed) for uid, packed in rows),
+            )
+            rows_total += len(rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return rows_total
+
+
+def _read_snapshot(indexes: list[ReferralIndex], path: str) -> int:
+    if not os.path.exists(path):
+        logger.info(f"[SNAPSHOT] Снимок {path} не найден — индексы стартуют пустыми")
+        return 0
+    rows_total = 0
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for index in indexes:
+            meta = conn.execute(
+                "SELECT version, synced_at, full_synced_at, sync_state FROM meta WHERE exchange = ?",
+                (index.exchange,),
+            ).fetchone()
+            if meta is None or meta[0] != SNAPSHOT_VERSION:
+                continue
+            rows = conn.execute(
+                "SELECT uid, packed FROM referrals WHERE exchange = ?", (index.exchange,)
+            ).fetchall()
+            index.restore(rows, meta[1], meta[2], json.loads(meta[3]))
+            rows_total += len(rows)
+            logger.info(f"[SNAPSHOT] {index.exchange}: загружено {len(rows)} рефералов (sync {index.synced_at_iso})")
+    finally:
+        conn.close()
+    return rows_total
+
+
+async def load_referral_snapshot(indexes: list[ReferralIndex], path: str = SNAPSHOT_PATH) -> int:
+    """Загружает снимок в индексы. Вызывается на startup до приёма запросов."""
+    if SNAPSHOT_EPHEMERAL and path == SNAPSHOT_PATH:
+        logger.warning(
+            f"[SNAPSHOT] ⚠️ Снимок пишется в {path}: не задан ни REFERRAL_SNAPSHOT_PATH, "
+            f"ни RAILWAY_VOLUME_MOUNT_PATH — после редеплоя индексы начнут с полного sync"
+        )
+    started = time.monotonic()
+    try:
+        rows = await asyncio.to_thread(_read_snapshot, indexes, path)
+    except (sqlite3.Error, ValueError) as e:
+        # Битый снимок не должен мешать старту — индексы наполнит обычный sync
+        logger.warning(f"[SNAPSHOT] ⚠️ Не удалось прочитать снимок {path}: {e}")
+        return 0
+    logger.info(f"[SNAPSHOT] ✅ Снимок загружен: {rows} строк за {(time.monotonic() - started) * 1000:.0f} мс")
+    return rows
+
+
+async def save_referral_snapshot(indexes: list[ReferralIndex], path: str = SNAPSHOT_PATH) -> int:
+    started = time.monotonic()
+    try:
+        rows = await asyncio.to_thread(_write_snapshot, indexes, path)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"[SNAPSHOT] ⚠️ Не удалось записать снимок {path}: {e}")
+        return 0
+    logger.info(f"[SNAPSHOT] 💾 Снимок записан: {rows} строк за {(time.monotonic() - started) * 1000:.0f} мс")
+    return rows
+
+
+async def snapshot_loop(indexes: list[ReferralIndex], interval: int = SNAPSHOT_INTERVAL_SEC) -> None:
+    """Периодически сохраняет снимок, если индексы изменились с прошлой записи."""
+    last_saved: dict[str, float | None] = {}
+    while True:
+        await asyncio.sleep(interval)
+        current = {index.exchange: index.synced_at for index in indexes}
+        if current != last_saved:
+            await save_referral_snapshot(indexes)
+            last_saved = current
@@ -0,0 +1,79 @@
+# filename: services/referral_sync.py
+import os
+import time
+import asyncio
+import logging
+
+from services import bybit_service, blofin_service, bingx_service
+from services.referral_snapshot import load_referral_snapshot, save_referral_snapshot, snapshot_loop
+from services.shared_referral_store import STORE_MODE, is_reader, is_writer, publish_index
+
+logger = logging.getLogger(__name__)
+
+# Интервалы фоновой синхронизации индексов рефералов (сек)
+BYBIT_SYNC_INTERVAL_SEC = int(os.getenv("BYBIT_REFERRAL_SYNC_SEC", "60"))
+# Полный проход нужен, чтобы подтянуть смену KYC у старых рефералов
+BYBIT_FULL_SYNC_INTERVAL_SEC = int(os.getenv("BYBIT_REFERRAL_FULL_SYNC_SEC", "3600"))
+BLOFIN_SYNC_INTERVAL_SEC = int(os.getenv("BLOFIN_INVITEES_SYNC_SEC", "60"))
+BLOFIN_FULL_SYNC_INTERVAL_SEC = int(os.getenv("BLOFIN_INVITEES_FULL_SYNC_SEC", "3600"))
+BINGX_SYNC_INTERVAL_SEC = int(os.getenv("BINGX_INVITES_SYNC_SEC", "60"))
+BINGX_FULL_SYNC_INTERVAL_SEC = int(os.getenv("BINGX_INVITES_FULL_SYNC_SEC", "3600"))
+
+_tasks: list[asyncio.Task] = []
+
+INDEXES = [bybit_service.referral_index, blofin_service.invitee_index, bingx_service.invite_mirror]
+
+
+async def restore_referral_indexes() -> None:
+    """Поднимает индексы из снимка на диске. Вызывается на startup до start_referral_sync."""
+    if is_reader():
+        # Reader не синхронизирует индексы — восстановленные из снимка KYC так бы и не обновились
+        logger.info("[REFERRAL_SYNC] Режим reader: снимок не загружается, поиск идёт в общий стор")
+        return
+    await load_referral_snapshot(INDEXES)
+
+
+async def _sync_loop(name: str, sync_fn, index, interval: int, full_interval: int) -> None:
+    """Бесконечный цикл: инкрементальный sync каждые interval, полный — раз в full_interval."""
+    while True:
+        full = index.full_synced_at is None or time.time() - index.full_synced_at >= full_interval
+        try:
+            await sync_fn(full)
+            if is_writer():
+                await publish_index(index)
+        except Exception as e:
+            logger.exception(f"[REFERRAL_SYNC] ❌ Ошибка синхронизации {name}: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_referral_sync() -> None:
+    """Запускает фоновые задачи синхронизации. Вызывается на startup приложения."""
+    if _tasks:
+        return
+    if is_reader():
+        # Индексы наполняет writer через общий стор Firestore — к биржам не ходим
+        logger.info("[REFERRAL_SYNC] Режим reader: фоновая синхронизация с биржами отключена")
+        return
+    loops = [
+        ("bybit", bybit_service.sync_referral_index, bybit_service.referral_index,
+         BYBIT_SYNC_INTERVAL_SEC, BYBIT_FULL_SYNC_INTERVAL_SEC),
+        ("blofin", blofin_service.sync_invitees, blofin_service.invitee_index,
+         BLOFIN_SYNC_INTERVAL_SEC, BLOFIN_FULL_SYNC_INTERVAL_SEC),
+        ("bingx", bingx_service.sync_invite_mirror, bingx_service.invite_mirror,
+         BINGX_SYNC_INTERVAL_SEC, BINGX_FULL_SYNC_INTERVAL_SEC),
+    ]
+    for name, sync_fn, index, interval, full_interval in loops:
+        _tasks.append(asyncio.create_task(_sync_loop(name, sync_fn, index, interval, full_interval)))
+    _tasks.append(asyncio.create_task(snapshot_loop(INDEXES)))
+    logger.info(f"[REFERRAL_SYNC] ▶️ Запущено фоновых синхронизаций: {len(_tasks)} (режим {STORE_MODE})")
+
+
+async def stop_referral_sync() -> None:
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    logger.info("[REFERRAL_SYNC] ⏹ Фоновые синхронизации остановлены")
+    # Последний снимок — чтобы следующий старт начал с актуальных данных
+    if not is_reader():
+        await save_referral_snapshot(INDEXES)
@@ -3,7 +3,7 @@ import logging
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 
-from firebase_admin import firestore
+from services import firestore_dal
 
 # Приоритет выбора бота по полям статуса в документе пользователя
 _STATUS_TO_BOT = [
@@ -11,6 +11,7 @@ _STATUS_TO_BOT = [
     ("status_tgbin", "binbot"),
     ("status_tgbyb", "bybbot"),
 ]
+_STATUS_FIELDS = tuple(field for field, _ in _STATUS_TO_BOT)
 
 # Шаблоны сообщений по коду sd
 SD_TEMPLATES: Dict[str, str] = {
@@ -35,8 +36,7 @@ def get_sd_text(sd_code: str) -> Optional[str]:
     return SD_TEMPLATES.get(sd_code)
 
 
-def create_message_doc(
-    db: firestore.Client,
+async def create_message_doc(
     telegram_id: str,
     bot_name: str,
     text: str,
@@ -46,7 +46,6 @@ def create_message_doc(
     Возвращает ID созданного документа.
     """
     now = datetime.now(timezone.utc)
-    doc_ref = db.collection("messages").document()  # auto-id
     payload: Dict[str, Any] = {
         "telegram_id": str(telegram_id),
         "status": "pending",
@@ -57,12 +56,10 @@ def create_message_doc(
             "buttons": [],  # без картинки и кнопок
         },
     }
-    doc_ref.set(payload)
-    return doc_ref.id
+    return await firestore_dal.add_message(payload)  # auto-id
 
 
-def process_sd_request(
-    db: firestore.Client,
+async def process_sd_request(
     telegram_id: str,
     sd_code: str,
 ) -> dict:
@@ -75,13 +72,10 @@ def process_sd_request(
         return {"status": "error", "message": f"Unsupported sd code: {sd_code}"}
 
     # 2) Документ пользователя
-    user_ref = db.collection("telegram_users").document(str(telegram_id))
-    snap = user_ref.get()
-    if not snap.exists:
+    user_data = await firestore_dal.get_user(telegram_id, fields=_STATUS_FIELDS)
+    if user_data is None:
         return {"status": "error", "message": "User not found", "telegram_id": str(telegram_id)}
 
-    user_data = snap.to_dict() or {}
-
     # 3) Определяем бот по приоритету
     bot_name = resolve_bot_for_user(user_data)
     if not bot_name:
@@ -89,7 +83,7 @@ def process_sd_request(
 
     # 4) Создаём сообщение для сендера
     try:
-        msg_id = create_message_doc(db, str(telegram_id), bot_name, text)
+        msg_id = await create_message_doc(str(telegram_id), bot_name, text)
         logging.info(f"[sd] created message {msg_id} for {telegram_id} via {bot_name} (sd={sd_code})")
         return {
             "status": "ok",
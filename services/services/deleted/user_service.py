@@ -3,6 +3,46 @@ import logging
 from datetime import datetime, timezone
 from config import get_db_client
 from firebase_admin import firestore
+from services import firestore_dal
+
+def _default_user_data(telegram_id: str) -> dict:
+    """Начальные значения всех полей пользователя."""
+    # --- Значения по умолчанию, как на скриншоте ---
+    now = datetime.now(timezone.utc)
+    return {
+        # Основные данные
+        "id": telegram_id,
+        "first_name": "",
+        "last_name": "",
+        "username": "",
+        "language_code": "",
+        "photo_url": "",
+        "created_at": now,
+        
+        # Финансовые данные
+        "balance_usdt": 0.0,
+        "bnb_wallet_address": "",
+        "ton_wallet_address": "",
+        
+        # Данные по биржам
+        "bybit_uid": "",
+        "bybit_kyc": "",
+        "bybit14days": False, # Предполагаю, что это тоже булево поле
+        "blofin_uid": "",
+        "blofin_kyc": "",
+        "blofin4days": False,
+        "blofin10days": False,
+        "bingx_uid": "",
+        "bingx_kyc": "",
+        "bingx4days": False,
+        "bingx14days": False,
+
+        # Прочие системные поля
+        "allows_write_to_pm": False, # Устанавливаем в False по умолчанию
+        "checkin_date": now,
+        "tradingview": ""
+    }
+
 
 def create_initial_user_record(telegram_id: str) -> dict:
     """
@@ -19,41 +59,7 @@ def create_initial_user_record(telegram_id: str) -> dict:
             logging.warning(f"[USER_SERVICE] Пользователь с ID {telegram_id} уже существует.")
             return {"status": "exists", "message": "User already exists."}
 
-        # --- Значения по умолчанию, как на скриншоте ---
-        now = datetime.now(timezone.utc)
-        default_data = {
-            # Основные данные
-            "id": telegram_id,
-            "first_name": "",
-            "last_name": "",
-            "username": "",
-            "language_code": "",
-            "photo_url": "",
-            "created_at": now,
-            
-            # Финансовые данные
-            "balance_usdt": 0.0,
-            "bnb_wallet_address": "",
-            "ton_wallet_address": "",
-            
-            # Данные по биржам
-            "bybit_uid": "",
-            "bybit_kyc": "",
-            "bybit14days": False, # Предполагаю, что это тоже булево поле
-            "blofin_uid": "",
-            "blofin_kyc": "",
-            "blofin4days": False,
-            "blofin10days": False,
-            "bingx_uid": "",
-            "bingx_kyc": "",
-            "bingx4days": False,
-            "bingx14days": False,
-
-            # Прочие системные поля
-            "allows_write_to_pm": False, # Устанавливаем в False по умолчанию
-            "checkin_date": now,
-            "tradingview": ""
-        }
+        default_data = _default_user_data(telegram_id)
 
         user_ref.set(default_data)
         logging.info(f"✅ [USER_SERVICE] Успешно создан новый пользователь с ID: {telegram_id}")
@@ -62,4 +68,21 @@ def create_initial_user_record(telegram_id: str) -> dict:
 
     except Exception as e:
         logging.exception(f"❌ [USER_SERVICE] Ошибка при создании пользователя {telegram_id}: {e}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+
+async def create_initial_user_record_async(telegram_id: str) -> dict:
+    """То же, что create_initial_user_record, через асинхронный клиент — для роутеров."""
+    try:
+        if await firestore_dal.get_user(telegram_id) is not None:
+            logging.warning(f"[USER_SERVICE] Пользователь с ID {telegram_id} уже существует.")
+            return {"status": "exists", "message": "User already exists."}
+
+        await firestore_dal.set_user(telegram_id, _default_user_data(telegram_id))
+        logging.info(f"✅ [USER_SERVICE] Успешно создан новый пользователь с ID: {telegram_id}")
+
+        return {"status": "success", "message": "User created successfully."}
+
+    except Exception as e:
+        logging.exception(f"❌ [USER_SERVICE] Ошибка при создании пользователя {telegram_id}: {e}")
+        return {"status": "error", "message": str(e)}
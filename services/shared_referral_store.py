@@ -0,0 +1,141 @@
+# filename: services/shared_referral_store.py
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from firebase_admin import firestore
+
+from services.firebase_service import get_db_client
+from services.negative_cache import negative_cache
+from services.referral_index import ReferralIndex, ReferralRecord
+from services.single_flight import SingleFlightLookup, SyncFn
+
+logger = logging.getLogger(__name__)
+
+# local  — каждая реплика сама синхронизирует индексы с биржами (по умолчанию)
+# writer — синхронизирует индексы и публикует их в общий стор Firestore
+# reader — к биржам не ходит, ищет uid точечным чтением общего стора
+STORE_MODE = os.getenv("REFERRAL_STORE_MODE", "local").lower()
+COLLECTION = os.getenv("REFERRAL_STORE_COLLECTION", "exchange_referrals")
+# Лимит Firestore на количество операций в одном batch
+BATCH_SIZE = 500
+
+# exchange -> {uid: packed}, уже записанное в стор этим процессом
+_published: dict[str, dict[str, int]] = {}
+
+
+def is_reader() -> bool:
+    return STORE_MODE == "reader"
+
+
+def is_writer() -> bool:
+    return STORE_MODE == "writer"
+
+
+def _doc_id(exchange: str, uid: str) -> str:
+    return f"{exchange}:{uid}"
+
+
+def _to_record(uid: str, data: dict) -> ReferralRecord:
+    return ReferralRecord(uid, bool(data.get("kyc")), data.get("registered_at"))
+
+
+class SharedStoreLookup:
+    """
+    Поиск реферала в общем сторе: одно точечное чтение документа
+    {exchange}:{uid}, сколько бы реплик ни работало. Интерфейс как у
+    SingleFlightLookup. Локальный индекс в режиме reader не синхронизируется,
+    поэтому в него не смотрим. Найденные записи не кэшируются, чтобы смена KYC
+    у writer сразу была видна; отрицательные ответы — в negative_cache.
+    """
+
+    def __init__(self, name: str, index: ReferralIndex):
+        self.name = name
+        self.reads = 0
+
+    def _get_many(self, uids: list[str]) -> dict[str, Optional[ReferralRecord]]:
+        db = get_db_client()
+        refs = [db.collection(COLLECTION).document(_doc_id(self.name, uid)) for uid in uids]
+        self.reads += len(refs)
+        found = {}
+        for snap in db.get_all(refs):
+            if snap.exists:
+                uid = snap.id.split(":", 1)[1]
+                found[uid] = _to_record(uid, snap.to_dict() or {})
+        return {uid: found.get(uid) for uid in uids}
+
+    async def lookup_many(self, uids) -> dict[str, Optional[ReferralRecord]]:
+        results: dict[str, Optional[ReferralRecord]] = {}
+        misses: list[str] = []
+        for uid in dict.fromkeys(str(u) for u in uids):
+            results[uid] = None
+            if not negative_cache.contains(self.name, uid):
+                misses.append(uid)
+        if not misses:
+            return results
+
+        fetched = await asyncio.to_thread(self._get_many, misses)
+        for uid, record in fetched.items():
+            results[uid] = record
+            if record is None:
+                negative_cache.add(self.name, uid)
+        return results
+
+    async def lookup(self, uid: str) -> Optional[ReferralRecord]:
+        return (await self.lookup_many([uid]))[str(uid)]
+
+
+def referral_lookup(name: str, index: ReferralIndex, sync_fn: SyncFn):
+    """Поиск рефералов биржи с учётом REFERRAL_STORE_MODE."""
+    if is_reader():
+        return SharedStoreLookup(name, index)
+    return SingleFlightLookup(name, index, sync_fn)
+
+
+def _load_published(exchange: str) -> dict[str, int]:
+    """Что уже лежит в сторе — чтобы после рестарта писать только разницу."""
+    db = get_db_client()
+    query = db.collection(COLLECTION).where("exchange", "==", exchange).select(["kyc", "registered_at"])
+    published = {}
+    for snap in query.stream():
+        data = snap.to_dict() or {}
+        uid = snap.id.split(":", 1)[1]
+        published[uid] = ((data.get("registered_at") or 0) << 1) | (1 if data.get("kyc") else 0)
+    return published
+
+
+def _publish(index: ReferralIndex) -> int:
+    exchange = index.exchange
+    if exchange not in _published:
+        _published[exchange] = _load_published(exchange)
+    published = _published[exchange]
+
+    changed = [(uid, packed) for uid, packed in index.export_rows() if published.get(uid) != packed]
+    if not changed:
+        return 0
+
+    db = get_db_client()
+    collection = db.collection(COLLECTION)
+    for start in range(0, len(changed), BATCH_SIZE):
+        batch = db.batch()
+        chunk = changed[start:start + BATCH_SIZE]
+        for uid, packed in chunk:
+            batch.set(collection.document(_doc_id(exchange, uid)), {
+                "exchange": exchange,
+                "uid": uid,
+                "kyc": bool(packed & 1),
+                "registered_at": (packed >> 1) or None,
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            })
+        batch.commit()
+        published.update(chunk)
+    return len(changed)
+
+
+async def publish_index(index: ReferralIndex) -> int:
+    """Записывает в общий стор новые и изменившиеся строки индекса. Возвращает их число."""
+    written = await asyncio.to_thread(_publish, index)
+    if written:
+        logger.info(f"[REFERRAL_STORE] 📤 {index.exchange}: записано в {COLLECTION} {written} строк")
+    return written
@@ -0,0 +1,109 @@
+# filename: services/shop_catalog.py
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from services.firebase_service import get_db_client
+from services import firestore_dal
+
+logger = logging.getLogger(__name__)
+
+# Без живого listener-а каталог перечитывается не чаще, чем раз в TTL
+CATALOG_TTL_SEC = float(os.getenv("SHOP_CATALOG_TTL_SEC", "300"))
+
+
+class ShopCatalog:
+    """
+    Коллекция shop целиком в памяти.
+
+    Свежесть держит on_snapshot на всю коллекцию (она маленькая): любое изменение
+    товара в консоли пересобирает каталог и его ETag. Если подписаться не удалось,
+    каталог перечитывается через AsyncClient по TTL.
+    """
+
+    def __init__(self):
+        self._items: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._watch = None
+        self.etag: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+
+    @property
+    def live(self) -> bool:
+        """Каталог поддерживается listener-ом и получил хотя бы один снимок."""
+        return self._watch is not None and self.loaded_at is not None
+
+    def _replace(self, items: dict[str, dict]) -> None:
+        payload = json.dumps(items, sort_keys=True, default=str, ensure_ascii=False)
+        with self._lock:
+            self._items = items
+            self.etag = '"' + hashlib.sha1(payload.encode()).hexdigest()[:20] + '"'
+            self.loaded_at = time.time()
+            self.reloads += 1
+        logger.info(f"[SHOP_CATALOG] 🔄 Каталог обновлён: {len(items)} товаров, ETag {self.etag}")
+
+    def _on_snapshot(self, snapshots, changes, read_time) -> None:
+        self._replace({snap.id: snap.to_dict() or {} for snap in snapshots})
+
+    def start(self) -> None:
+        """Подписка на коллекцию shop. Блокирующий вызов — запускать через asyncio.to_thread."""
+        if self._watch is not None:
+            return
+        try:
+            self._watch = get_db_client().collection(firestore_dal.SHOP).on_snapshot(self._on_snapshot)
+        except Exception as e:
+            logger.warning(f"[SHOP_CATALOG] ⚠️ Не удалось подписаться на shop, каталог будет обновляться по TTL: {e}")
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    async def ensure_fresh(self) -> None:
+        if self.live:
+            return
+        if self.loaded_at is not None and time.time() - self.loaded_at < CATALOG_TTL_SEC:
+            return
+        items = {
+            snap.id: snap.to_dict() or {}
+            async for snap in firestore_dal.db().collection(firestore_dal.SHOP).stream()
+        }
+        self._replace(items)
+
+    async def get(self, shop_id: str) -> Optional[dict]:
+        await self.ensure_fresh()
+        with self._lock:
+            item = self._items.get(shop_id)
+        return dict(item) if item is not None else None
+
+    async def listing(self) -> tuple[str, list[dict]]:
+        """(ETag, товары с полем id) для отдачи клиенту."""
+        await self.ensure_fresh()
+        with self._lock:
+            return self.etag, [{"id": shop_id, **data} for shop_id, data in sorted(self._items.items())]
+
+    def stats(self) -> dict:
+        return {
+            "items": len(self._items),
+            "live": self.live,
+            "etag": self.etag,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+        }
+
+
+shop_catalog = ShopCatalog()
+
+
+async def start_shop_catalog() -> None:
+    await asyncio.to_thread(shop_catalog.start)
+
+
+async def stop_shop_catalog() -> None:
+    await asyncio.to_thread(shop_catalog.stop)
@@ -0,0 +1,109 @@
+# filename: services/single_flight.py
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+from services.negative_cache import negative_cache
+from services.referral_index import ReferralIndex, ReferralRecord
+
+logger = logging.getLogger(__name__)
+
+# sync_fn(full=..., targets=...) — синхронизация индекса биржи
+SyncFn = Callable[..., Awaitable[int]]
+
+
+class SingleFlightLookup:
+    """
+    Склеивает одновременные поиски рефералов одной биржи в один проход по страницам.
+
+    Промахи по индексу не запускают каждый свой обход: все ждущие uid
+    регистрируются в общем наборе targets и проверяются по одному и тому же
+    потоку страниц одной in-flight синхронизации. Объём запросов к бирже
+    перестаёт зависеть от числа одновременных запросов пользователей.
+    """
+
+    def __init__(self, name: str, index: ReferralIndex, sync_fn: SyncFn):
+        self.name = name
+        self._index = index
+        self._sync_fn = sync_fn
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: Counter = Counter()
+        self.flights = 0  # сколько реальных проходов понадобилось
+        self.joined = 0   # сколько поисков присоединились к уже идущему проходу
+
+    async def _run(self) -> None:
+        self.flights += 1
+        # Передаём живой набор: uid, пришедшие во время прохода, тоже учитываются
+        await self._sync_fn(full=not self._index.is_warm, targets=self._waiters.keys())
+
+    async def _await_flight(self) -> bool:
+        """Ждёт текущий проход или запускает новый. True — присоединились к уже идущему."""
+        joined = self._task is not None and not self._task.done()
+        if joined:
+            self.joined += 1
+        else:
+            self._task = asyncio.create_task(self._run())
+        # shield: отмена одного HTTP-запроса не должна отменять общий проход
+        await asyncio.shield(self._task)
+        return joined
+
+    async def lookup(self, uid: str) -> Optional[ReferralRecord]:
+        uid = str(uid)
+        record = self._index.get(uid)
+        if record is not None:
+            return record
+        if negative_cache.contains(self.name, uid):
+            # Недавно уже искали и не нашли — отвечаем «нет» без обращения к бирже
+            return None
+
+        self._waiters[uid] += 1
+        try:
+            joined = await self._await_flight()
+            record = self._index.get(uid)
+            if record is None and joined:
+                # Проход начался до нашего запроса и мог прочитать свежие страницы
+                # раньше, чем uid там появился. Нужен ещё один — тоже общий — проход.
+                await self._await_flight()
+                record = self._index.get(uid)
+            if record is None:
+                negative_cache.add(self.name, uid)
+            return record
+        finally:
+            self._release([uid])
+
+    async def lookup_many(self, uids) -> dict[str, Optional[ReferralRecord]]:
+        """
+        Пакетный поиск: все промахи регистрируются разом и проверяются одним
+        (максимум двумя) проходом по страницам — цена как у одного uid.
+        """
+        results: dict[str, Optional[ReferralRecord]] = {}
+        misses: list[str] = []
+        for uid in dict.fromkeys(str(u) for u in uids):
+            record = self._index.get(uid)
+            results[uid] = record
+            if record is None and not negative_cache.contains(self.name, uid):
+                misses.append(uid)
+        if not misses:
+            return results
+
+        for uid in misses:
+            self._waiters[uid] += 1
+        try:
+            joined = await self._await_flight()
+            pending = [uid for uid in misses if uid not in self._index]
+            if pending and joined:
+                await self._await_flight()
+            for uid in misses:
+                results[uid] = self._index.get(uid)
+                if results[uid] is None:
+                    negative_cache.add(self.name, uid)
+            return results
+        finally:
+            self._release(misses)
+
+    def _release(self, uids) -> None:
+        for uid in uids:
+            self._waiters[uid] -= 1
+            if self._waiters[uid] <= 0:
+                del self._waiters[uid]
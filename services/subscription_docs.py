@@ -0,0 +1,206 @@
+# filename: services/subscription_docs.py
+import os
+import logging
+from datetime import datetime
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS = "subscriptions"
+
+# Пока миграция не прогнана, подписка может лежать под auto-id — тогда нужен запасной where-запрос.
+# После migrate_subscriptions.py выставить SUBSCRIPTION_LEGACY_LOOKUP=0: поиск станет одним point get.
+LEGACY_LOOKUP = os.getenv("SUBSCRIPTION_LEGACY_LOOKUP", "1") == "1"
+
+# Лимит Firestore на количество операций в одном batch
+BATCH_SIZE = 500
+# Сколько раз переносить подписку, которую параллельно меняет приложение
+MIGRATE_ATTEMPTS = 3
+# Невыполненное условие записи: документ изменили, удалили или создали после скана
+MIGRATE_CONFLICTS = (FailedPrecondition, AlreadyExists, NotFound)
+
+
+def subscription_doc_id(subscription_type: str) -> str:
+    """Детерминированный id документа подписки: telegram_users/{id}/subscriptions/{subscription_type}."""
+    return str(subscription_type).replace("/", "_")
+
+
+def subscription_ref(user_ref, subscription_type: str):
+    return user_ref.collection(SUBSCRIPTIONS).document(subscription_doc_id(subscription_type))
+
+
+def find_subscription_sync(user_ref, subscription_type: str):
+    """
+    Синхронный поиск подписки для скриптов: (ссылка, данные) или (None, None).
+    Сначала point get по детерминированному id, затем — пока включён LEGACY_LOOKUP — where по полю.
+    """
+    ref = subscription_ref(user_ref, subscription_type)
+    snap = ref.get()
+    if snap.exists:
+        return ref, snap.to_dict() or {}
+    if LEGACY_LOOKUP:
+        query = user_ref.collection(SUBSCRIPTIONS).where("subscription_type", "==", subscription_type).limit(1)
+        for legacy in query.stream():
+            return legacy.reference, legacy.to_dict() or {}
+    return None, None
+
+
+def _end_date_key(data: dict):
+    end_date = data.get("end_date")
+    return (1, end_date.timestamp()) if isinstance(end_date, datetime) else (0, 0)
+
+
+def merge_subscription_docs(docs: list[dict]) -> dict:
+    """
+    Сводит несколько документов одного типа в один.
+    Основа — документ с самой поздней end_date (пользователь не теряет оплаченные дни),
+    недостающие поля добираются из остальных.
+    """
+    ordered = sorted(docs, key=_end_date_key, reverse=True)
+    merged = dict(ordered[0])
+    for data in ordered[1:]:
+        for key, value in data.items():
+            merged.setdefault(key, value)
+    return merged
+
+
+def _group_ops(db, user_path: str, subscription_type: str, snaps: list) -> list[tuple]:
+    """
+    Записи переноса одной подписки: [(op, ref, data, option)], пустой список — переносить нечего.
+    Каждая запись — с условием на снимок, из которого собран итоговый документ: если
+    подписку продлили после чтения, batch провалится, а не затрёт продление.
+    """
+    target_id = subscription_doc_id(subscription_type)
+    if not snaps or (len(snaps) == 1 and snaps[0].id == target_id):
+        return []
+    target_ref = db.document(user_path).collection(SUBSCRIPTIONS).document(target_id)
+    merged = merge_subscription_docs([snap.to_dict() or {} for snap in snaps])
+    existing = next((snap for snap in snaps if snap.id == target_id), None)
+    if existing is not None:
+        # update, а не set: только update и delete принимают last_update_time;
+        # merged содержит все поля целевого документа, так что итог тот же
+        ops = [("update", target_ref, merged, db.write_option(last_update_time=existing.update_time))]
+    else:
+        # create провалится, если документ под детерминированным id уже создала покупка
+        ops = [("create", target_ref, merged, None)]
+    ops.extend(
+        ("delete", snap.reference, None, db.write_option(last_update_time=snap.update_time))
+        for snap in snaps if snap.id != target_id
+    )
+    return ops
+
+
+def _stage_ops(batch, ops: list[tuple]) -> None:
+    for op, ref, data, option in ops:
+        if op == "create":
+            batch.create(ref, data)
+        elif op == "update":
+            batch.update(ref, data, option=option)
+        else:
+            batch.delete(ref, option=option)
+
+
+def _reread_group(db, user_path: str, subscription_type: str) -> list:
+    """Свежие снимки документов одного типа у пользователя — после конфликта."""
+    query = db.document(user_path).collection(SUBSCRIPTIONS).where("subscription_type", "==", subscription_type)
+    return list(query.stream())
+
+
+def _migrate_group(db, user_path: str, subscription_type: str, snaps: list) -> bool:
+    """Перенос одной подписки своим batch; на конфликте перечитывает документы и повторяет."""
+    for attempt in range(1, MIGRATE_ATTEMPTS + 1):
+        ops = _group_ops(db, user_path, subscription_type, snaps)
+        if not ops:
+            return True
+        batch = db.batch()
+        _stage_ops(batch, ops)
+        try:
+            batch.commit()
+            return True
+        except MIGRATE_CONFLICTS as e:
+            logger.warning(
+                f"[SUBSCRIPTIONS] ⚠️ {user_path}/{subscription_type}: подписка изменилась во время переноса "
+                f"(попытка {attempt}/{MIGRATE_ATTEMPTS}): {e}"
+            )
+            snaps = _reread_group(db, user_path, subscription_type)
+    logger.error(f"[SUBSCRIPTIONS] ❌ {user_path}/{subscription_type}: не перенесена — запусти миграцию повторно")
+    return False
+
+
+def migrate_subscriptions(db, dry_run: bool = False) -> dict:
+    """
+    Переносит подписки всех пользователей на детерминированные id.
+    Один проход collection group subscriptions; документы одного пользователя и типа
+    сливаются в subscriptions/{subscription_type}, старые auto-id документы удаляются.
+    Запись идёт с условием на update_time прочитанных документов, поэтому прогон безопасен
+    при работающем приложении: изменённая после скана подписка перечитывается и переносится заново.
+    """
+    groups: dict[tuple[str, str], list] = {}
+    scanned = untyped = 0
+    for snap in db.collection_group(SUBSCRIPTIONS).stream():
+        scanned += 1
+        data = snap.to_dict() or {}
+        subscription_type = data.get("subscription_type")
+        user_ref = snap.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "telegram_users":
+            continue
+        if not subscription_type:
+            untyped += 1
+            continue
+        groups.setdefault((user_ref.path, subscription_type), []).append(snap)
+
+    group_ops: list[tuple[tuple[str, str], list, list[tuple]]] = []
+    moved = duplicates = 0
+    for (user_path, subscription_type), snaps in groups.items():
+        ops = _group_ops(db, user_path, subscription_type, snaps)
+        if not ops:
+            continue
+        if len(snaps) > 1:
+            duplicates += len(snaps) - 1
+            logger.info(
+                f"[SUBSCRIPTIONS] 🔀 {user_path}: {len(snaps)} документов {subscription_type} — "
+                f"оставляю самую позднюю end_date"
+            )
+        group_ops.append(((user_path, subscription_type), snaps, ops))
+        moved += 1
+
+    failed = 0
+    if not dry_run:
+        # Записи одной подписки всегда уходят в одном batch — дубль не может потеряться.
+        # Batch атомарен: на конфликте его подписки переносятся по одной, с перечитыванием
+        chunk, chunk_ops = [], 0
+
+        def flush() -> None:
+            nonlocal failed
+            batch = db.batch()
+            for _, _, ops in chunk:
+                _stage_ops(batch, ops)
+            try:
+                batch.commit()
+            except MIGRATE_CONFLICTS:
+                for (user_path, subscription_type), snaps, _ in chunk:
+                    failed += not _migrate_group(db, user_path, subscription_type, snaps)
+
+        for item in group_ops:
+            if chunk_ops and chunk_ops + len(item[2]) > BATCH_SIZE:
+                flush()
+                chunk, chunk_ops = [], 0
+            chunk.append(item)
+            chunk_ops += len(item[2])
+        if chunk:
+            flush()
+
+    logger.info(
+        f"[SUBSCRIPTIONS] {'(dry-run) ' if dry_run else ''}Просмотрено документов: {scanned}, "
+        f"без subscription_type: {untyped}, перенесено подписок: {moved - failed}, слито дублей: {duplicates}"
+        + (f", не перенесено из-за конфликтов: {failed}" if failed else "")
+    )
+    return {
+        "scanned": scanned,
+        "untyped": untyped,
+        "migrated": moved - failed,
+        "duplicates_merged": duplicates,
+        "failed": failed,
+        "dry_run": dry_run,
+    }
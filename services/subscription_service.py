@@ -2,35 +2,52 @@
 import os
 import logging
 from datetime import datetime, timedelta, timezone
-from services.firebase_service import get_db_client
-from firebase_admin import firestore
-import requests
+from google.cloud.firestore import async_transactional
+import httpx
+from services import firestore_dal
+from services.shop_catalog import shop_catalog
 
 # Внешние API базовые URL из окружения
 BSSBIN_API_URL = os.getenv("BSSBIN_API_URL")      # для AIHermesPRO
 BSSBYB_API_URL = os.getenv("BSSBYB_API_URL")      # для BybitAIHermesPRO
 
+# Для покупки из документа пользователя нужен только баланс
+BALANCE_FIELDS = ["balance_usdt", "checkin_date"]
 
-def purchase_subscription(telegram_id: str, shop_id: str) -> dict:
+
+async def purchase_subscription(telegram_id: str, shop_id: str) -> dict:
     """
     Основная функция для обработки покупки подписки.
     Выполняет все операции в рамках одной атомарной транзакции.
     После успешной записи в БД вызывает внешний API партнёра.
     """
-    db = get_db_client()
-    if not db:
-        logging.error("Не удалось получить клиент БД для покупки подписки.")
-        return {"status": "error", "message": "Database connection failed."}
-
     try:
-        transaction = db.transaction()
-        tx_result = _update_in_transaction(transaction, db, telegram_id, shop_id)
+        # Быстрый отказ по кэшу каталога и пользователя — без открытия транзакции
+        shop_data = await shop_catalog.get(shop_id)
+        if shop_data is None:
+            return {"status": "error", "message": "Пользователь или товар не найден."}
+        user_data = await firestore_dal.get_user(telegram_id, fields=BALANCE_FIELDS)
+        if user_data is not None and shop_data.get("price", 0.0) > _dynamic_balance(user_data):
+            # Баланс в кэше мог устареть (пополнение ботом) — отказываем только по свежему документу
+            user_data = await firestore_dal.get_user(telegram_id, fields=BALANCE_FIELDS, cached=False)
+        if user_data is None:
+            return {"status": "error", "message": "Пользователь или товар не найден."}
+        shortage = shop_data.get("price", 0.0) - _dynamic_balance(user_data)
+        if shortage > 0:
+            return {"status": "error", "message": f"Недостаточно средств. Не хватает {shortage:.2f} USDT."}
+
+        # Пока каталог держит listener, цену и срок берём из него; иначе перечитываем товар в транзакции
+        cached_shop = shop_data if shop_catalog.live else None
+        client = firestore_dal.db()
+        transaction = firestore_dal.transaction(client)
+        tx_result = await _update_in_transaction(transaction, client, telegram_id, shop_id, cached_shop)
 
         # Если транзакция прошла успешно — вызываем внешний API по типу подписки
         if tx_result.get("status") == "success":
+            firestore_dal.forget_user(telegram_id)  # баланс изменился
             subscription_type = tx_result.get("subscription_type")
             end_date = tx_result.get("end_date")  # datetime (UTC)
-            api_call = _notify_partner_api(subscription_type, telegram_id, end_date)
+            api_call = await _notify_partner_api(subscription_type, telegram_id, end_date)
             tx_result["partner_api"] = api_call
 
         return tx_result
@@ -40,43 +57,50 @@ def purchase_subscription(telegram_id: str, shop_id: str) -> dict:
         return {"status": "error", "message": str(e)}
 
 
-@firestore.transactional
-def _update_in_transaction(transaction, db, telegram_id: str, shop_id: str) -> dict:
-    """Внутренняя функция, выполняющая все действия в рамках транзакции Firestore."""
+def _dynamic_balance(user_data: dict) -> float:
+    """Баланс с учётом ещё не истёкшего check-in (он начисляется авансом и тает по секундам)."""
+    balance_usdt = user_data.get("balance_usdt", 0.0)
+    checkin_date = user_data.get("checkin_date")
+    if checkin_date and datetime.now(timezone.utc) < checkin_date:
+        seconds_left = (checkin_date - datetime.now(timezone.utc)).total_seconds()
+        if seconds_left > 0:
+            return balance_usdt - (seconds_left * 0.000024)
+    return balance_usdt
+
+
+@async_transactional
+async def _update_in_transaction(transaction, client, telegram_id: str, shop_id: str, shop_data: dict | None = None) -> dict:
+    """
+    Внутренняя функция, выполняющая все действия в рамках транзакции Firestore.
+    client — клиент, от которого создана транзакция: все ссылки строятся от него.
+    shop_data — товар из живого каталога; без него товар перечитывается в транзакции.
+    Баланс и подписка читаются в транзакции всегда: от них зависит корректность списания.
+    """
 
     # --- ШАГ 1: СНАЧАЛА ВСЕ ОПЕРАЦИИ ЧТЕНИЯ ---
 
-    user_ref = db.collection("telegram_users").document(telegram_id)
-    shop_ref = db.collection("shop").document(shop_id)
+    user_ref = firestore_dal.user_ref(telegram_id, client)
+    user_snapshot = await user_ref.get(field_paths=BALANCE_FIELDS, transaction=transaction)
 
-    user_snapshot = user_ref.get(transaction=transaction)
-    shop_snapshot = shop_ref.get(transaction=transaction)
+    if shop_data is None:
+        shop_snapshot = await firestore_dal.shop_ref(shop_id, client).get(transaction=transaction)
+        shop_data = shop_snapshot.to_dict() if shop_snapshot.exists else None
 
-    if not user_snapshot.exists or not shop_snapshot.exists:
+    if not user_snapshot.exists or shop_data is None:
         return {"status": "error", "message": "Пользователь или товар не найден."}
 
     user_data = user_snapshot.to_dict()
-    shop_data = shop_snapshot.to_dict()
 
-    # Также выполняем чтение подписки сразу
+    # Также выполняем чтение подписки сразу — point get по детерминированному id
     subscription_type = shop_data.get("stock")
-    subscriptions_query = (
-        user_ref.collection("subscriptions")
-        .where("subscription_type", "==", subscription_type)
-        .limit(1)
+    target_sub = await firestore_dal.find_subscription(
+        telegram_id, subscription_type, transaction=transaction, client=client
     )
-    sub_docs = list(subscriptions_query.stream(transaction=transaction))
 
     # --- ШАГ 2: ЗАТЕМ ВСЯ ЛОГИКА И ПРОВЕРКИ ---
 
     balance_usdt = user_data.get("balance_usdt", 0.0)
-    checkin_date = user_data.get("checkin_date")
-    dynamic_balance = balance_usdt
-
-    if checkin_date and datetime.now(timezone.utc) < checkin_date:
-        seconds_left = (checkin_date - datetime.now(timezone.utc)).total_seconds()
-        if seconds_left > 0:
-            dynamic_balance = balance_usdt - (seconds_left * 0.000024)
+    dynamic_balance = _dynamic_balance(user_data)
 
     price = shop_data.get("price", 0.0)
     if dynamic_balance < price:
@@ -96,9 +120,9 @@ def _update_in_transaction(transaction, db, telegram_id: str, shop_id: str) -> d
     # итоговая дата окончания подписки, которую вернём наружу
     new_end_date: datetime
 
-    if sub_docs:
-        sub_doc_ref = sub_docs[0].reference
-        sub_end_date = sub_docs[0].to_dict().get("end_date", now)
+    if target_sub:
+        sub_doc_ref, sub_data = target_sub
+        sub_end_date = sub_data.get("end_date", now)
         start_date = sub_end_date if isinstance(sub_end_date, datetime) and sub_end_date > now else now
         new_end_date = start_date + timedelta(days=duration_days)
         # ✅ ДОБАВЛЕНО: обновляем end_date + выставляем флаги tv*
@@ -109,7 +133,7 @@ def _update_in_transaction(transaction, db, telegram_id: str, shop_id: str) -> d
         })
     else:
         new_end_date = now + timedelta(days=duration_days)
-        new_sub_ref = user_ref.collection("subscriptions").document()
+        new_sub_ref = firestore_dal.subscription_ref(telegram_id, subscription_type, client)
         # ✅ ДОБАВЛЕНО: создаём подписку с полями tv*
         transaction.set(new_sub_ref, {
             "subscription_type": subscription_type,
@@ -138,7 +162,7 @@ def _update_in_transaction(transaction, db, telegram_id: str, shop_id: str) -> d
     }
 
 
-def _notify_partner_api(subscription_type: str, telegram_id: str, end_date_utc: datetime) -> dict:
+async def _notify_partner_api(subscription_type: str, telegram_id: str, end_date_utc: datetime) -> dict:
     """
     Вызывает внешний API в зависимости от типа подписки.
     Форматирует end_date в ISO 8601 со смещением +03:00 (как в тесте).
@@ -168,7 +192,8 @@ def _notify_partner_api(subscription_type: str, telegram_id: str, end_date_utc:
         }
 
         logging.info(f"[PARTNER_API] POST {url} payload={payload}")
-        resp = requests.post(url, json=payload, timeout=10)
+        async with httpx.AsyncClient(timeout=10) as client:
+            resp = await client.post(url, json=payload)
 
         ok = 200 <= resp.status_code < 300
         if ok:
@@ -0,0 +1,175 @@
+# filename: services/user_aliases.py
+import os
+import logging
+from typing import Optional
+
+from google.cloud.firestore_v1.base_query import FieldFilter, Or
+
+from services import firestore_dal
+
+logger = logging.getLogger(__name__)
+
+# telegram_user_aliases/{telegram_id} = {"doc_id": ...} — только для пользователей,
+# чей документ лежит не под их Telegram ID (старые записи с id/telegram_id в полях)
+COLLECTION = "telegram_user_aliases"
+ID_FIELDS = ("id", "telegram_id")
+
+# Пока normalize_user_ids.py не прогнан, незнакомый ID ищется ещё одним запросом по полям id/telegram_id.
+# После миграции выставить USER_ALIAS_FALLBACK=0: поиск пользователя — всегда один point get.
+FALLBACK_QUERIES = os.getenv("USER_ALIAS_FALLBACK", "1") == "1"
+
+# Лимит Firestore на количество операций в одном batch
+BATCH_SIZE = 500
+
+_aliases: dict[str, str] = {}
+
+
+def _id_fields_filter(telegram_id: str):
+    """
+    id == telegram_id или telegram_id == telegram_id — одним запросом. В старых документах поля
+    бывают и строкой, и числом; тип в документах не переписываем (их читает бот), ищем оба.
+    """
+    values = [telegram_id]
+    if telegram_id.lstrip("-").isdigit():
+        values.append(int(telegram_id))
+    return Or([FieldFilter(field, "in", values) for field in ID_FIELDS])
+
+
+async def load_user_aliases() -> int:
+    """Поднимает весь индекс алиасов в память. Вызывается на startup приложения."""
+    query = firestore_dal.db().collection(COLLECTION).select(["doc_id"])
+    try:
+        loaded = {snap.id: (snap.to_dict() or {}).get("doc_id") async for snap in query.stream()}
+    except Exception as e:
+        logger.exception(f"[USER_ALIASES] ❌ Не удалось загрузить индекс алиасов: {e}")
+        return 0
+    _aliases.clear()
+    _aliases.update({telegram_id: doc_id for telegram_id, doc_id in loaded.items() if doc_id})
+    logger.info(f"[USER_ALIASES] 📇 Загружено алиасов Telegram ID: {len(_aliases)}")
+    return len(_aliases)
+
+
+async def remember_alias(telegram_id, doc_id: str) -> None:
+    telegram_id = str(telegram_id)
+    if telegram_id == doc_id or _aliases.get(telegram_id) == doc_id:
+        return
+    _aliases[telegram_id] = doc_id
+    await firestore_dal.db().collection(COLLECTION).document(telegram_id).set({"doc_id": doc_id})
+    logger.info(f"[USER_ALIASES] ➕ {telegram_id} -> telegram_users/{doc_id}")
+
+
+async def resolve_user(telegram_id, fields=None) -> tuple[Optional[str], Optional[dict]]:
+    """
+    (doc_id, данные) документа пользователя или (None, None). fields — маска полей, как в get_user.
+    Известный алиас или собственный id — один point get (через user_cache);
+    для незнакомых ID, пока включён FALLBACK_QUERIES, — ещё один запрос по полям id/telegram_id.
+    Найденный так документ сразу записывается в индекс алиасов.
+    """
+    telegram_id = str(telegram_id)
+    doc_id = _aliases.get(telegram_id, telegram_id)
+    data = await firestore_dal.get_user(doc_id, fields)
+    if data is not None:
+        return doc_id, data
+    if not FALLBACK_QUERIES:
+        return None, None
+
+    found = await firestore_dal.find_users(_id_fields_filter(telegram_id), fields=fields)
+    if not found:
+        return None, None
+    doc_id, data = found[0]
+    await remember_alias(telegram_id, doc_id)
+    return doc_id, data
+
+
+def resolve_user_ref_sync(db, telegram_id):
+    """
+    Синхронный вариант для скриптов: (user_ref, user_snap) или (None, None).
+    doc-id, затем документ алиаса, затем — пока включён FALLBACK_QUERIES — поля id/telegram_id.
+    """
+    telegram_id = str(telegram_id)
+    users_ref = db.collection(firestore_dal.USERS)
+    user_ref = users_ref.document(telegram_id)
+    snap = user_ref.get()
+    if snap.exists:
+        return user_ref, snap
+
+    alias = db.collection(COLLECTION).document(telegram_id).get()
+    doc_id = (alias.to_dict() or {}).get("doc_id") if alias.exists else None
+    if doc_id:
+        user_ref = users_ref.document(doc_id)
+        snap = user_ref.get()
+        if snap.exists:
+            return user_ref, snap
+
+    if FALLBACK_QUERIES:
+        for snap in users_ref.where(filter=_id_fields_filter(telegram_id)).limit(1).stream():
+            return snap.reference, snap
+    return None, None
+
+
+def normalize_user_ids(db, dry_run: bool = False) -> dict:
+    """
+    Один проход по telegram_users (только поля id/telegram_id): каждому Telegram ID,
+    который не совпадает с id своего документа, пишет алиас. Сами документы не меняются —
+    ни перенос (у них есть подколлекции), ни тип полей id/telegram_id (их читает бот).
+    Если Telegram ID одновременно является id другого документа — побеждает документ с этим id.
+    """
+    doc_ids: set[str] = set()
+    claims: dict[str, str] = {}
+    scanned = conflicts = 0
+
+    for snap in db.collection(firestore_dal.USERS).select(list(ID_FIELDS)).stream():
+        scanned += 1
+        doc_ids.add(snap.id)
+        data = snap.to_dict() or {}
+        for field in ID_FIELDS:
+            value = data.get(field)
+            if value in (None, ""):
+                continue
+            telegram_id = str(value)
+            if telegram_id == snap.id:
+                continue
+            if claims.setdefault(telegram_id, snap.id) != snap.id:
+                conflicts += 1
+                logger.warning(
+                    f"[USER_ALIASES] ⚠️ Telegram ID {telegram_id} указан в двух документах: "
+                    f"{claims[telegram_id]} и {snap.id} — оставляю первый"
+                )
+
+    aliases = {telegram_id: doc_id for telegram_id, doc_id in claims.items() if telegram_id not in doc_ids}
+    shadowed = len(claims) - len(aliases)
+    existing = {
+        snap.id: (snap.to_dict() or {}).get("doc_id")
+        for snap in db.collection(COLLECTION).select(["doc_id"]).stream()
+    }
+    alias_writes = [(telegram_id, doc_id) for telegram_id, doc_id in aliases.items() if existing.get(telegram_id) != doc_id]
+    stale = [telegram_id for telegram_id in existing if telegram_id not in aliases]
+
+    ops = (
+        [("alias", telegram_id, doc_id) for telegram_id, doc_id in alias_writes]
+        + [("stale", telegram_id, None) for telegram_id in stale]
+    )
+    if not dry_run:
+        for start in range(0, len(ops), BATCH_SIZE):
+            batch = db.batch()
+            for op, key, value in ops[start:start + BATCH_SIZE]:
+                if op == "alias":
+                    batch.set(db.collection(COLLECTION).document(key), {"doc_id": value})
+                else:
+                    batch.delete(db.collection(COLLECTION).document(key))
+            batch.commit()
+
+    logger.info(
+        f"[USER_ALIASES] {'(dry-run) ' if dry_run else ''}Просмотрено пользователей: {scanned}, "
+        f"алиасов: {len(aliases)} (записано {len(alias_writes)}, удалено устаревших {len(stale)}), "
+        f"перекрыто doc-id: {shadowed}, конфликтов: {conflicts}"
+    )
+    return {
+        "users_scanned": scanned,
+        "aliases": len(aliases),
+        "aliases_written": len(alias_writes),
+        "aliases_removed": len(stale),
+        "shadowed_by_doc_id": shadowed,
+        "conflicts": conflicts,
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,203 @@
+# filename: services/user_cache.py
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from services.firebase_service import get_db_client
+
+logger = logging.getLogger(__name__)
+
+USERS = "telegram_users"
+
+
+class _Entry:
+    __slots__ = ("data", "fields", "expires_at", "watch", "watched")
+
+    def __init__(self, data: dict, fields: Optional[frozenset], expires_at: float):
+        self.data = data
+        self.fields = fields  # None — документ целиком, иначе набор полей проекции
+        self.expires_at = expires_at
+        self.watch = None
+        self.watched = False  # занимает слот подписки (подписка открыта или открывается)
+
+
+class UserDocCache:
+    """
+    Ограниченный LRU/TTL-кэш документов telegram_users/{id}.
+
+    Запись пропадает по TTL, при вытеснении и при наших собственных записях
+    (firestore_dal.update_user/set_user, forget_user после batch/транзакций).
+    Если включён watch (по умолчанию нет), на первые watch_max закэшированных документов
+    вешается on_snapshot: изменения, сделанные ботом или консолью, сразу попадают в кэш,
+    удаление документа — выбрасывает запись. Каждая подписка — отдельный Listen-стрим
+    со своим потоком и полное чтение документа на каждое изменение, поэтому их число
+    ограничено; остальные записи живут на TTL и инвалидации при собственных записях.
+    Подписка и отписка — блокирующие вызовы gRPC, они выполняются в отдельном потоке.
+
+    Запись может хранить только часть полей (результат select-чтения): она отвечает
+    на запросы, чьи поля в неё входят, а следующий промах дочитывает объединение полей.
+    """
+
+    def __init__(self, maxsize: int, ttl_sec: float, watch: bool, watch_max: int):
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self.watch = watch
+        self.watch_max = watch_max
+        self._watch_slots = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._watch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-cache-watch")
+        self.hits = 0
+        self.misses = 0
+        self.partial_misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.listener_updates = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, telegram_id, fields=None) -> Optional[dict]:
+        """
+        Копия закэшированного документа (или только полей fields) либо None (промах).
+        Промах и тогда, когда в записи есть не все запрошенные поля.
+        """
+        key = str(telegram_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if entry.fields is not None and (fields is None or not entry.fields.issuperset(fields)):
+                self.partial_misses += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if fields is None:
+                return dict(entry.data)
+            return {field: entry.data[field] for field in fields if field in entry.data}
+
+    def cached_fields(self, telegram_id) -> frozenset:
+        """Поля частичной записи — их стоит дочитать вместе с новыми, чтобы запись росла, а не сужалась."""
+        with self._lock:
+            entry = self._entries.get(str(telegram_id))
+            return entry.fields if entry is not None and entry.fields is not None else frozenset()
+
+    def put(self, telegram_id, data: dict, fields=None) -> None:
+        """fields — набор полей, если data получена select-чтением; None — документ целиком."""
+        key = str(telegram_id)
+        fields = frozenset(fields) if fields is not None else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.data = dict(data)
+                entry.fields = fields
+                entry.expires_at = time.monotonic() + self.ttl_sec
+                self._entries.move_to_end(key)
+                return
+            entry = _Entry(dict(data), fields, time.monotonic() + self.ttl_sec)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            attach = self.watch and self._watch_slots < self.watch_max
+            if attach:
+                entry.watched = True
+                self._watch_slots += 1
+        if attach:
+            self._watch_executor.submit(self._attach, key, entry)
+
+    def invalidate(self, telegram_id) -> None:
+        with self._lock:
+            if self._drop(str(telegram_id)):
+                self.invalidations += 1
+
+    def _drop(self, key: str) -> bool:
+        """Удаляет запись и отписывается от её документа. Вызывается под _lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._release_slot(entry)
+        if entry.watch is not None:
+            self._watch_executor.submit(entry.watch.unsubscribe)
+            entry.watch = None
+        return True
+
+    def _release_slot(self, entry: _Entry) -> None:
+        """Вызывается под _lock."""
+        if entry.watched:
+            entry.watched = False
+            self._watch_slots -= 1
+
+    def _attach(self, key: str, entry: _Entry) -> None:
+        def on_change(snapshots, changes, read_time):
+            with self._lock:
+                if self._entries.get(key) is not entry:
+                    return
+                snap = snapshots[0] if snapshots else None
+                if snap is None or not snap.exists:
+                    self._drop(key)
+                    self.invalidations += 1
+                    return
+                entry.data = snap.to_dict() or {}
+                entry.fields = None
+                entry.expires_at = time.monotonic() + self.ttl_sec
+                self.listener_updates += 1
+
+        try:
+            watch = get_db_client().collection(USERS).document(key).on_snapshot(on_change)
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] ⚠️ Не удалось подписаться на {key}: {e}")
+            with self._lock:
+                self._release_slot(entry)
+            return
+        with self._lock:
+            if self._entries.get(key) is entry:
+                entry.watch = watch
+                return
+        # Запись успели вытеснить, пока открывалась подписка
+        watch.unsubscribe()
+
+    def close(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+        self._watch_executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_sec": self.ttl_sec,
+            "watch": self.watch,
+            "watched": self._watch_slots,
+            "watch_max": self.watch_max,
+            "hits": self.hits,
+            "misses": self.misses,
+            "partial_misses": self.partial_misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "listener_updates": self.listener_updates,
+        }
+
+
+user_cache = UserDocCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX", "1000")),
+    ttl_sec=float(os.getenv("USER_CACHE_TTL_SEC", "60")),
+    watch=os.getenv("USER_CACHE_WATCH", "0") == "1",
+    watch_max=int(os.getenv("USER_CACHE_WATCH_MAX", "50")),
+)
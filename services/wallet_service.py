@@ -1,29 +1,24 @@
 # services/wallet_service.py
+import asyncio
 import logging
 from web3 import Account
-from config import get_db_client
+from services import firestore_dal
 # --- 1. ИСПРАВЛЯЕМ ИМПОРТ ---
 # Импортируем правильную функцию для сохранения ключа
 from services.security_service import store_private_key 
 # Импортируем функцию для сигнала в Remote Config
 from services.remote_config_service import signal_update as remote_config_signal
 
-def create_new_wallet_for_user(user_id: str) -> dict | None:
+async def create_new_wallet_for_user(user_id: str) -> dict | None:
     """
     Создает новый кошелек, если он еще не существует.
+    Secret Manager и Remote Config — блокирующие клиенты, они вызываются в отдельном потоке.
     """
-    db = get_db_client()
-    if not db:
-        logging.error("[WALLET_SERVICE] Не удалось получить клиент БД.")
-        return None
-
     try:
         logging.info(f"[WALLET_SERVICE] Запрос на создание/получение кошелька для user_id: {user_id}")
-        user_doc_ref = db.collection("telegram_users").document(user_id)
-        
-        user_doc = user_doc_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
+        # Без кэша: по устаревшему «адреса нет» создался бы второй кошелёк поверх первого
+        user_data = await firestore_dal.get_user(user_id, fields=("bnb_wallet_address",), cached=False)
+        if user_data is not None:
             existing_address = user_data.get("bnb_wallet_address")
             if existing_address:
                 logging.info(f"✅ [WALLET_SERVICE] Кошелек для user_id: {user_id} уже существует. Создание пропускается.")
@@ -39,22 +34,23 @@ def create_new_wallet_for_user(user_id: str) -> dict | None:
         private_key = account.key.hex()
         
         # --- 2. ИСПОЛЬЗУЕМ ПРАВИЛЬНОЕ НАЗВАНИЕ ФУНКЦИИ ---
-        secret_name = store_private_key(user_id, private_key)
+        secret_name = await asyncio.to_thread(store_private_key, user_id, private_key)
         
         if not secret_name:
             logging.error(f"[WALLET_SERVICE] security_service не смог сохранить ключ для {user_id}.")
             return None
 
-        batch = db.batch()
-        batch.update(user_doc_ref, {"bnb_wallet_address": address})
-        secure_wallet_doc_ref = db.collection("secure_wallets").document(user_id)
-        batch.set(secure_wallet_doc_ref, {"address": address, "secret_name": secret_name})
-        batch.commit()
+        client = firestore_dal.db()
+        batch = firestore_dal.batch(client)
+        batch.update(firestore_dal.user_ref(user_id, client), {"bnb_wallet_address": address})
+        batch.set(firestore_dal.secure_wallet_ref(user_id, client), {"address": address, "secret_name": secret_name})
+        await batch.commit()
+        firestore_dal.forget_user(user_id)
         
         logging.info(f"✅ [WALLET_SERVICE] Новый кошелек для user_id: {user_id} создан.")
         
         # Вызываем сигнал в Remote Config
-        remote_config_signal()
+        await asyncio.to_thread(remote_config_signal)
         
         return {"address": address, "status": "success"}
 